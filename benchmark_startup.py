@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+起動時間のベンチマーク
+
+`python -m attendance_app` が待機画面を表示して操作可能になるまでの時間を、
+ウィンドウを表示しない（ヘッドレス）Kivyで計測する。
+
+計測項目:
+- import時間: `python -X importtime` の出力を集計（モジュールごとの自己時間・累積時間）
+- 初回描画まで: プロセス起動から最初のフレームが描画されるまで
+- 準備完了まで: プロセス起動から起動時ウォームアップが終わるまで
+
+計測用の子プロセスでは印刷キューの再開を止め、ウォームアップの各段階を何もしない処理に
+差し替える。Google Sheets・Driveへの通信や、キューに残ったラベルの印刷は行わないので、
+準備完了までの時間には通信の時間は含まれない。
+
+結果は output/benchmarks/ にJSONで保存し、予算（ミリ秒）を超えた項目があれば終了コード1で終わる。
+予算は DEFAULT_BUDGETS_MS の値を使い、コマンドライン引数で上書きできる（0 を指定するとその項目は確認しない）。
+
+使い方:
+    python benchmark_startup.py --runs 3
+    python benchmark_startup.py --budget-import-ms 1500 --budget-ready-ms 0
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent
+SRC_DIR = ROOT_DIR / "src"
+OUTPUT_DIR = ROOT_DIR / "output" / "benchmarks"
+
+RESULT_MARKER = "BENCHMARK_RESULT:"
+
+# 起動時間の予算（ミリ秒）。超えたら終了コード1で終わる
+DEFAULT_BUDGETS_MS = {
+    "import": 2500.0,
+    "first_frame": 5000.0,
+    "ready": 6000.0,
+}
+
+
+def headless_env() -> dict:
+    """ウィンドウを表示せずにKivyを起動するための環境変数"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC_DIR), env.get("PYTHONPATH")]))
+    env["PYTHONIOENCODING"] = "utf-8"
+    env["KIVY_NO_ARGS"] = "1"
+    env["KIVY_NO_CONSOLELOG"] = "1"
+    env["KIVY_NO_FILELOG"] = "1"
+    env["KIVY_WINDOW"] = "sdl2"
+    env["KIVY_GL_BACKEND"] = "mock"
+    env["SDL_VIDEODRIVER"] = "dummy"
+    env["SDL_AUDIODRIVER"] = "dummy"
+    return env
+
+
+# --- import時間 ---
+def parse_importtime(stderr: str) -> list[dict]:
+    """
+    `-X importtime` の出力を解析する
+
+    出力形式: "import time: <self us> | <cumulative us> | <インデント付きモジュール名>"
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            continue  # 見出し行
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append({
+            "module": name.strip(),
+            "depth": depth,
+            "self_ms": self_us / 1000,
+            "cumulative_ms": cumulative_us / 1000,
+        })
+    return modules
+
+
+def measure_imports(target: str, top: int) -> dict:
+    """対象モジュールのimport時間を計測する"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        env=headless_env(), capture_output=True, text=True, encoding="utf-8", errors="replace"
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{target} のimportに失敗しました:\n{proc.stderr[-2000:]}")
+
+    modules = parse_importtime(proc.stderr)
+    top_level = [m for m in modules if m["depth"] == 0]
+    packages: dict[str, float] = {}
+    for m in modules:
+        root = m["module"].split(".")[0]
+        packages[root] = packages.get(root, 0.0) + m["self_ms"]
+
+    return {
+        "target": target,
+        "total_ms": round(sum(m["cumulative_ms"] for m in top_level), 1),
+        "module_count": len(modules),
+        "top_cumulative": sorted(top_level, key=lambda m: m["cumulative_ms"], reverse=True)[:top],
+        "top_self": sorted(modules, key=lambda m: m["self_ms"], reverse=True)[:top],
+        "by_package_ms": {
+            name: round(ms, 1)
+            for name, ms in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        },
+    }
+
+
+# --- 初回描画・準備完了 ---
+def disable_side_effects() -> None:
+    """
+    計測中に外部へ影響する処理を止める
+
+    印刷キューの再開（実際にラベルが印刷される）と、ウォームアップの各段階
+    （Google Sheets・Driveへの接続）を何もしない処理に差し替える。段階の依存関係はそのまま残す。
+    """
+    from attendance_app import warmup
+    from attendance_app.print_spooler import PrintSpooler
+
+    PrintSpooler.start = lambda self: None
+    for name, (label, _, deps) in list(warmup.STAGES.items()):
+        warmup.STAGES[name] = (label, lambda: None, deps)
+
+
+def run_child(timeout: float) -> None:
+    """子プロセス側：アプリを起動して各時点を記録し、結果を標準出力に書いて終了する"""
+    t0 = float(os.environ["BENCHMARK_T0"])
+    marks = {"process_start_ms": round((time.time() - t0) * 1000, 1)}
+
+    from attendance_app.main import AttendanceApp
+    disable_side_effects()
+    marks["imported_ms"] = round((time.time() - t0) * 1000, 1)
+
+    from kivy.clock import Clock
+    from kivy.core.window import Window
+
+    class BenchmarkApp(AttendanceApp):
+        def build(self):
+            root = super().build()
+            marks["built_ms"] = round((time.time() - t0) * 1000, 1)
+            Window.bind(on_flip=self._on_first_flip)
+            Clock.schedule_interval(self._check_ready, 0.02)
+            Clock.schedule_once(lambda dt: self._finish(timed_out=True), timeout)
+            return root
+
+        def _on_first_flip(self, *_):
+            if "first_frame_ms" not in marks:
+                marks["first_frame_ms"] = round((time.time() - t0) * 1000, 1)
+            Window.unbind(on_flip=self._on_first_flip)
+
+        def _check_ready(self, dt):
+            warmup = getattr(self, "warmup", None)
+            if "first_frame_ms" in marks and warmup is not None and warmup.is_finished:
+                marks["ready_ms"] = round((time.time() - t0) * 1000, 1)
+                marks["warmup_ok"] = warmup.is_ready
+                marks["warmup_states"] = dict(warmup.states)
+                self._finish(timed_out=False)
+                return False
+
+        def _finish(self, timed_out):
+            if "finished" in marks:
+                return
+            marks["finished"] = True
+            marks["timed_out"] = timed_out
+            print(RESULT_MARKER + json.dumps(marks, ensure_ascii=False), flush=True)
+            self.stop()
+
+    BenchmarkApp().run()
+
+
+def measure_startup(timeout: float) -> dict:
+    """子プロセスでアプリを1回起動して計測する"""
+    env = headless_env()
+    env["BENCHMARK_T0"] = repr(time.time())
+    proc = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "--child", "--timeout", str(timeout)],
+        env=env, capture_output=True, text=True, encoding="utf-8", errors="replace",
+        timeout=timeout + 60
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"起動の計測に失敗しました（終了コード {proc.returncode}）:\n{proc.stderr[-2000:]}")
+
+
+# --- 予算 ---
+def check_budgets(result: dict, args) -> list[str]:
+    """予算を超えた項目の説明を返す"""
+    checks = [
+        ("import時間", result["imports"]["total_ms"], args.budget_import_ms),
+        ("初回描画まで", result["startup"].get("first_frame_ms"), args.budget_first_frame_ms),
+        ("準備完了まで", result["startup"].get("ready_ms"), args.budget_ready_ms),
+    ]
+    failures = []
+    for label, value, budget in checks:
+        if not budget:
+            continue
+        if value is None:
+            failures.append(f"{label}: 計測できませんでした（予算 {budget}ms）")
+        elif value > budget:
+            failures.append(f"{label}: {value}ms が予算 {budget}ms を超えました")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="起動時間のベンチマーク")
+    parser.add_argument("--runs", type=int, default=3, help="起動の計測回数（中央値を採用）")
+    parser.add_argument("--timeout", type=float, default=60.0, help="1回の起動を打ち切るまでの秒数")
+    parser.add_argument("--target", default="attendance_app.main", help="import時間を計測するモジュール")
+    parser.add_argument("--top", type=int, default=20, help="import時間の上位何件を記録するか")
+    parser.add_argument("--budget-import-ms", type=float, default=DEFAULT_BUDGETS_MS["import"],
+                        help="import時間の予算（0 で確認しない）")
+    parser.add_argument("--budget-first-frame-ms", type=float, default=DEFAULT_BUDGETS_MS["first_frame"],
+                        help="初回描画までの予算（0 で確認しない）")
+    parser.add_argument("--budget-ready-ms", type=float, default=DEFAULT_BUDGETS_MS["ready"],
+                        help="準備完了までの予算（0 で確認しない）")
+    parser.add_argument("--output", type=Path, help="結果のJSONの保存先（省略時は output/benchmarks/）")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.timeout)
+        return 0
+
+    print(f"import時間を計測中: {args.target}")
+    imports = measure_imports(args.target, args.top)
+
+    runs = []
+    for i in range(args.runs):
+        print(f"起動を計測中 ({i + 1}/{args.runs})...")
+        runs.append(measure_startup(args.timeout))
+
+    def median_of(key):
+        values = [run[key] for run in runs if run.get(key) is not None]
+        return round(statistics.median(values), 1) if values else None
+
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "imports": imports,
+        "startup": {
+            "imported_ms": median_of("imported_ms"),
+            "first_frame_ms": median_of("first_frame_ms"),
+            "ready_ms": median_of("ready_ms"),
+            "runs": runs,
+        },
+    }
+    failures = check_budgets(result, args)
+    result["budget_failures"] = failures
+
+    output = args.output or OUTPUT_DIR / f"startup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"\nimport時間: {imports['total_ms']}ms")
+    for m in imports["top_cumulative"][:10]:
+        print(f"  {m['cumulative_ms']:>9.1f}ms  {m['module']}")
+    print(f"初回描画まで: {result['startup']['first_frame_ms']}ms")
+    print(f"準備完了まで: {result['startup']['ready_ms']}ms")
+    print(f"結果を保存しました: {output}")
+
+    if failures:
+        print("\n予算超過:")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+アンケート画面のアイコンをKivyのアトラスにまとめる
+
+天気・睡眠・目的のアイコン（assets/images/weather, sleep, purpose）を表示する大きさ
+（長い辺が --icon-size px）に縮小してから1枚のテクスチャに詰め、
+src/attendance_app/assets/images/questionnaire.atlas（と .png）を生成する。
+アイコンを追加・変更したら実行し直すこと（実行ファイルのビルドでは build_spec.py が毎回実行する）。
+
+使い方:
+    python build_atlas.py [--icon-size 256] [--size 2048] [--padding 2]
+
+元のアイコン（1024px以上）のまま詰めると1ページに1個しか入らず、起動時に大きなテクスチャを
+何枚も読み込むことになる。ページは小さいものから試し、1ページに収まらなければ失敗する。
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+IMAGES_DIR = Path(__file__).resolve().parent / "src" / "attendance_app" / "assets" / "images"
+ATLAS_NAME = "questionnaire"
+ICON_FOLDERS = ["weather", "sleep", "purpose"]
+PAGE_SIZES = [512, 1024, 2048, 4096]  # 試すページの大きさ（px）
+
+
+def collect_icons() -> list[str]:
+    """アトラスに含めるアイコンのパス（ファイル名の重複は不可）"""
+    icons = []
+    seen = {}
+    for folder in ICON_FOLDERS:
+        for path in sorted((IMAGES_DIR / folder).glob("*.png")):
+            if path.stem in seen:
+                raise ValueError(f"アイコン名が重複しています: {path} と {seen[path.stem]}")
+            seen[path.stem] = path
+            icons.append(str(path))
+    return icons
+
+
+def resize_icons(icons: list[str], icon_size: int, folder: Path) -> list[str]:
+    """アイコンを長い辺が icon_size px になるよう縮小して folder に保存する（ファイル名はそのまま）"""
+    from PIL import Image
+
+    resized = []
+    for icon in icons:
+        with Image.open(icon) as image:
+            image = image.convert("RGBA")
+            image.thumbnail((icon_size, icon_size), Image.LANCZOS)
+            path = folder / Path(icon).name
+            image.save(path)
+        resized.append(str(path))
+    return resized
+
+
+def remove_outputs(keep_first_page: bool) -> None:
+    """前回までに作ったアトラスの .atlas とページ画像を消す（1ページ目は残すこともできる）"""
+    for path in IMAGES_DIR.glob(f"{ATLAS_NAME}-*.png"):
+        if not (keep_first_page and path.name == f"{ATLAS_NAME}-0.png"):
+            path.unlink()
+    if not keep_first_page:
+        (IMAGES_DIR / f"{ATLAS_NAME}.atlas").unlink(missing_ok=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="アンケート画面のアイコンをアトラスにまとめる")
+    parser.add_argument("--icon-size", type=int, default=256, help="アイコンの長い辺の大きさ（px、画面に表示する大きさ）")
+    parser.add_argument("--size", type=int, default=2048, help="アトラス画像1枚の最大サイズ（px）")
+    parser.add_argument("--padding", type=int, default=2, help="アイコン間の余白（px）")
+    args = parser.parse_args()
+
+    from kivy.atlas import Atlas
+
+    icons = collect_icons()
+    if not icons:
+        print(f"アイコンが見つかりません: {IMAGES_DIR}")
+        return 1
+
+    outname = str(IMAGES_DIR / ATLAS_NAME)
+    with tempfile.TemporaryDirectory() as tmp:
+        resized = resize_icons(icons, args.icon_size, Path(tmp))
+        # 1ページに収まる一番小さいページの大きさで作る
+        for size in [s for s in PAGE_SIZES if s < args.size] + [args.size]:
+            result = Atlas.create(outname, resized, size, padding=args.padding, use_path=False)
+            if not result:
+                continue
+            atlas_file, _ = result
+            with open(atlas_file, encoding="utf-8") as f:
+                pages = json.load(f)
+            if len(pages) == 1:
+                remove_outputs(keep_first_page=True)
+                break
+        else:
+            remove_outputs(keep_first_page=False)
+            print(f"アイコンが{args.size}pxの1ページに収まりません（--icon-size を小さくするか --size を大きくしてください）")
+            return 1
+
+    print(f"アトラスを作成しました: {atlas_file}（{size}px、{len(icons)}個のアイコン）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,8 @@
 PyInstaller build configuration for Attendance Management System v3.2
 """
 import os
+import subprocess
+import sys
 from pathlib import Path
 
 # アプリケーションのルートディレクトリ
@@ -10,11 +12,17 @@ app_root = Path(__file__).parent
 # アセットファイルのパス
 assets_dir = app_root / "src" / "attendance_app" / "assets"
 
+# アンケート画面のアイコンのアトラスを作り直す（assets/images に出力され、下の画像ファイルと一緒に同梱される）
+subprocess.run([sys.executable, str(app_root / "build_atlas.py")], check=True)
+atlas_file = assets_dir / "images" / "questionnaire.atlas"
+if not atlas_file.exists():
+    raise FileNotFoundError(f"アトラスが作成されていません: {atlas_file}")
+
 # データファイルのリスト
 datas = [
     # フォントファイル
     (str(assets_dir / "fonts"), "assets/fonts"),
-    # 画像ファイル
+    # 画像ファイル（build_atlas.py が作った questionnaire.atlas と .png を含む）
     (str(assets_dir / "images"), "assets/images"),
     # サンプルデータ
     (str(assets_dir / "sample_data.csv"), "assets/"),
@@ -54,6 +62,8 @@ hiddenimports = [
     'reportlab',
     'openpyxl',
     'PIL',
+    'qrcode',
+    'qrcode.image.pil',
     'google.auth',
     'google.auth.transport.requests',
     'google.oauth2.credentials',
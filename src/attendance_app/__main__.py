@@ -2,7 +2,9 @@
 エントリポイント
 """
 
-from .main import main
-
 if __name__ == "__main__":
+    # QRコード生成のプロセスプールの子プロセスはこのモジュールを読み込み直すので、
+    # GUI（Kivy）の読み込みは実際に起動するときだけ行う
+    from .main import main
+
     main()
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""
+画面で使う画像・音声の登録簿
+
+- 画像のパスは最初に1回だけ解決し、以降は同じ値を返す
+- アンケートのアイコンは、build_atlas.py で作ったアトラスがあればアトラスから読み込む
+- 効果音は1つのインスタンスを全画面で共有する
+- preload() で起動時にテクスチャを読み込んでおき、アンケート画面の初回表示を滑らかにする
+"""
+
+import json
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+from kivy.core.audio import SoundLoader
+
+
+
+def _images_dir() -> Path:
+    """
+    画像フォルダ（main.get_image_path と同じく、PyInstallerの実行ファイルでは展開先の assets/images）
+    """
+    if getattr(sys, "frozen", False):
+        return Path(sys._MEIPASS) / "assets" / "images"
+    return Path(__file__).resolve().parent / "assets" / "images"
+
+
+ATLAS_FILE = _images_dir() / "questionnaire.atlas"
+
+# 起動時に読み込んでおくアンケートのアイコン
+QUESTION_ICONS = {
+    "weather": ["sun.png", "sun_cloud.png", "cloud.png", "rain.png", "heavyrain.png"],
+    "sleep": ["beaker1.png", "beaker2.png", "beaker3.png", "beaker4.png", "beaker5.png"],
+    "purpose": ["purpose1.png", "purpose2.png", "purpose3.png", "purpose4.png", "purpose5.png"],
+}
+
+
+def _load_atlas_ids() -> set[str]:
+    """アトラスに含まれるアイコン名（アトラスがなければ空）"""
+    if not ATLAS_FILE.exists():
+        return set()
+    try:
+        with ATLAS_FILE.open("r", encoding="utf-8") as f:
+            pages = json.load(f)
+        return {icon_id for ids in pages.values() for icon_id in ids}
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"アトラスの読み込みに失敗しました: {ATLAS_FILE} - {e}")
+        return set()
+
+
+class AssetRegistry:
+    """画像・音声の解決結果と読み込み済みのインスタンスを保持する"""
+
+    def __init__(self, image_resolver: Callable[[str, str], str],
+                 sound_resolver: Callable[[str], str]):
+        """
+        Args:
+            image_resolver: (サブフォルダ, ファイル名) から画像ファイルのパスを返す関数
+            sound_resolver: ファイル名から音声ファイルのパスを返す関数
+        """
+        self._image_resolver = image_resolver
+        self._sound_resolver = sound_resolver
+        self._lock = threading.Lock()
+        self._images: dict[tuple[str, str], str] = {}
+        self._sounds: dict[str, Optional[object]] = {}
+        self._textures: list = []  # 読み込んだテクスチャを保持してキャッシュから消えないようにする
+        self._atlas_ids = _load_atlas_ids()
+        self._atlas_url = "atlas://" + ATLAS_FILE.with_suffix("").as_posix()
+
+    def image(self, subfolder: str, filename: str) -> str:
+        """画像の source に指定する文字列（アトラス内ならatlas://のURL、見つからなければ空文字）"""
+        key = (subfolder, filename)
+        with self._lock:
+            if key in self._images:
+                return self._images[key]
+
+        icon_id = Path(filename).stem
+        if icon_id in self._atlas_ids:
+            source = f"{self._atlas_url}/{icon_id}"
+        else:
+            source = self._image_resolver(subfolder, filename)
+
+        with self._lock:
+            self._images[key] = source
+        return source
+
+    def sound(self, filename: str):
+        """効果音（同じファイルは1つのインスタンスを共有、読み込めなければNone）"""
+        with self._lock:
+            if filename in self._sounds:
+                return self._sounds[filename]
+        try:
+            path = self._sound_resolver(filename)
+            sound = SoundLoader.load(path) if path else None
+        except Exception as e:
+            print(f"音声ファイルの読み込みに失敗しました: {e}")
+            sound = None
+        with self._lock:
+            return self._sounds.setdefault(filename, sound)
+
+    def preload(self) -> None:
+        """アンケートのアイコンのテクスチャを読み込んでおく（メインスレッドから呼ぶこと）"""
+        from kivy.core.image import Image as CoreImage
+
+        loaded = 0
+        for subfolder, filenames in QUESTION_ICONS.items():
+            for filename in filenames:
+                source = self.image(subfolder, filename)
+                if not source:
+                    continue
+                try:
+                    self._textures.append(CoreImage(source).texture)
+                    loaded += 1
+                except Exception as e:
+                    print(f"画像の読み込みに失敗しました: {source} - {e}")
+        via = "アトラス" if self._atlas_ids else "個別の画像ファイル"
+        print(f"アンケートのアイコンを読み込みました: {loaded}個（{via}）")
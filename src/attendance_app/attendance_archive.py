@@ -0,0 +1,275 @@
+"""
+出席記録のアーカイブ
+
+締まった月（今月より前）の行を「生徒出席情報」シートから取り出し、
+月ごとの Arrow IPC ファイル（メモリマップで読み込み可能）としてローカルに保存する。
+アーカイブ済みの月はインデックス（index.json）に記録され、
+データ分析側はその月をシートではなくディスクから読み込む。
+
+シートから行を削除すると以降の行番号がずれるため、今日の入室で退室していないもの
+（在室トラッカー・月次集計・楽観的な入退室が行番号を持っているもの）がある間は削除しない。
+同じプロセスの在室トラッカーと月次集計は、削除後に行番号を捨てて読み込み直す。
+別のプロセスのキオスクが削除の直前に入室を書き込んだ場合に備え、
+キオスクで入退室処理が行われていない時間帯に実行すること。
+"""
+
+import json
+import sys
+import threading
+from datetime import date, datetime
+
+from .attendance_rollups import get_rollup_store
+from .attendance_store import parse_entry_time
+from .checkin_reconciler import get_reconciler
+from .config import ARCHIVE_DIR, load_settings
+from .occupancy import get_tracker
+from .spreadsheet import get_input_sheet
+
+INDEX_FILE = ARCHIVE_DIR / "index.json"
+
+_index_lock = threading.Lock()
+
+
+def _month_key(year: int, month: int) -> str:
+    return f"{year:04d}-{month:02d}"
+
+
+def _archive_path(year: int, month: int):
+    return ARCHIVE_DIR / f"attendance_{_month_key(year, month)}.arrow"
+
+
+def load_index() -> dict:
+    """アーカイブ済みの月の一覧を読み込む"""
+    if INDEX_FILE.exists():
+        try:
+            with INDEX_FILE.open('r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            print(f"アーカイブインデックスの読み込みに失敗しました: {INDEX_FILE}")
+    return {}
+
+
+def _save_index(index: dict) -> None:
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = INDEX_FILE.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding='utf-8')
+    tmp_path.replace(INDEX_FILE)
+
+
+def _awaiting_removal(year: int, month: int) -> bool:
+    """アーカイブ済みだがシートからの削除が終わっていない（中止された）か"""
+    entry = load_index().get(_month_key(year, month))
+    return is_archived(year, month) and not entry.get("removed_from_sheet", True)
+
+
+def is_archived(year: int, month: int) -> bool:
+    """指定月がアーカイブ済みかどうか"""
+    entry = load_index().get(_month_key(year, month))
+    return bool(entry) and _archive_path(year, month).exists()
+
+
+def read_archived_month(year: int, month: int) -> list[list[str]]:
+    """アーカイブ済みの月の行を読み込む（ヘッダー行は含まない）"""
+    import pyarrow as pa
+
+    path = _archive_path(year, month)
+    with pa.memory_map(str(path), 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    columns = [table.column(i).to_pylist() for i in range(table.num_columns)]
+    return [list(row) for row in zip(*columns)]
+
+
+def _write_month_file(year: int, month: int, header: list[str], rows: list[list[str]]) -> None:
+    """行を Arrow IPC ファイルとして書き出す（一時ファイル経由で置き換え）"""
+    import pyarrow as pa
+
+    width = len(header)
+    columns = [
+        pa.array([row[i] if i < len(row) else "" for row in rows], type=pa.string())
+        for i in range(width)
+    ]
+    schema = pa.schema(
+        [pa.field(f"col{i}", pa.string()) for i in range(width)],
+        metadata={"header": json.dumps(header, ensure_ascii=False)}
+    )
+    table = pa.Table.from_arrays(columns, schema=schema)
+
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _archive_path(year, month)
+    tmp_path = path.with_suffix('.tmp')
+    with pa.OSFile(str(tmp_path), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    tmp_path.replace(path)
+
+
+def _contiguous_ranges(row_numbers: list[int]) -> list[tuple[int, int]]:
+    """行番号のリストを連続する範囲 (start, end) にまとめる"""
+    ranges = []
+    for number in sorted(row_numbers):
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], number)
+        else:
+            ranges.append((number, number))
+    return ranges
+
+
+def archive_month(year: int, month: int, remove_from_sheet: bool = True) -> int:
+    """
+    指定月の行をアーカイブし、シートから削除する。
+
+    アーカイブ済みでシートからの削除が中止されていた月は、シートの行がアーカイブと
+    一致することを確かめてから削除だけをやり直す。
+
+    Returns:
+        int: アーカイブした行数
+    """
+    now = datetime.now()
+    if (year, month) >= (now.year, now.month):
+        raise ValueError(f"{year}年{month}月はまだ締まっていないためアーカイブできません")
+    retry_removal = remove_from_sheet and _awaiting_removal(year, month)
+    if is_archived(year, month) and not retry_removal:
+        raise ValueError(f"{year}年{month}月は既にアーカイブ済みです")
+
+    sheet = get_input_sheet()
+    records = sheet.get_all_values()
+    if not records:
+        return 0
+    header = records[0]
+    width = max([7, len(header)] + [len(row) for row in records[1:]])
+    header = header + [""] * (width - len(header))
+
+    rows = []
+    row_numbers = []
+    for i, row in enumerate(records[1:], 2):  # シート上の行番号は2から
+        entry_time = parse_entry_time(row[0]) if row else None
+        if entry_time and entry_time.year == year and entry_time.month == month:
+            rows.append(row)
+            row_numbers.append(i)
+
+    if not rows:
+        print(f"{year}年{month}月の行はシートにありません")
+        if retry_removal:
+            _mark_removed(year, month)  # 手作業などで既に削除されている
+        return 0
+
+    if retry_removal:
+        archived = read_archived_month(year, month)
+        width = len(archived[0]) if archived else 0
+        if [row + [""] * (width - len(row)) for row in rows] != archived:
+            raise RuntimeError(
+                f"シートの{year}年{month}月の行がアーカイブと一致しないため削除を中止しました"
+            )
+        print(f"{year}年{month}月はアーカイブ済みのため、シートからの削除だけをやり直します")
+    else:
+        _archive_rows(year, month, header, rows, now)
+
+    if remove_from_sheet:
+        _remove_rows(sheet, rows, row_numbers)
+        _mark_removed(year, month)
+
+    return len(rows)
+
+
+def _mark_removed(year: int, month: int) -> None:
+    with _index_lock:
+        index = load_index()
+        index[_month_key(year, month)]["removed_from_sheet"] = True
+        _save_index(index)
+
+
+def _archive_rows(year: int, month: int, header: list[str], rows: list[list[str]], now: datetime) -> None:
+    """行をファイルに書き出してインデックスに記録する"""
+    _write_month_file(year, month, header, rows)
+
+    with _index_lock:
+        index = load_index()
+        index[_month_key(year, month)] = {
+            "file": _archive_path(year, month).name,
+            "rows": len(rows),
+            "archived_at": now.isoformat(),
+            "spreadsheet_id": load_settings().get("spreadsheet_id", ""),
+            "removed_from_sheet": False,
+        }
+        _save_index(index)
+    print(f"{year}年{month}月の{len(rows)}行をアーカイブしました: {_archive_path(year, month)}")
+
+
+def _open_visits_today(records: list[list[str]]) -> list[int]:
+    """今日の入室で退室時刻が書かれていない行の行番号"""
+    today = date.today()
+    rows = []
+    for i, row in enumerate(records[1:], 2):
+        entry_time = parse_entry_time(row[0]) if row else None
+        if entry_time and entry_time.date() == today and (len(row) < 7 or not row[6]):
+            rows.append(i)
+    return rows
+
+
+def _check_no_open_visits(records: list[list[str]]) -> None:
+    """行番号を持っている入室があれば削除を中止する"""
+    open_rows = _open_visits_today(records)
+    if open_rows:
+        raise RuntimeError(
+            f"退室していない入室が{len(open_rows)}件あるため削除を中止しました"
+            "（全員の退室後に再実行してください。アーカイブファイルは保存済み）"
+        )
+    if get_tracker().headcount() > 0 or get_reconciler().has_pending():
+        raise RuntimeError(
+            "このキオスクに在室中・書き込み中の入退室があるため削除を中止しました"
+            "（アーカイブファイルは保存済み）"
+        )
+
+
+def _remove_rows(sheet, rows: list[list[str]], row_numbers: list[int]) -> None:
+    """
+    アーカイブした行をシートから削除する
+
+    削除前に内容が変わっていないことと、行番号を持っている入室がないことを確認し、
+    削除後はこのプロセスの在室トラッカーと月次集計が持つ行番号を捨てる。
+    """
+    current = sheet.get_all_values()
+    _check_no_open_visits(current)
+    for row, number in zip(rows, row_numbers):
+        if number > len(current) or current[number - 1][:len(row)] != row:
+            raise RuntimeError(
+                f"シートの{number}行目がアーカイブ時から変更されているため削除を中止しました"
+                "（アーカイブファイルは保存済み）"
+            )
+
+    # 下の行から削除して行番号のずれを防ぐ
+    for start, end in reversed(_contiguous_ranges(row_numbers)):
+        sheet.delete_rows(start, end)
+    print(f"シートから{len(row_numbers)}行を削除しました")
+
+    get_tracker().invalidate()
+    get_rollup_store().drop_pending()
+
+
+def archive_closed_months(remove_from_sheet: bool = True) -> list[str]:
+    """シートに残っている今月より前の月をすべてアーカイブする"""
+    now = datetime.now()
+    months = set()
+    for row in get_input_sheet().get_all_values()[1:]:
+        entry_time = parse_entry_time(row[0]) if row else None
+        if entry_time and (entry_time.year, entry_time.month) < (now.year, now.month):
+            months.add((entry_time.year, entry_time.month))
+
+    archived = []
+    for year, month in sorted(months):
+        if is_archived(year, month) and not (remove_from_sheet and _awaiting_removal(year, month)):
+            print(f"{year}年{month}月は既にアーカイブ済みのためスキップします")
+            continue
+        archive_month(year, month, remove_from_sheet=remove_from_sheet)
+        archived.append(_month_key(year, month))
+    return archived
+
+
+if __name__ == "__main__":
+    # 使い方: python -m attendance_app.attendance_archive [年 月]
+    if len(sys.argv) == 3:
+        count = archive_month(int(sys.argv[1]), int(sys.argv[2]))
+        print(f"アーカイブ完了: {count}行")
+    else:
+        done = archive_closed_months()
+        print(f"アーカイブ完了: {', '.join(done) if done else 'なし'}")
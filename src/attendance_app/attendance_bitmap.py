@@ -0,0 +1,123 @@
+"""
+塾生×日の出席ビットマップ
+
+塾生ごと・月ごとに「その日に来塾したか」を1ビットで表す整数（ビット0 = 1日）を保持する。
+出席日数はビット数の数え上げ、同じ日に来た塾生の抽出は論理積で求められるため、
+行を走査し直さずにカレンダー表示や「計N日利用」の集計に使える。
+"""
+
+from typing import Iterable, Iterator, Optional
+
+from .attendance_store import AttendanceTable, NO_TIME
+
+
+def day_mask(days: Iterable[int]) -> int:
+    """日（1始まり）の集合をビットマスクに変換する"""
+    mask = 0
+    for day in days:
+        mask |= 1 << (int(day) - 1)
+    return mask
+
+
+def popcount(mask: int) -> int:
+    """立っているビットの数（出席日数）"""
+    return bin(mask).count("1")
+
+
+def iter_days(mask: int) -> Iterator[int]:
+    """ビットマスクに含まれる日（1始まり）を昇順に返す"""
+    day = 1
+    while mask:
+        if mask & 1:
+            yield day
+        mask >>= 1
+        day += 1
+
+
+class MonthBitmap:
+    """1か月分の塾生×日の出席ビットマップ"""
+
+    __slots__ = ("year", "month", "masks")
+
+    def __init__(self, year: int, month: int, masks: Optional[dict[str, int]] = None):
+        self.year = year
+        self.month = month
+        self.masks: dict[str, int] = {sid: mask for sid, mask in (masks or {}).items() if mask}
+
+    @classmethod
+    def from_rollup(cls, year: int, month: int, rollup: dict) -> "MonthBitmap":
+        """月次集計（attendance_rollups）から作成する"""
+        return cls(year, month, {
+            student_id: day_mask(summary["days"])
+            for student_id, summary in rollup["students"].items()
+        })
+
+    @classmethod
+    def from_table(cls, table: AttendanceTable, year: int, month: int) -> "MonthBitmap":
+        """出席テーブルから作成する（退室記録のある来塾のみ）"""
+        bitmap = cls(year, month)
+        for i in table.month_indices(year, month):
+            if table.exit[i] == NO_TIME:
+                continue
+            record = table.record(i)
+            bitmap.add(record.student_id, record.entry_time.day)
+        return bitmap
+
+    def add(self, student_id: str, day: int) -> None:
+        self.masks[student_id] = self.masks.get(student_id, 0) | (1 << (day - 1))
+
+    def mask(self, student_id: str) -> int:
+        return self.masks.get(str(student_id), 0)
+
+    def days(self, student_id: str) -> list[int]:
+        """塾生が来塾した日の一覧"""
+        return list(iter_days(self.mask(student_id)))
+
+    def count(self, student_id: str) -> int:
+        """塾生の出席日数"""
+        return popcount(self.mask(student_id))
+
+    def student_ids(self) -> list[str]:
+        """この月に1日以上出席した塾生"""
+        return list(self.masks)
+
+    def students_on(self, day: int) -> list[str]:
+        """指定日に来塾した塾生"""
+        bit = 1 << (day - 1)
+        return [student_id for student_id, mask in self.masks.items() if mask & bit]
+
+    def union(self, student_ids: Iterable[str]) -> int:
+        """いずれかの塾生が来塾した日"""
+        result = 0
+        for student_id in student_ids:
+            result |= self.mask(student_id)
+        return result
+
+    def intersection(self, student_ids: Iterable[str]) -> int:
+        """全員が来塾した日"""
+        result = None
+        for student_id in student_ids:
+            mask = self.mask(student_id)
+            result = mask if result is None else result & mask
+        return result or 0
+
+    def co_attendance(self, student_id: str, min_days: int = 1) -> list[tuple[str, int]]:
+        """指定塾生と同じ日に来塾した塾生と、重なった日数（多い順）"""
+        own = self.mask(student_id)
+        result = []
+        for other_id, mask in self.masks.items():
+            if other_id == str(student_id):
+                continue
+            common = popcount(own & mask)
+            if common >= min_days:
+                result.append((other_id, common))
+        result.sort(key=lambda item: item[1], reverse=True)
+        return result
+
+    def daily_headcount(self) -> dict[int, int]:
+        """日ごとの来塾人数"""
+        counts: dict[int, int] = {}
+        for mask in self.masks.values():
+            for day in iter_days(mask):
+                counts[day] = counts.get(day, 0) + 1
+        return counts
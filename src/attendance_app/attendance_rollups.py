@@ -0,0 +1,375 @@
+"""
+塾生ごとの日次・月次集計（ロールアップ）
+
+出席回数、滞在時間、気分・睡眠・目的の分布を塾生×月（および日）単位で保持する。
+キオスクでの入室・回答・退室の書き込みごとに差分で更新し、
+レポート側は集計済みの値を参照するだけで済むようにする。
+
+集計は、その月の行の内容から求めたハッシュ（month_hashes）と紐づけて保存する。
+ハッシュは行ごとのハッシュの和なので、キオスクの書き込み（行の追加・セルの更新）のたびに
+その行の分だけ差し替えて更新できる。シートのハッシュと一致しない月
+（スタッフによる直接編集があった月など）だけをシートから作り直す。
+ほかの月の行が書き換わっても、その月の集計はそのまま使える。
+
+シートの内容と照合した時点のDriveの版（drive_version）も月ごとに保存する。版が変わっていなければ、
+またはその後の変更がこのアプリの書き込みだけなら、シートを取得せずに集計をそのまま使う（get_current_month）。
+
+書き込み途中の入室（退室前）は、塾生番号と入室時刻で識別して保持する。
+行番号は今日の入室の書き込みを対応付けるためだけに使い、前日以前のものは破棄する
+（アーカイブで行が削除されると行番号がずれるため）。
+"""
+
+import hashlib
+import json
+import threading
+import time
+from datetime import date, datetime
+from typing import Optional
+
+from .attendance_store import AttendanceTable, parse_entry_time, parse_exit_time
+from .config import CACHE_DIR
+
+ROLLUP_DIR = CACHE_DIR / "rollups"
+PENDING_FILE = ROLLUP_DIR / "pending.json"
+
+# 回答を書き込む列（spreadsheet.write_response の col）
+ANSWER_COLUMNS = {4: "mood", 5: "sleep", 6: "purpose"}
+ROW_WIDTH = 7  # 入室時刻・塾生番号・氏名・気分・睡眠・目的・退室時刻
+EXIT_COLUMN = 7
+
+_HASH_MOD = 1 << 64
+EMPTY_HASH = f"{0:016x}"
+
+
+def month_key(year: int, month: int) -> str:
+    return f"{year:04d}-{month:02d}"
+
+
+def row_hash(cells: list[str]) -> int:
+    """1行のハッシュ（末尾の空のセルは無視する）"""
+    cells = [str(c) for c in cells]
+    while cells and cells[-1] == "":
+        cells.pop()
+    data = json.dumps(cells, ensure_ascii=False).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def _add_hash(month_hash: str, added: int = 0, removed: int = 0) -> str:
+    return f"{(int(month_hash, 16) + added - removed) % _HASH_MOD:016x}"
+
+
+def month_hashes(values: list[list[str]]) -> dict[str, str]:
+    """シートの全値（ヘッダー行を含む）から月ごとの内容のハッシュを求める"""
+    sums: dict[str, int] = {}
+    for row in values[1:]:
+        entry_time = parse_entry_time(row[0]) if row else None
+        if entry_time:
+            key = month_key(entry_time.year, entry_time.month)
+            sums[key] = (sums.get(key, 0) + row_hash(row)) % _HASH_MOD
+    return {key: f"{total:016x}" for key, total in sums.items()}
+
+
+def new_summary() -> dict:
+    """1人・1か月分の空の集計"""
+    return {
+        "visits": [],
+        "days": {},
+        "stay_total": 0,
+        "mood_distribution": {"快晴": 0, "晴れ": 0, "くもり": 0},
+        "sleep_distribution": {"０％": 0, "２５％": 0, "５０％": 0, "７５％": 0, "１００％": 0},
+        "sleep_sum": 0,
+        "sleep_n": 0,
+        "purpose_distribution": {"学ぶ": 0, "来る": 0},
+    }
+
+
+_SLEEP_KEYS = {0: "０％", 25: "２５％", 50: "５０％", 75: "７５％", 100: "１００％"}
+
+
+def add_visit(summary: dict, entry_time: datetime, exit_time: Optional[datetime],
+              mood: str, sleep_satisfaction: str, purpose: str) -> None:
+    """退室済みの来塾1回分を集計に加える"""
+    if exit_time:
+        stay_minutes = max(0, int((exit_time - entry_time).total_seconds() / 60))
+    else:
+        stay_minutes = 0
+
+    if mood in summary["mood_distribution"]:
+        summary["mood_distribution"][mood] += 1
+
+    if sleep_satisfaction:
+        sleep_percent = sleep_satisfaction.replace("%", "").replace("％", "")
+        try:
+            sleep_val = int(sleep_percent)
+            summary["sleep_sum"] += sleep_val
+            summary["sleep_n"] += 1
+            if sleep_val in _SLEEP_KEYS:
+                summary["sleep_distribution"][_SLEEP_KEYS[sleep_val]] += 1
+        except ValueError:
+            pass
+
+    if purpose in summary["purpose_distribution"]:
+        summary["purpose_distribution"][purpose] += 1
+
+    visit = {
+        "date": entry_time.strftime("%Y-%m-%d"),
+        "entry_time": entry_time.strftime("%H:%M"),
+        "exit_time": exit_time.strftime("%H:%M") if exit_time else "",
+        "stay_minutes": stay_minutes,
+        "mood": mood,
+        "sleep_satisfaction": sleep_satisfaction,
+        "purpose": purpose
+    }
+    visits = summary["visits"]
+    visits.append(visit)
+    if len(visits) > 1 and (visits[-2]["date"], visits[-2]["entry_time"]) > (visit["date"], visit["entry_time"]):
+        visits.sort(key=lambda v: (v["date"], v["entry_time"]))
+
+    day = summary["days"].setdefault(str(entry_time.day), {"visits": 0, "stay_minutes": 0})
+    day["visits"] += 1
+    day["stay_minutes"] += stay_minutes
+    summary["stay_total"] += stay_minutes
+
+
+def summary_to_report(summary: dict) -> dict:
+    """集計を get_monthly_attendance_data の戻り値の形式に変換する（氏名・年月は含まない）"""
+    count = len(summary["visits"])
+    average_stay = summary["stay_total"] / count if count > 0 else 0
+    average_sleep = summary["sleep_sum"] / summary["sleep_n"] if summary["sleep_n"] else 0
+    return {
+        "attendance_count": count,
+        "average_stay_minutes": round(average_stay, 1),
+        "daily_records": [dict(v) for v in summary["visits"]],
+        "mood_distribution": dict(summary["mood_distribution"]),
+        "sleep_stats": {
+            "average_percentage": round(average_sleep, 1),
+            "distribution": dict(summary["sleep_distribution"])
+        },
+        "purpose_distribution": dict(summary["purpose_distribution"])
+    }
+
+
+class RollupStore:
+    """月ごとの集計をメモリとディスク（cache/rollups/）に保持する"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._months: dict[str, dict] = {}
+        # 塾生番号|入室時刻 -> {"row", "student_id", "entry_time", "cells"}
+        pending = self._load_json(PENDING_FILE) or {}
+        self._pending: dict[str, dict] = {key: p for key, p in pending.items() if "cells" in p}
+
+    # --- 永続化 ---
+    @staticmethod
+    def _load_json(path) -> Optional[dict]:
+        if not path.exists():
+            return None
+        try:
+            with path.open('r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"[集計] 読み込みに失敗しました: {path} - {e}")
+            return None
+
+    @staticmethod
+    def _save_json(path, data: dict) -> None:
+        try:
+            ROLLUP_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            with tmp_path.open('w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            tmp_path.replace(path)
+        except OSError as e:
+            print(f"[集計] 保存に失敗しました: {path} - {e}")
+
+    def _month(self, key: str) -> Optional[dict]:
+        if key not in self._months:
+            data = self._load_json(ROLLUP_DIR / f"{key}.json")
+            if data is None:
+                return None
+            self._months[key] = data
+        return self._months[key]
+
+    def _save_month(self, key: str) -> None:
+        self._save_json(ROLLUP_DIR / f"{key}.json", self._months[key])
+
+    # --- 参照 ---
+    def get_month(self, year: int, month: int, source: Optional[str]) -> Optional[dict]:
+        """
+        最新と判断できる月の集計を返す（作り直しが必要ならNone）
+
+        Args:
+            source: 現在のその月の内容のハッシュ（month_hashes、アーカイブなら "archive"）
+        """
+        if not source:
+            return None
+        with self._lock:
+            data = self._month(month_key(year, month))
+            if not data or data.get("source") != source:
+                return None
+            return data
+
+    def get_current_month(self, year: int, month: int, drive_version: str, modified_by_me: bool,
+                          max_age: float) -> Optional[dict]:
+        """
+        シートを取得せずに使える月の集計を返す（シートとの照合が必要ならNone）
+
+        照合したときからDriveの版が変わっていなければそのまま返す。変わっていても、最後の変更が
+        このアプリの書き込みで、照合してから max_age 秒以内なら、書き込みのたびに差分で更新した集計を返す。
+
+        Args:
+            drive_version: 現在のDriveの版（sheet_cache.get_spreadsheet_metadata の version）
+            modified_by_me: 最後の変更がこのアプリのサービスアカウントによるものか
+        """
+        key = month_key(year, month)
+        with self._lock:
+            data = self._month(key)
+            if not data or not data.get("source") or data["source"] == "archive":
+                return None
+            if data.get("drive_version") == drive_version:
+                return data
+            if modified_by_me and time.time() - data.get("verified_at", 0) < max_age:
+                data["drive_version"] = drive_version
+                self._save_month(key)
+                return data
+            return None
+
+    def mark_verified(self, year: int, month: int, drive_version: str) -> None:
+        """月の集計がDriveの版 drive_version のシートの内容と一致したことを記録する"""
+        key = month_key(year, month)
+        with self._lock:
+            data = self._month(key)
+            if not data or not data.get("source"):
+                return
+            data["drive_version"] = drive_version
+            data["verified_at"] = time.time()
+            self._save_month(key)
+
+    def rebuild_month(self, year: int, month: int, table: AttendanceTable,
+                      version: Optional[str]) -> dict:
+        """テーブルから月の集計を作り直す（version はその月の内容のハッシュ）"""
+        students: dict[str, dict] = {}
+        for i in table.month_indices(year, month):
+            record = table.record(i)
+            if not record.has_exit:
+                continue
+            summary = students.setdefault(record.student_id, new_summary())
+            add_visit(summary, record.entry_time, record.exit_time,
+                      record.mood, record.sleep_satisfaction, record.purpose)
+
+        data = {
+            "source": version,
+            "rebuilt_at": time.time(),
+            "students": students,
+        }
+        key = month_key(year, month)
+        with self._lock:
+            self._months[key] = data
+            self._save_month(key)
+        return data
+
+    # --- 差分更新（キオスクの書き込み時に呼ばれる） ---
+    def record_entry(self, row: int, student_id: str, student_name: str, entry_time: str) -> None:
+        cells = [entry_time, str(student_id), student_name] + [""] * (ROW_WIDTH - 3)
+        with self._lock:
+            self._prune_pending()
+            self._pending[f"{student_id}|{entry_time}"] = {
+                "row": row,
+                "student_id": str(student_id),
+                "entry_time": entry_time,
+                "cells": cells,
+            }
+            self._save_json(PENDING_FILE, self._pending)
+            self._update_hash(parse_entry_time(entry_time), None, cells)
+
+    def record_answer(self, row: int, col: int, value: str) -> None:
+        with self._lock:
+            pending = self._find_pending(row)
+            if not pending or not 1 <= col <= ROW_WIDTH:
+                self._invalidate_current()
+                return
+            old = list(pending["cells"])
+            pending["cells"][col - 1] = value
+            self._save_json(PENDING_FILE, self._pending)
+            self._update_hash(parse_entry_time(pending["entry_time"]), old, pending["cells"])
+
+    def record_exit(self, row: int, exit_time: str) -> None:
+        with self._lock:
+            pending = self._find_pending(row)
+            entry_dt = parse_entry_time(pending["entry_time"]) if pending else None
+            if not entry_dt:
+                # 入室情報が手元にないため、今月を作り直し対象にする
+                self._invalidate_current()
+                return
+            del self._pending[f"{pending['student_id']}|{pending['entry_time']}"]
+            self._save_json(PENDING_FILE, self._pending)
+
+            old = pending["cells"]
+            cells = old[:EXIT_COLUMN - 1] + [exit_time]
+            key = month_key(entry_dt.year, entry_dt.month)
+            data = self._month(key)
+            if not data or not data.get("source"):
+                return  # 次回の参照時に作り直される
+
+            answers = {field: cells[col - 1] for col, field in ANSWER_COLUMNS.items()}
+            summary = data["students"].setdefault(pending["student_id"], new_summary())
+            add_visit(summary, entry_dt, parse_exit_time(exit_time),
+                      answers["mood"], answers["sleep"], answers["purpose"])
+            self._update_hash(entry_dt, old, cells)
+
+    def drop_pending(self) -> None:
+        """書き込み途中の入室をすべて破棄する（シートの行が削除されて行番号がずれたとき）"""
+        with self._lock:
+            if self._pending:
+                self._pending.clear()
+                self._save_json(PENDING_FILE, self._pending)
+            self._invalidate_current()
+
+    def _find_pending(self, row: int) -> Optional[dict]:
+        """今日の入室のうち、行番号が row のもの"""
+        self._prune_pending()
+        return next((p for p in self._pending.values() if p["row"] == row), None)
+
+    def _prune_pending(self) -> None:
+        """前日以前の書き込み途中の入室を破棄する（退室が書き込まれることはもうない）"""
+        today = date.today()
+        stale = [key for key, p in self._pending.items()
+                 if (parse_entry_time(p["entry_time"]) or datetime.min).date() != today]
+        for key in stale:
+            del self._pending[key]
+        if stale:
+            self._save_json(PENDING_FILE, self._pending)
+
+    def _update_hash(self, entry_dt: Optional[datetime], old: Optional[list[str]], new: list[str]) -> None:
+        """書き込んだ行の分だけ月のハッシュを差し替える（集計自体に影響しない書き込みでも行う）"""
+        if not entry_dt:
+            return
+        key = month_key(entry_dt.year, entry_dt.month)
+        data = self._month(key)
+        if not data or not data.get("source") or data["source"] == "archive":
+            return
+        data["source"] = _add_hash(data["source"], row_hash(new), row_hash(old) if old else 0)
+        self._save_month(key)
+
+    def _invalidate_current(self) -> None:
+        now = datetime.now()
+        self._invalidate(month_key(now.year, now.month))
+
+    def _invalidate(self, key: str) -> None:
+        data = self._month(key)
+        if data:
+            data["source"] = None
+            self._save_month(key)
+
+
+_store: Optional[RollupStore] = None
+_store_lock = threading.Lock()
+
+
+def get_rollup_store() -> RollupStore:
+    """プロセス全体で共有する集計ストアを返す"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RollupStore()
+        return _store
@@ -0,0 +1,296 @@
+"""
+出席記録のコンパクトなメモリ表現
+
+get_all_values() の結果（文字列のリストのリスト）を、列ごとの型付き配列に変換して保持する。
+- 入室・退室時刻: エポック秒の整数（退室なしは -1、解釈できない値は -2）
+- 塾生番号・氏名: 重複を除いて1つだけ保持し、配列には番号を格納
+- 気分・睡眠・目的: 小さな整数コード
+
+台帳（spreadsheet）、分析（data_analyzer）、レポート生成のいずれからも共有して使う。
+"""
+
+import sys
+from array import array
+from datetime import datetime
+from typing import Iterator, Optional
+
+NO_TIME = -1
+UNPARSED_TIME = -2  # 時刻は記録されているが解釈できない
+
+# 既知の回答値（未知の値は出現時にコードが追加される）
+MOOD_VALUES = ["", "快晴", "晴れ", "くもり", "雨", "豪雨"]
+SLEEP_VALUES = ["", "0％", "25％", "50％", "75％", "100％"]
+PURPOSE_VALUES = ["", "来る", "学ぶ", "話す", "楽しむ", "整える"]
+
+
+def parse_entry_time(time_str: str) -> Optional[datetime]:
+    """入室時間文字列をdatetimeオブジェクトに変換"""
+    if not time_str:
+        return None
+
+    # 複数の形式をサポート
+    formats = [
+        "%Y/%m/%d %H:%M:%S",
+        "%Y-%m-%d %H:%M:%S",
+        "%m/%d/%Y %H:%M:%S"
+    ]
+
+    for fmt in formats:
+        try:
+            return datetime.strptime(time_str, fmt)
+        except ValueError:
+            continue
+
+    print(f"Warning: Could not parse entry time: {time_str}")
+    return None
+
+
+def parse_exit_time(time_str: str) -> Optional[datetime]:
+    """退室時間文字列をdatetimeオブジェクトに変換"""
+    if not time_str:
+        return None
+
+    # 複数の形式をサポート
+    formats = [
+        # GMT形式
+        "%a %b %d %Y %H:%M:%S GMT+0900 (日本標準時)",
+        "%a %b %d %Y %H:%M:%S",
+        # 標準形式
+        "%Y/%m/%d %H:%M:%S",
+        "%Y-%m-%d %H:%M:%S",
+        "%m/%d/%Y %H:%M:%S"
+    ]
+
+    for fmt in formats:
+        try:
+            return datetime.strptime(time_str, fmt)
+        except ValueError:
+            continue
+
+    # GMT表記を削除して再試行
+    cleaned = time_str.replace(" GMT+0900 (日本標準時)", "")
+    for fmt in formats:
+        try:
+            return datetime.strptime(cleaned, fmt)
+        except ValueError:
+            continue
+
+    print(f"Warning: Could not parse exit time: {time_str}")
+    return None
+
+
+def _to_epoch(dt: Optional[datetime]) -> int:
+    return int(dt.timestamp()) if dt else NO_TIME
+
+
+def _exit_to_epoch(time_str: str) -> int:
+    if not time_str:
+        return NO_TIME
+    exit_dt = parse_exit_time(time_str)
+    return int(exit_dt.timestamp()) if exit_dt else UNPARSED_TIME
+
+
+class Codebook:
+    """文字列と小さな整数コードの対応表"""
+
+    __slots__ = ("values", "_codes")
+
+    def __init__(self, initial: list[str] = ()):
+        self.values: list[str] = []
+        self._codes: dict[str, int] = {}
+        for value in initial:
+            self.encode(value)
+
+    def encode(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            value = sys.intern(value)
+            self.values.append(value)
+            self._codes[value] = code
+        return code
+
+    def decode(self, code: int) -> str:
+        return self.values[code]
+
+    def lookup(self, value: str) -> Optional[int]:
+        """既に登録されている値のコードを返す（未登録ならNone）"""
+        return self._codes.get(value)
+
+
+class AttendanceRecord:
+    """1行分の出席記録（AttendanceTable の行を展開したもの）"""
+
+    __slots__ = ("row", "entry_ts", "exit_ts", "student_id", "student_name",
+                 "mood", "sleep_satisfaction", "purpose")
+
+    def __init__(self, row, entry_ts, exit_ts, student_id, student_name,
+                 mood, sleep_satisfaction, purpose):
+        self.row = row
+        self.entry_ts = entry_ts
+        self.exit_ts = exit_ts
+        self.student_id = student_id
+        self.student_name = student_name
+        self.mood = mood
+        self.sleep_satisfaction = sleep_satisfaction
+        self.purpose = purpose
+
+    @property
+    def entry_time(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self.entry_ts) if self.entry_ts >= 0 else None
+
+    @property
+    def exit_time(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self.exit_ts) if self.exit_ts >= 0 else None
+
+    @property
+    def has_exit(self) -> bool:
+        """退室時刻が記録されているか（解釈できない値も記録済みとみなす）"""
+        return self.exit_ts != NO_TIME
+
+    @property
+    def stay_minutes(self) -> int:
+        if self.entry_ts < 0 or self.exit_ts < 0:
+            return 0
+        return max(0, (self.exit_ts - self.entry_ts) // 60)
+
+
+class AttendanceTable:
+    """出席記録を列ごとの型付き配列で保持するテーブル"""
+
+    def __init__(self):
+        self.rows = array('I')      # シート上の行番号（1始まり、アーカイブ由来は0）
+        self.entry = array('q')     # 入室時刻（エポック秒）
+        self.exit = array('q')      # 退室時刻（エポック秒、なしは -1、解釈不能は -2）
+        self.student = array('I')   # 塾生番号のコード
+        self.mood = array('H')
+        self.sleep = array('H')
+        self.purpose = array('H')
+
+        self.students = Codebook()
+        self.moods = Codebook(MOOD_VALUES)
+        self.sleeps = Codebook(SLEEP_VALUES)
+        self.purposes = Codebook(PURPOSE_VALUES)
+        self.names: dict[int, str] = {}  # 塾生コード -> 氏名（最新の行のもの）
+
+    @classmethod
+    def from_rows(cls, rows: list[list[str]], first_row: int = 2) -> "AttendanceTable":
+        """
+        シートの行（ヘッダー行を除く）からテーブルを作成する。
+        入室時刻を解釈できない行は読み飛ばす。
+
+        Args:
+            rows: シートの行
+            first_row: rows[0] のシート上の行番号（アーカイブ由来の場合は0を指定）
+        """
+        table = cls()
+        for offset, row in enumerate(rows):
+            row_number = first_row + offset if first_row else 0
+            table.append_row(row, row_number)
+        return table
+
+    def append_row(self, row: list[str], row_number: int = 0) -> bool:
+        """シートの1行を追加する（入室時刻が解釈できない行は追加しない）"""
+        if len(row) < 2 or not row[1]:
+            return False
+        entry_dt = parse_entry_time(row[0])
+        if not entry_dt:
+            return False
+
+        exit_str = row[6] if len(row) > 6 else ""
+        student_code = self.students.encode(str(row[1]))
+        if len(row) > 2 and row[2]:
+            self.names[student_code] = sys.intern(row[2])
+
+        self.rows.append(row_number)
+        self.entry.append(_to_epoch(entry_dt))
+        self.exit.append(_exit_to_epoch(exit_str))
+        self.student.append(student_code)
+        self.mood.append(self.moods.encode(row[3] if len(row) > 3 else ""))
+        self.sleep.append(self.sleeps.encode(row[4] if len(row) > 4 else ""))
+        self.purpose.append(self.purposes.encode(row[5] if len(row) > 5 else ""))
+        return True
+
+    def __len__(self) -> int:
+        return len(self.entry)
+
+    def record(self, i: int) -> AttendanceRecord:
+        """i番目の行を AttendanceRecord として返す"""
+        student_code = self.student[i]
+        return AttendanceRecord(
+            row=self.rows[i],
+            entry_ts=self.entry[i],
+            exit_ts=self.exit[i],
+            student_id=self.students.decode(student_code),
+            student_name=self.names.get(student_code, ""),
+            mood=self.moods.decode(self.mood[i]),
+            sleep_satisfaction=self.sleeps.decode(self.sleep[i]),
+            purpose=self.purposes.decode(self.purpose[i]),
+        )
+
+    def __iter__(self) -> Iterator[AttendanceRecord]:
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def student_name(self, student_id: str) -> Optional[str]:
+        code = self.students.lookup(str(student_id))
+        return self.names.get(code) if code is not None else None
+
+    def indices(self, student_id: Optional[str] = None,
+                start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> Iterator[int]:
+        """条件（塾生番号、入室時刻の範囲 [start_ts, end_ts)）に合う行のインデックス"""
+        code = None
+        if student_id is not None:
+            code = self.students.lookup(str(student_id))
+            if code is None:
+                return
+        entry = self.entry
+        student = self.student
+        for i in range(len(entry)):
+            if code is not None and student[i] != code:
+                continue
+            if start_ts is not None and entry[i] < start_ts:
+                continue
+            if end_ts is not None and entry[i] >= end_ts:
+                continue
+            yield i
+
+    def month_indices(self, year: int, month: int, student_id: Optional[str] = None) -> Iterator[int]:
+        """指定月に入室した行のインデックス"""
+        start, end = month_range(year, month)
+        return self.indices(student_id, start, end)
+
+    def find_open_visit(self, student_id: str, day: Optional[datetime] = None) -> Optional[int]:
+        """指定日（既定は今日）の退室時刻が未記録の最新の行番号を返す"""
+        day = day or datetime.now()
+        start = int(datetime(day.year, day.month, day.day).timestamp())
+        end = start + 24 * 60 * 60
+        for i in reversed(list(self.indices(student_id, start, end))):
+            if self.exit[i] == NO_TIME:
+                return self.rows[i]
+        return None
+
+
+def month_range(year: int, month: int) -> tuple[int, int]:
+    """指定月の [開始, 終了) をエポック秒で返す"""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+_cached_values = None
+_cached_table: Optional[AttendanceTable] = None
+
+
+def table_for_sheet_values(values: list[list[str]]) -> AttendanceTable:
+    """
+    シートの全値（ヘッダー行を含む）からテーブルを作成する。
+    同じ値オブジェクト（シートキャッシュが未変更時に返すもの）に対しては
+    前回作成したテーブルを再利用する。
+    """
+    global _cached_values, _cached_table
+    if values is _cached_values and _cached_table is not None:
+        return _cached_table
+    table = AttendanceTable.from_rows(values[1:], first_row=2)
+    _cached_values, _cached_table = values, table
+    return table
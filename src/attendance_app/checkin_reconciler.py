@@ -0,0 +1,240 @@
+"""
+楽観的な入退室処理と、シートとの突き合わせ
+
+設定 optimistic_checkin が有効な場合、入室・退室の判定は在室トラッカー（occupancy）だけで行い、
+挨拶画面をすぐに表示する。シートへの書き込み（入室行の追加・回答・退室時刻）は
+バックグラウンドで行い、その際にシートの内容と食い違いがないか確認する。
+
+同じ塾生の書き込みは順番に（入室→回答→退室）、別の塾生の書き込みは並行して行う。
+シートに書き込む入退室時刻は、書き込みを実行した時刻ではなくスキャンした時刻にする。
+書き込みに失敗した場合や、シートの内容が手元の在室状況と食い違う場合は
+その塾生の在室状況だけを元に戻し（または正しい行に書き込み）、スタッフ向けの警告を残す。
+警告は待機画面に件数が表示され、Alt+A で内容を確認できる。
+"""
+
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable, Optional
+
+from .config import load_settings
+from .occupancy import get_tracker
+from .spreadsheet import append_entry, get_last_record, is_open_row, write_exit, write_response
+from .task_scheduler import PRIORITY_HIGH, get_scheduler
+
+
+def is_optimistic_enabled() -> bool:
+    """楽観的な入退室処理が有効か"""
+    return bool(load_settings().get("optimistic_checkin", False))
+
+
+class PendingVisit:
+    """書き込み中の入室。行番号はシートへの追加が終わった時点で確定する"""
+
+    __slots__ = ("student_id", "student_name", "scanned_at", "row")
+
+    def __init__(self, student_id: str, student_name: str, scanned_at: Optional[datetime] = None):
+        self.student_id = student_id
+        self.student_name = student_name
+        self.scanned_at = scanned_at or datetime.now()  # シートに書き込む入室時刻
+        self.row: Future = Future()
+
+
+class CheckinReconciler:
+    """入退室の書き込みをバックグラウンドで行い、失敗や食い違いを警告として残す"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._visits: dict[str, PendingVisit] = {}
+        self._chains: dict[str, Future] = {}  # 塾生ごとの最後に積んだ書き込み
+        self._alerts: list[dict] = []
+        self._listeners: list[Callable[[int], None]] = []
+
+    # --- 入室 ---
+    def check_in(self, student_id: str, student_name: str) -> PendingVisit:
+        """在室状況を先に更新し、入室行の追加をバックグラウンドで行う"""
+        visit = PendingVisit(student_id, student_name)
+        with self._lock:
+            self._visits[student_id] = visit
+        get_tracker().check_in(student_id, None, student_name)
+        self._enqueue(student_id, self._commit_entry, visit)
+        return visit
+
+    def _commit_entry(self, visit: PendingVisit) -> None:
+        sid, name = visit.student_id, visit.student_name
+        try:
+            # 手元では在室していなかったが、シート上は退室記録のない行がある場合は
+            # 入室行を追加せず、その行を今回の入室として使う（同じ入室の行が2つにならないように）
+            row, _ = get_last_record(sid)
+            if row:
+                self.raise_alert(
+                    f"{name}さん（{sid}）はシート上では既に入室中でした（{row}行目）。"
+                    "新しい行は追加せずこの行を使います。入室時刻を確認してください"
+                )
+            else:
+                row = append_entry(sid, name, visit.scanned_at)
+                if row is None:
+                    raise RuntimeError("入室行を追加できませんでした")
+        except Exception as e:
+            print(f"ERROR: Optimistic check-in failed for {sid}: {e}")
+            with self._lock:
+                current = self._visits.get(sid) is visit
+                if current:
+                    del self._visits[sid]
+            if current:
+                get_tracker().check_out(sid)  # 在室状況を元に戻す
+            self.raise_alert(f"{name}さん（{sid}）の入室を記録できませんでした: {e}")
+            visit.row.set_exception(e)
+            return
+
+        with self._lock:
+            current = self._visits.get(sid) is visit
+            if current:
+                del self._visits[sid]
+        if current:
+            get_tracker().check_in(sid, row, name)
+        visit.row.set_result(row)
+
+    # --- 回答 ---
+    def write_answer(self, visit: PendingVisit, col: int, value: str) -> None:
+        """入室行の追加に続けて回答を書き込む"""
+        self._enqueue(visit.student_id, self._commit_answer, visit, col, value)
+
+    def _commit_answer(self, visit: PendingVisit, col: int, value: str) -> None:
+        if visit.row.exception() is not None:
+            return  # 入室の記録に失敗している（警告済み）
+        row = visit.row.result()
+        try:
+            write_response(row, col, value)
+        except Exception as e:
+            self.raise_alert(
+                f"{visit.student_name}さん（{visit.student_id}）の回答「{value}」を"
+                f"{row}行目に記録できませんでした: {e}"
+            )
+
+    # --- 退室 ---
+    def check_out(self, student_id: str, student_name: str) -> None:
+        """在室状況を先に更新し、退室時刻の書き込みをバックグラウンドで行う"""
+        exited_at = datetime.now()  # シートに書き込む退室時刻
+        tracker = get_tracker()
+        row = tracker.open_row(student_id)
+        with self._lock:
+            visit = self._visits.pop(student_id, None)
+
+        if row or visit:
+            mutation = tracker.check_out(student_id, pending=True)
+            self._enqueue(student_id, self._commit_exit, student_id, student_name, row, visit,
+                          exited_at, mutation)
+        else:
+            tracker.check_out(student_id)
+
+    def _commit_exit(self, student_id: str, student_name: str, row: Optional[int],
+                     visit: Optional[PendingVisit], exited_at: datetime, mutation: int) -> None:
+        try:
+            self._write_exit(student_id, student_name, row, visit, exited_at)
+        finally:
+            get_tracker().confirm(student_id, mutation)
+
+    def _write_exit(self, student_id: str, student_name: str, row: Optional[int],
+                    visit: Optional[PendingVisit], exited_at: datetime) -> None:
+        if not row:
+            # 入室行の追加が終わる前に退室した：追加した行に退室を書き込む
+            if visit.row.exception() is not None:
+                return  # 入室の記録に失敗している（警告済み）
+            row = visit.row.result()
+        try:
+            if not is_open_row(row, student_id):
+                # 行がずれている・既に退室済みなど、手元の状態とシートが食い違う：
+                # この塾生の退室していない行をシートで探し直す（他の塾生の在室状況には触れない）
+                open_row, _ = get_last_record(student_id)
+                if not open_row:
+                    self.raise_alert(
+                        f"{student_name}さん（{student_id}）の退室を記録できませんでした: "
+                        f"シートの{row}行目が想定と異なり、退室していない入室記録も見つかりません"
+                    )
+                    return
+                self.raise_alert(
+                    f"{student_name}さん（{student_id}）のシートの{row}行目が想定と異なるため、"
+                    f"{open_row}行目に退室を記録します"
+                )
+                row = open_row
+            if not write_exit(row, exited_at):
+                raise RuntimeError("退室時刻を書き込めませんでした")
+        except Exception as e:
+            print(f"ERROR: Optimistic check-out failed for {student_id}: {e}")
+            if not get_tracker().is_checked_in(student_id):
+                get_tracker().check_in(student_id, row, student_name)  # 在室状況を元に戻す
+            self.raise_alert(f"{student_name}さん（{student_id}）の退室を記録できませんでした: {e}")
+
+    def has_pending(self) -> bool:
+        """シートへの書き込みが終わっていない入退室があるか"""
+        with self._lock:
+            return bool(self._visits or self._chains)
+
+    # --- 警告 ---
+    def raise_alert(self, message: str) -> None:
+        print(f"[スタッフ警告] {message}")
+        with self._lock:
+            self._alerts.append({"time": datetime.now(), "message": message})
+        self._notify()
+
+    def alerts(self) -> list[dict]:
+        with self._lock:
+            return list(self._alerts)
+
+    def clear_alerts(self) -> None:
+        with self._lock:
+            self._alerts.clear()
+        self._notify()
+
+    def add_listener(self, callback: Callable[[int], None]) -> None:
+        """警告の件数が変わったときに呼ばれるコールバックを登録する（呼び出しスレッドは任意）"""
+        self._listeners.append(callback)
+
+    def _notify(self) -> None:
+        with self._lock:
+            count = len(self._alerts)
+        for callback in list(self._listeners):
+            try:
+                callback(count)
+            except Exception as e:
+                print(f"[スタッフ警告] 通知の処理に失敗しました: {e}")
+
+    # --- 実行 ---
+    def _enqueue(self, student_id: str, fn, *args) -> None:
+        """同じ塾生の書き込みは前の書き込みが終わってから実行する"""
+        done: Future = Future()
+        with self._lock:
+            previous = self._chains.get(student_id)
+            self._chains[student_id] = done
+
+        def run():
+            try:
+                fn(*args)
+            finally:
+                with self._lock:
+                    if self._chains.get(student_id) is done:
+                        del self._chains[student_id]
+                done.set_result(None)
+
+        if previous is None:
+            self._submit(run)
+        else:
+            previous.add_done_callback(lambda _: self._submit(run))
+
+    @staticmethod
+    def _submit(fn, *args) -> None:
+        get_scheduler().submit("io", fn, *args, priority=PRIORITY_HIGH)
+
+
+_reconciler: Optional[CheckinReconciler] = None
+_reconciler_lock = threading.Lock()
+
+
+def get_reconciler() -> CheckinReconciler:
+    """プロセス全体で共有するインスタンスを返す"""
+    global _reconciler
+    with _reconciler_lock:
+        if _reconciler is None:
+            _reconciler = CheckinReconciler()
+        return _reconciler
@@ -15,11 +15,37 @@ LABEL_TEMPLATE = Path('label_template.lbx')
 import json
 
 from pathlib import Path
+from typing import Optional
 
 # Settings storage shared with the root application
 # Located two directories above this file (project root)
 SETTINGS_FILE = Path(__file__).resolve().parents[2] / 'settings.json'
 
+# Local cache of downloaded sheet values and other derived data
+CACHE_DIR = Path(__file__).resolve().parents[2] / 'cache'
+
+# Closed months moved out of the attendance sheet (not a cache; keep backed up)
+ARCHIVE_DIR = Path(__file__).resolve().parents[2] / 'archive'
+
+# Label print jobs waiting in the print spooler (survives restarts)
+PRINT_QUEUE_FILE = Path(__file__).resolve().parents[2] / 'print_queue.json'
+
+# Print history, one JSON Lines file per month (replaces HISTORY_FILE)
+PRINT_HISTORY_DIR = Path(__file__).resolve().parents[2] / 'print_history'
+
+# Japanese font used by the UI and printed labels (not in git; installed with the app).
+# assets/fonts/ is the packaged location, src/Font/ the legacy development location.
+FONT_FILE_NAME = 'UDDigiKyokashoN-R.ttc'
+FONT_SEARCH_PATHS = [
+    Path(__file__).resolve().parent / 'assets' / 'fonts' / FONT_FILE_NAME,
+    Path(__file__).resolve().parents[1] / 'Font' / FONT_FILE_NAME,
+]
+
+
+def find_font() -> Optional[Path]:
+    """Return the first existing font file in FONT_SEARCH_PATHS, or None."""
+    return next((path for path in FONT_SEARCH_PATHS if path.exists()), None)
+
 
 def load_settings() -> dict:
     """Load settings for the attendance app."""
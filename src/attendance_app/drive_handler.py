@@ -1,35 +1,107 @@
-
-
 import io
+import json
 import os
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
+# google-api-python-client は読み込みが重いため、起動を速くするよう使用時に読み込む
 # Kivyアプリ内の他モジュールから設定を読み込む
-from .config import load_settings
+from .config import CACHE_DIR, load_settings
 
 # スコープの定義 (読み取り専用)
 SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]
 
-def get_drive_service():
-    """Google Drive APIのサービスオブジェクトを生成して返す"""
-    # service_account.jsonへのパスを解決
-    # このファイル(drive_handler.py)から見て2階層上のservice_account.jsonを指す
-    creds_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "service_account.json"))
+# service_account.jsonへのパス（このファイルから見て2階層上）
+CREDENTIALS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "service_account.json"))
+# アクセストークンの期限がこれより近ければ、APIを呼ぶ前に更新しておく
+REFRESH_MARGIN = timedelta(minutes=5)
+HTTP_TIMEOUT = 60  # 秒
 
-    if not os.path.exists(creds_path):
-        print(f"エラー: service_account.json が見つかりません: {creds_path}")
-        return None
+_credentials = None
+_credentials_lock = threading.Lock()
+_discovery_document = None
+_discovery_lock = threading.Lock()
+# httplib2.Http はスレッドセーフではないため、サービスオブジェクトはスレッドごとに持つ
+_local = threading.local()
+
+
+def _get_credentials():
+    """サービスアカウントの認証情報（プロセス全体で1つ、ファイルは1回だけ読む）"""
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            if not os.path.exists(CREDENTIALS_PATH):
+                print(f"エラー: service_account.json が見つかりません: {CREDENTIALS_PATH}")
+                return None
+            from google.oauth2 import service_account
+            _credentials = service_account.Credentials.from_service_account_file(CREDENTIALS_PATH, scopes=SCOPES)
+        return _credentials
+
+
+def _refresh_if_needed(credentials) -> None:
+    """アクセストークンが無いか期限が近ければ、先に更新しておく"""
+    with _credentials_lock:
+        expiry = credentials.expiry  # UTC（タイムゾーン情報なし）
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        if credentials.token and expiry is not None and expiry - now > REFRESH_MARGIN:
+            return
+        try:
+            import httplib2
+            from google_auth_httplib2 import Request
 
+            credentials.refresh(Request(httplib2.Http(timeout=HTTP_TIMEOUT)))
+        except Exception as e:
+            # 更新できなくても、API呼び出し時の401で改めて更新が試みられる
+            print(f"Google Driveの認証情報の更新に失敗しました: {e}")
+
+
+def _get_discovery_document():
+    """
+    Drive API v3 のディスカバリードキュメント（1回だけ読み込んで使い回す）
+
+    google-api-python-client に同梱されている静的なドキュメントを使うので、ネットワークには取りに行かない。
+    """
+    global _discovery_document
+    with _discovery_lock:
+        if _discovery_document is None:
+            from googleapiclient import discovery_cache
+
+            document = discovery_cache.get_static_doc("drive", "v3")
+            if document is None:
+                raise RuntimeError("Drive API v3 のディスカバリードキュメントが見つかりません")
+            _discovery_document = json.loads(document)
+        return _discovery_document
+
+
+def get_drive_service():
+    """
+    Google Drive APIのサービスオブジェクトを返す
+
+    認証情報とディスカバリードキュメントはプロセス全体で共有し、サービスオブジェクトと
+    HTTP接続（keep-alive）はスレッドごとに1回だけ作って使い回す。
+    """
     try:
-        creds = service_account.Credentials.from_service_account_file(creds_path, scopes=SCOPES)
-        service = build("drive", "v3", credentials=creds)
+        credentials = _get_credentials()
+        if credentials is None:
+            return None
+        _refresh_if_needed(credentials)
+
+        service = getattr(_local, "service", None)
+        if service is None:
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+            from googleapiclient.discovery import build_from_document
+
+            http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+            service = build_from_document(_get_discovery_document(), http=http)
+            _local.service = service
         return service
     except Exception as e:
         print(f"Google Driveサービスへの接続中にエラー: {e}")
         return None
 
+
 def get_qr_download_path():
     """設定ファイルからQRコードのローカル保存パスを取得し、整形する"""
     settings = load_settings()
@@ -57,8 +129,122 @@ def get_qr_download_path():
         return fallback_path
 
 
-def list_qr_files_from_drive():
-    """設定されたGoogle DriveフォルダからPNGファイルの一覧を返す"""
+# --- QRコードフォルダの一覧 ---
+PAGE_SIZE = 1000  # files.list / changes.list の1ページの最大件数
+FILE_FIELDS = "id, name, md5Checksum, modifiedTime"
+
+# {フォルダID: {"page_token": str, "files": {ファイルID: ファイル情報}}}
+_listings: dict[str, dict] = {}
+_listing_lock = threading.Lock()
+
+
+def _listing_file(folder_id: str):
+    return CACHE_DIR / f"drive_listing_{folder_id}.json"
+
+
+def _load_listing(folder_id: str) -> Optional[dict]:
+    """保存済みの一覧（メモリ、なければディスク）"""
+    if folder_id in _listings:
+        return _listings[folder_id]
+    path = _listing_file(folder_id)
+    if not path.exists():
+        return None
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            listing = json.load(f)
+        if not listing.get("page_token") or not isinstance(listing.get("files"), dict):
+            return None
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"[Drive] 一覧のキャッシュの読み込みに失敗: {path} - {e}")
+        return None
+    _listings[folder_id] = listing
+    return listing
+
+
+def _save_listing(folder_id: str, listing: dict) -> None:
+    _listings[folder_id] = listing
+    path = _listing_file(folder_id)
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(listing, f, ensure_ascii=False)
+        tmp_path.replace(path)
+    except OSError as e:
+        print(f"[Drive] 一覧のキャッシュの保存に失敗: {path} - {e}")
+
+
+def _list_folder(service, folder_id: str) -> dict:
+    """フォルダのPNGファイルをすべてのページにわたって取得し、変更フィードの開始位置とともに返す"""
+    # 一覧の取得中に起きた変更を取りこぼさないよう、先に開始位置を取っておく
+    page_token = service.changes().getStartPageToken().execute()["startPageToken"]
+
+    files = {}
+    query = f"'{folder_id}' in parents and mimeType='image/png' and trashed=false"
+    next_page = None
+    while True:
+        results = service.files().list(
+            q=query,
+            pageSize=PAGE_SIZE,
+            pageToken=next_page,
+            fields=f"nextPageToken, files({FILE_FIELDS})"
+        ).execute()
+        for f in results.get("files", []):
+            files[f["id"]] = f
+        next_page = results.get("nextPageToken")
+        if not next_page:
+            break
+    print(f"[Drive] QRコードフォルダの一覧を取得しました: {len(files)}件")
+    return {"page_token": page_token, "files": files}
+
+
+def _apply_changes(service, folder_id: str, listing: dict) -> int:
+    """変更フィードで保存済みの一覧を最新にする（反映した変更の件数を返す）"""
+    files = listing["files"]
+    page_token = listing["page_token"]
+    applied = 0
+    while page_token:
+        results = service.changes().list(
+            pageToken=page_token,
+            pageSize=PAGE_SIZE,
+            spaces="drive",
+            includeRemoved=True,
+            fields=f"nextPageToken, newStartPageToken, "
+                   f"changes(fileId, removed, file({FILE_FIELDS}, mimeType, parents, trashed))"
+        ).execute()
+        for change in results.get("changes", []):
+            file_id = change.get("fileId")
+            f = change.get("file") or {}
+            in_folder = (
+                not change.get("removed")
+                and not f.get("trashed")
+                and f.get("mimeType") == "image/png"
+                and folder_id in f.get("parents", [])
+            )
+            if in_folder:
+                files[file_id] = {key: f[key] for key in ("id", "name", "md5Checksum", "modifiedTime") if key in f}
+                applied += 1
+            elif files.pop(file_id, None) is not None:
+                applied += 1
+        if results.get("newStartPageToken"):
+            listing["page_token"] = results["newStartPageToken"]
+            break
+        page_token = results.get("nextPageToken")
+        if page_token:
+            listing["page_token"] = page_token
+    return applied
+
+
+def list_qr_files_from_drive(full: bool = False) -> list[dict]:
+    """
+    設定されたGoogle DriveフォルダからPNGファイルの一覧を返す
+
+    初回はフォルダ全体をページ送りで取得してディスクに保存し、2回目以降は
+    Driveの変更フィード（changes.list）で変わった分だけを反映する。
+
+    Args:
+        full: True なら保存済みの一覧を使わずにフォルダ全体を取得し直す
+    """
     settings = load_settings()
     folder_id = settings.get("drive_qr_folder_id")
     if not folder_id:
@@ -69,41 +255,64 @@ def list_qr_files_from_drive():
     if not service:
         return []
 
-    try:
-        query = f"'{folder_id}' in parents and mimeType='image/png' and trashed=false"
-        results = service.files().list(
-            q=query,
-            pageSize=100,  # 最大100件まで取得
-            fields="nextPageToken, files(id, name)"
-        ).execute()
-        
-        return results.get("files", [])
-    except Exception as e:
-        print(f"Google Driveからのファイル一覧取得エラー: {e}")
-        return []
+    with _listing_lock:
+        listing = None if full else _load_listing(folder_id)
+        if listing is not None:
+            try:
+                applied = _apply_changes(service, folder_id, listing)
+                print(f"[Drive] 変更フィードから{applied}件の変更を反映しました（{len(listing['files'])}件）")
+                _save_listing(folder_id, listing)
+                return list(listing["files"].values())
+            except Exception as e:
+                # 開始位置が無効になった場合なども含め、フォルダ全体を取得し直す
+                print(f"[Drive] 変更フィードの取得に失敗したため一覧を取得し直します: {e}")
+                _listings.pop(folder_id, None)
 
-def download_file_from_drive(file_id, file_name):
-    """指定されたファイルをGoogle Driveからローカルパスにダウンロードする"""
+        try:
+            listing = _list_folder(service, folder_id)
+        except Exception as e:
+            print(f"Google Driveからのファイル一覧取得エラー: {e}")
+            return []
+        _save_listing(folder_id, listing)
+        return list(listing["files"].values())
+
+
+def download_file_from_drive(file_id, file_name, download_path=None):
+    """
+    指定されたファイルをGoogle Driveからローカルパスにダウンロードする
+
+    一時ファイルに書き込んでから置き換えるので、途中で失敗しても壊れたファイルは残らない。
+
+    Args:
+        download_path: 保存先のフォルダ（省略時は get_qr_download_path()）
+    """
     service = get_drive_service()
     if not service:
         return None
 
-    download_path = get_qr_download_path()
+    download_path = download_path or get_qr_download_path()
     file_path = os.path.join(download_path, file_name)
+    tmp_path = f"{file_path}.{threading.get_ident()}.part"
 
     try:
+        from googleapiclient.http import MediaIoBaseDownload
+
         request = service.files().get_media(fileId=file_id)
-        fh = io.FileIO(file_path, "wb")
-        downloader = MediaIoBaseDownload(fh, request)
-        
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-            # print(f"ダウンロード中 {file_name}: {int(status.progress() * 100)}%")
+        with io.FileIO(tmp_path, "wb") as fh:
+            downloader = MediaIoBaseDownload(fh, request)
+            
+            done = False
+            while not done:
+                status, done = downloader.next_chunk()
+                # print(f"ダウンロード中 {file_name}: {int(status.progress() * 100)}%")
+        os.replace(tmp_path, file_path)
         
         print(f"ダウンロード完了: {file_path}")
         return file_path
     except Exception as e:
         print(f"ダウンロードエラー ({file_name}): {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
         return None
-
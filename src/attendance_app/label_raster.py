@@ -0,0 +1,310 @@
+"""
+ラベルのラスター印刷（P-touch Editorを使わない印刷）
+
+QRコードと氏名のラベルをPILでテープの解像度（180dpi）の白黒画像として描き、
+Brother PTシリーズのラスターコマンド列にしてファイルまたはデバイスに書き込む。
+P-touch Editorを起動しないので、1枚あたり数秒かかっていた印刷がすぐに始まる。
+
+設定:
+- label_backend: "raster" にすると print_label / print_labels がこのモジュールで印刷する
+- label_device: コマンド列の書き込み先（Linuxの /dev/usb/lp0、Windowsの共有プリンター \\\\PC\\共有名 など）
+- label_tape_mm: テープ幅（mm、既定は24）
+
+氏名はアプリと同じフォント（config.find_font）で描く。見つからない場合は
+既定のフォントで代用せず、印刷をエラーにする。
+
+生成したコマンド列は入力とフォントが同じなら常に同じバイト列になるので、
+`python -m attendance_app.label_raster --golden testdata/label_raster` で
+リポジトリの見本（同じフォルダのフォントで描いたもの）と比較できる。
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+from .config import FONT_SEARCH_PATHS, find_font, load_settings
+from .qr_handler import qr_matrix
+
+DPI = 180
+HEAD_PINS = 128  # ヘッドのピン数（1ラスター行 = 16バイト）
+LINE_BYTES = HEAD_PINS // 8
+
+# テープ幅(mm) -> (印字できるピン数, 上側の余白ピン数)
+TAPE_SPECS = {
+    3.5: (24, 52),
+    6: (32, 48),
+    9: (50, 39),
+    12: (70, 29),
+    18: (112, 8),
+    24: (128, 0),
+}
+DEFAULT_TAPE_MM = 24
+FEED_MARGIN_DOTS = 14  # ラベルの前後の余白（約2mm）
+MIN_LENGTH_DOTS = 180  # ラベルの最小の長さ（約25mm）
+
+
+# --- 描画 ---
+def label_font() -> Path:
+    """ラベルに使うフォント（見つからなければ FileNotFoundError）"""
+    font_path = find_font()
+    if font_path is None:
+        raise FileNotFoundError(
+            f"ラベル用のフォントが見つかりません: {', '.join(map(str, FONT_SEARCH_PATHS))}"
+        )
+    return font_path
+
+
+def _load_font(size: int, font_path: Path):
+    from PIL import ImageFont
+
+    if not Path(font_path).exists():
+        raise FileNotFoundError(f"フォントが見つかりません: {font_path}")
+    return ImageFont.truetype(str(font_path), size)
+
+
+def render_label(student_id: str, student_name: str, tape_mm: float = DEFAULT_TAPE_MM,
+                 font_path: Optional[Path] = None):
+    """
+    ラベルの画像（モード"1"、高さ = 印字できるピン数、幅 = ラベルの長さ）を描く
+
+    左にQRコード（塾生番号）、右に氏名と塾生番号を置く。
+    font_path を省略するとアプリのフォント（label_font）を使う。
+    """
+    from PIL import Image, ImageDraw
+
+    pins, _ = _tape_spec(tape_mm)
+    font_path = font_path or label_font()
+
+    matrix = qr_matrix(student_id, border=1)
+    modules = len(matrix)
+    scale = max(1, pins // modules)
+    qr_size = modules * scale
+
+    name_font = _load_font(max(8, pins * 3 // 10), font_path)
+    id_font = _load_font(max(8, pins // 6), font_path)
+    gap = max(4, pins // 10)
+
+    measure = ImageDraw.Draw(Image.new("1", (1, 1)))
+    name_box = measure.textbbox((0, 0), student_name, font=name_font)
+    id_box = measure.textbbox((0, 0), str(student_id), font=id_font)
+    text_width = max(name_box[2] - name_box[0], id_box[2] - id_box[0])
+    length = max(MIN_LENGTH_DOTS, qr_size + gap + text_width + gap)
+
+    image = Image.new("1", (length, pins), 1)
+    top = (pins - qr_size) // 2
+    pixels = image.load()
+    for y, row in enumerate(matrix):
+        for x, dark in enumerate(row):
+            if dark:
+                for dy in range(scale):
+                    for dx in range(scale):
+                        pixels[x * scale + dx, top + y * scale + dy] = 0
+
+    draw = ImageDraw.Draw(image)
+    text_x = qr_size + gap
+    name_height = name_box[3] - name_box[1]
+    id_height = id_box[3] - id_box[1]
+    text_top = (pins - (name_height + gap // 2 + id_height)) // 2
+    draw.text((text_x - name_box[0], text_top - name_box[1]), student_name, font=name_font, fill=0)
+    draw.text((text_x - id_box[0], text_top + name_height + gap // 2 - id_box[1]),
+              str(student_id), font=id_font, fill=0)
+    return image
+
+
+def _tape_spec(tape_mm: float) -> tuple[int, int]:
+    if tape_mm not in TAPE_SPECS:
+        raise ValueError(f"対応していないテープ幅です: {tape_mm}mm（{', '.join(map(str, TAPE_SPECS))}）")
+    return TAPE_SPECS[tape_mm]
+
+
+# --- ラスターコマンド ---
+def packbits(data: bytes) -> bytes:
+    """TIFF PackBits 圧縮"""
+    out = bytearray()
+    i, n = 0, len(data)
+    while i < n:
+        # 同じバイトの繰り返し（2〜128個）
+        run = 1
+        while i + run < n and run < 128 and data[i + run] == data[i]:
+            run += 1
+        if run >= 2:
+            out.append(257 - run)  # -(run - 1) を符号なしで
+            out.append(data[i])
+            i += run
+            continue
+        # 繰り返さないバイトの並び（1〜128個）
+        start = i
+        i += 1
+        while i < n and i - start < 128 and not (i + 1 < n and data[i] == data[i + 1]):
+            i += 1
+        out.append(i - start - 1)
+        out.extend(data[start:i])
+    return bytes(out)
+
+
+def raster_lines(image, tape_mm: float = DEFAULT_TAPE_MM) -> list[bytes]:
+    """
+    ラベル画像をラスター行（ヘッド128ピン分 = 16バイト）に変換する
+
+    画像の1列が1ラスター行になり、画像の上端がテープ幅方向の余白の直後のピンに対応する。
+    """
+    pins, margin = _tape_spec(tape_mm)
+    width, height = image.size
+    if height != pins:
+        raise ValueError(f"画像の高さ({height})がテープの印字幅({pins}ピン)と一致しません")
+    pixels = image.load()
+    lines = []
+    for x in range(width):
+        bits = 0
+        for y in range(height):
+            if pixels[x, y] == 0:  # 黒
+                bits |= 1 << (HEAD_PINS - 1 - (margin + y))
+        lines.append(bits.to_bytes(LINE_BYTES, "big"))
+    return lines
+
+
+def _page_commands(lines: list[bytes], tape_mm: float, page_index: int, is_last: bool) -> bytes:
+    """1枚分のコマンド（印刷情報・各種モード・ラスターデータ・印刷指令）"""
+    out = bytearray()
+    count = len(lines)
+    # 印刷情報: 有効フラグ(テープ種類・幅を指定) / テープ種類(ラミネート) / 幅(mm) / 長さ / ラスター数 / ページ
+    out += b"\x1biz" + bytes([0x86, 0x01, int(tape_mm + 0.5), 0x00]) + count.to_bytes(4, "little")
+    out += bytes([0x00 if page_index == 0 else 0x02 if is_last else 0x01, 0x00])  # 最初 / 途中 / 最後のページ
+    out += b"\x1biM" + bytes([0x40])  # 各種モード: オートカット
+    out += b"\x1biK" + bytes([0x08])  # 拡張モード: 最後のラベルの後にカットする
+    out += b"\x1bid" + FEED_MARGIN_DOTS.to_bytes(2, "little")  # 前後の余白
+    out += b"M\x02"  # 圧縮モード: TIFF(PackBits)
+    for line in lines:
+        if not any(line):
+            out += b"Z"  # 全部白のラスター行
+            continue
+        packed = packbits(line)
+        out += b"G" + len(packed).to_bytes(2, "little") + packed
+    out += b"\x1a" if is_last else b"\x0c"  # 印刷指令（最後のページは排出あり）
+    return bytes(out)
+
+
+def build_job(labels: list[tuple[str, str]], tape_mm: float = DEFAULT_TAPE_MM,
+              font_path: Optional[Path] = None) -> bytes:
+    """
+    複数のラベル（塾生番号, 氏名）を1つの印刷ジョブのコマンド列にする
+    （font_path を省略するとアプリのフォント）
+    """
+    if not labels:
+        return b""
+    font_path = font_path or label_font()
+    out = bytearray()
+    out += b"\x00" * 100  # 無効コマンド（前回の中途半端なデータを捨てさせる）
+    out += b"\x1b@"  # 初期化
+    out += b"\x1bia\x01"  # ラスターモードに切り替え
+    for i, (student_id, student_name) in enumerate(labels):
+        image = render_label(student_id, student_name, tape_mm, font_path)
+        out += _page_commands(raster_lines(image, tape_mm), tape_mm, i, i == len(labels) - 1)
+    return bytes(out)
+
+
+# --- 出力 ---
+def _settings() -> tuple[str, float]:
+    settings = load_settings()
+    device = settings.get("label_device", "").strip()
+    if not device:
+        raise FileNotFoundError("ラベルプリンターの出力先（label_device）が設定されていません")
+    return device, float(settings.get("label_tape_mm", DEFAULT_TAPE_MM))
+
+
+def write_job(data: bytes, device: str) -> None:
+    """コマンド列をファイルまたはデバイスに書き込む"""
+    with open(device, "wb") as f:
+        f.write(data)
+        f.flush()
+
+
+def print_labels_raster(labels: list[tuple[str, str]]) -> None:
+    """設定の出力先にラベルを印刷する（1回の書き込みで全ラベル）"""
+    device, tape_mm = _settings()
+    data = build_job(labels, _normalize_tape(tape_mm))
+    print(f"[ラスター印刷] {len(labels)}枚 / {len(data)}バイトを書き込みます: {device}")
+    write_job(data, device)
+
+
+def _normalize_tape(tape_mm: float) -> float:
+    """3.5mm以外は整数のテープ幅にする"""
+    return tape_mm if tape_mm == 3.5 else int(tape_mm)
+
+
+def is_enabled() -> bool:
+    return load_settings().get("label_backend", "ptouch") == "raster"
+
+
+# --- ゴールデンファイル比較 ---
+GOLDEN_DIR = Path(__file__).resolve().parents[2] / "testdata" / "label_raster"
+GOLDEN_FONT = "Lato-Regular.ttf"  # 見本を描くフォント（見本と同じフォルダに置く）
+GOLDEN_SAMPLES = [
+    ("1001", "Taro Yamada", 24),
+    ("20230415", "Hanako Suzuki", 24),
+    ("7", "Ken", 12),
+    ("123456", "A. Very Long Student Name", 18),
+]
+
+
+def _golden_name(student_id: str, tape_mm: float) -> str:
+    return f"label_{student_id}_{tape_mm}mm.bin"
+
+
+def check_golden(folder: Path = GOLDEN_DIR, update: bool = False) -> int:
+    """
+    見本のラベルのコマンド列を保存済みのファイルと比較する（不一致・見本がない数を返す）
+
+    環境によるフォントの差が出ないよう、見本はフォルダに置いたフォント（GOLDEN_FONT）で描く。
+    update=True なら現在の結果で保存済みのファイルを作り直す。
+    """
+    font_path = folder / GOLDEN_FONT
+    if not font_path.exists():
+        raise FileNotFoundError(f"見本用のフォントが見つかりません: {font_path}")
+    mismatches = 0
+    for student_id, name, tape_mm in GOLDEN_SAMPLES:
+        data = build_job([(student_id, name)], tape_mm, font_path=font_path)
+        path = folder / _golden_name(student_id, tape_mm)
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        if update:
+            path.write_bytes(data)
+            print(f"保存しました: {path.name} ({len(data)}バイト, {digest})")
+            continue
+        if not path.exists():
+            mismatches += 1
+            print(f"見本がありません: {path.name}（--update で作成できます）")
+            continue
+        expected = path.read_bytes()
+        if expected == data:
+            print(f"一致: {path.name}")
+        else:
+            mismatches += 1
+            first_diff = next((i for i, (a, b) in enumerate(zip(expected, data)) if a != b),
+                              min(len(expected), len(data)))
+            print(f"不一致: {path.name}（{len(expected)}→{len(data)}バイト、{first_diff}バイト目から異なる）")
+    return mismatches
+
+
+if __name__ == "__main__":
+    # 使い方:
+    #   python -m attendance_app.label_raster --golden testdata/label_raster [--update]
+    #   python -m attendance_app.label_raster --id 1001 --name 山田太郎 --out label.bin [--tape 24]
+    parser = argparse.ArgumentParser(description="Brother PTシリーズ用のラベルのラスターデータを生成する")
+    parser.add_argument("--golden", type=Path, help="見本のラベルを保存済みのファイルと比較するフォルダ")
+    parser.add_argument("--update", action="store_true", help="見本のファイルを現在の結果で置き換える")
+    parser.add_argument("--id", help="塾生番号")
+    parser.add_argument("--name", default="", help="氏名")
+    parser.add_argument("--tape", type=float, default=DEFAULT_TAPE_MM, help="テープ幅(mm)")
+    parser.add_argument("--out", help="書き込み先のファイルまたはデバイス")
+    args = parser.parse_args()
+
+    if args.golden:
+        sys.exit(1 if check_golden(args.golden, args.update) else 0)
+    if not args.id or not args.out:
+        parser.error("--golden か、--id と --out を指定してください")
+    job = build_job([(args.id, args.name)], _normalize_tape(args.tape))
+    write_job(job, args.out)
+    print(f"{len(job)}バイトを書き込みました: {os.path.abspath(args.out)}")
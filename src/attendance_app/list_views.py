@@ -0,0 +1,182 @@
+"""
+データ駆動のリスト表示（RecycleView）
+
+塾生一覧・レポート一覧のように行数が多いリストで、行ごとにウィジェットを作る代わりに
+表示されている分の行ウィジェットだけを作って使い回す。
+リストの中身は dict のリスト（data）で渡し、更新時は変わった行だけを差し替える。
+
+行の種類:
+- "ListButtonRow": 1行1ボタン（押すと "select" を通知）
+- "ReportRow": ファイル名・サイズ・開く・削除（"open" / "delete" を通知）
+- "ListMessageRow": 読み込み中・0件などのメッセージ
+"""
+
+from typing import Callable, Optional
+
+from kivy.factory import Factory
+from kivy.metrics import dp, dpi2px
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.label import Label
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+
+
+class _RowBehavior(RecycleDataViewBehavior):
+    """表示中の行番号と所属するリストを覚えておき、操作をリストに通知する"""
+
+    index = None
+    list_view = None
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.index = index
+        self.list_view = rv
+        return super().refresh_view_attrs(rv, index, data)
+
+    def notify(self, action: str) -> None:
+        if self.list_view is not None and self.index is not None:
+            self.list_view.dispatch_action(action, self.index)
+
+
+class ListButtonRow(_RowBehavior, Button):
+    """1行1ボタンの行"""
+
+    def on_release(self):
+        self.notify("select")
+
+
+class ListMessageRow(_RowBehavior, Label):
+    """メッセージだけの行（クリックしても何もしない）"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.halign = "center"
+        self.valign = "middle"
+        self.bind(width=lambda instance, value: setattr(instance, "text_size", (value * 0.9, None)))
+
+
+class ReportRow(_RowBehavior, BoxLayout):
+    """生成済みレポートの行（ファイル名・サイズ・開く・削除）"""
+
+    def __init__(self, **kwargs):
+        super().__init__(orientation="horizontal", spacing=10, **kwargs)
+        self.name_label = Label(size_hint_x=0.6, halign="left", valign="middle",
+                                color=(0.17, 0.24, 0.31, 1))  # ダークブルーグレー
+        self.name_label.bind(size=lambda instance, value: setattr(instance, "text_size", value))
+        self.size_label = Label(size_hint_x=0.15, color=(0.5, 0.5, 0.5, 1))
+        self.open_button = Button(text="開く", size_hint_x=0.125,
+                                  background_color=(0.286, 0.796, 0.98, 1))
+        self.delete_button = Button(text="削除", size_hint_x=0.125,
+                                    background_color=(0.85, 0.40, 0.40, 1))  # 赤色
+        self.open_button.bind(on_press=lambda *_: self.notify("open"))
+        self.delete_button.bind(on_press=lambda *_: self.notify("delete"))
+        for widget in (self.name_label, self.size_label, self.open_button, self.delete_button):
+            self.add_widget(widget)
+
+    def refresh_view_attrs(self, rv, index, data):
+        # 子ウィジェットへ振り分けるので、data のキーを自分の属性には設定しない
+        self.index = index
+        self.list_view = rv
+        font_name = data.get("font_name", "Roboto")
+        self.name_label.text = data.get("name", "")
+        self.size_label.text = data.get("size_formatted", "")
+        for widget in (self.name_label, self.size_label, self.open_button, self.delete_button):
+            widget.font_name = font_name
+
+
+for _cls in (ListButtonRow, ListMessageRow, ReportRow):
+    Factory.register(_cls.__name__, cls=_cls)
+
+
+class DataListView(RecycleView):
+    """
+    dict のリストを表示する RecycleView
+
+    各行の dict には "key"（行を識別する値）を入れておく。
+    行の種類を変えるときは "viewclass" を、高さを変えるときは "height" を指定する。
+    """
+
+    def __init__(self, viewclass: str, row_height="40dp", spacing=5,
+                 on_action: Optional[Callable[[str, dict], None]] = None, **kwargs):
+        """
+        Args:
+            viewclass: 既定の行の種類（Factoryに登録済みのクラス名）
+            row_height: 既定の行の高さ
+            spacing: 行の間隔
+            on_action: 行が操作されたときに (操作名, 行のdict) で呼ばれる関数
+        """
+        super().__init__(**kwargs)
+        self.on_action = on_action
+        self.viewclass = viewclass
+        layout = RecycleBoxLayout(
+            orientation="vertical",
+            default_size=(None, _to_px(row_height)),
+            default_size_hint=(1, None),
+            key_size="size",
+            size_hint_y=None,
+            spacing=spacing,
+        )
+        layout.bind(minimum_height=layout.setter("height"))
+        self.add_widget(layout)
+        self.layout_manager = layout
+
+    def set_items(self, items: list[dict]) -> None:
+        """
+        表示する行を差し替える
+
+        行の並び（key）が同じなら変わった行だけを更新し、末尾に追加されただけなら追加分だけを足す。
+        それ以外はまとめて入れ替える。
+        """
+        items = [self._with_size(item) for item in items]
+        current = self.data
+        old_keys = [row.get("key") for row in current]
+        new_keys = [row.get("key") for row in items]
+
+        if old_keys == new_keys:
+            for i, (old, new) in enumerate(zip(current, items)):
+                if old != new:
+                    current[i] = new
+        elif old_keys and new_keys[:len(old_keys)] == old_keys and items[:len(current)] == list(current):
+            current.extend(items[len(current):])
+        else:
+            self.data = items
+            self.scroll_y = 1
+
+    def show_message(self, text: str, color=(0.5, 0.5, 0.5, 1), height="60dp", **attrs) -> None:
+        """リストの代わりにメッセージを1行だけ表示する"""
+        self.set_items([{
+            "key": ("__message__", text),
+            "viewclass": "ListMessageRow",
+            "text": text,
+            "color": color,
+            "height": height,
+            **attrs,
+        }])
+
+    def dispatch_action(self, action: str, index: int) -> None:
+        if self.on_action is None or index >= len(self.data):
+            return
+        self.on_action(action, self.data[index])
+
+    @staticmethod
+    def _with_size(item: dict) -> dict:
+        """"height" の指定を RecycleBoxLayout が読む "size" に変換する"""
+        height = item.get("height")
+        if height is None or "size" in item:
+            return item
+        item = dict(item)
+        item["size"] = (None, _to_px(height))
+        del item["height"]
+        return item
+
+
+def _to_px(value) -> float:
+    """"40dp" のような文字列をピクセル数に変換する（数値はdpとみなす）"""
+    if isinstance(value, (int, float)):
+        return dp(value)
+    text = str(value)
+    for unit in ("dp", "sp", "pt", "mm", "cm", "in", "px"):
+        if text.endswith(unit):
+            return dpi2px(text[:-len(unit)], unit)
+    return float(text)
@@ -10,14 +10,14 @@ with open(log_path, "w", encoding="utf-8") as f:
     f.write(f"sys.path: {sys.path}\n")
 # --- End Debug ---
 
-import threading
+import importlib
 import importlib.resources as res  # 3.9+ 標準
+import multiprocessing
 
 from datetime import datetime
 from pathlib import Path
 import subprocess
 
-import openpyxl
 from kivy.app import App
 from kivy.clock import Clock
 from kivy.core.text import LabelBase
@@ -32,23 +32,30 @@ from kivy.uix.scrollview import ScrollView
 from kivy.uix.textinput import TextInput
 from kivy.uix.togglebutton import ToggleButton
 from kivy.core.window import Window
-from kivy.core.audio import SoundLoader
 
 try:
-    from .config import load_settings, save_settings
-    from .spreadsheet import get_student_name, get_last_record, write_exit, append_entry, write_response
-    from .main_printer import PrintScreen # PrintScreenをインポート
-    from .report_screen import ReportScreen # ReportScreenをインポート
-    from .report_editor_screen import ReportEditorScreen # ReportEditorScreenをインポート
+    from .config import FONT_SEARCH_PATHS, find_font, load_settings, save_settings
+    from .spreadsheet import get_student_name, get_last_record, is_open_row, write_exit, append_entry, write_response
+    from .occupancy import get_tracker
+    from .scan_dispatcher import ScanDispatcher
+    from .task_scheduler import get_scheduler
+    from .checkin_reconciler import get_reconciler, is_optimistic_enabled
+    from .warmup import Warmup
+    from .asset_registry import AssetRegistry
+    from .print_spooler import get_spooler
 except ImportError as e:
     print(f"相対インポートに失敗、絶対インポートを試行します: {e}")
     try:
         # PyInstallerで実行される場合は絶対インポート
-        from attendance_app.config import load_settings, save_settings
-        from attendance_app.spreadsheet import get_student_name, get_last_record, write_exit, append_entry, write_response
-        from attendance_app.main_printer import PrintScreen # PrintScreenをインポート
-        from attendance_app.report_screen import ReportScreen # ReportScreenをインポート
-        from attendance_app.report_editor_screen import ReportEditorScreen # ReportEditorScreenをインポート
+        from attendance_app.config import FONT_SEARCH_PATHS, find_font, load_settings, save_settings
+        from attendance_app.spreadsheet import get_student_name, get_last_record, is_open_row, write_exit, append_entry, write_response
+        from attendance_app.occupancy import get_tracker
+        from attendance_app.scan_dispatcher import ScanDispatcher
+        from attendance_app.task_scheduler import get_scheduler
+        from attendance_app.checkin_reconciler import get_reconciler, is_optimistic_enabled
+        from attendance_app.warmup import Warmup
+        from attendance_app.asset_registry import AssetRegistry
+        from attendance_app.print_spooler import get_spooler
     except ImportError as e2:
         print(f"絶対インポートも失敗しました: {e2}")
         print("必要なモジュールがインポートできません。アプリケーションを終了します。")
@@ -73,23 +80,15 @@ def register_font() -> bool:
     フォントを安全に登録する。
 
     1. パッケージ同梱 assets/fonts/ を優先
-    2. 開発時のみ BASE_DIR/Font/ も探す（後方互換）
+    2. 開発時のみ src/Font/ も探す（後方互換）
+    （探す場所は config.FONT_SEARCH_PATHS。ラベルのラスター印刷も同じ場所を使う）
     """
-    # --- ① パッケージ内リソースを探す ------------------------
-    try:
-        with res.path("src.attendance_app.assets.fonts", "UDDigiKyokashoN-R.ttc") as p:
-            LabelBase.register(name="UDDigiKyokashoN-R", fn_regular=str(p))
-            return True
-    except FileNotFoundError:
-        pass  # 見つからなければ次へ
-
-    # --- ② 従来の BASE_DIR/Font/ も試す ----------------------
-    legacy_path = Path(__file__).resolve().parent.parent / "Font" / "UDDigiKyokashoN-R.ttc"
-    if legacy_path.exists():
-        LabelBase.register(name="UDDigiKyokashoN-R", fn_regular=str(legacy_path))
+    font_path = find_font()
+    if font_path:
+        LabelBase.register(name="UDDigiKyokashoN-R", fn_regular=str(font_path))
         return True
 
-    print(f"Warning: フォントが見つかりません -> {legacy_path}")
+    print(f"Warning: フォントが見つかりません -> {', '.join(map(str, FONT_SEARCH_PATHS))}")
     return False
 
 
@@ -133,6 +132,10 @@ def get_sound_path(filename: str) -> str:
         # どこにも無ければ警告だけ出して空文字を返す
         print(f"Warning: 音声ファイルが見つかりません -> {legacy}")
         return ""
+
+# 画像・音声の登録簿（パスの解決と読み込みは1回だけ行う）
+ASSETS = AssetRegistry(get_image_path, get_sound_path)
+
     # --- エラーハンドリング付きユーティリティ関数 ---
 def show_error_popup(title, message):
     """エラーメッセージを表示するポップアップ - 改善されたデザイン"""
@@ -234,14 +237,11 @@ class WaitScreen(Screen):
     def __init__(self, **kw):
         super().__init__(**kw)
         self._keyboard = None
+        # 同じ塾生のスキャンは順番に、別の塾生は並行して処理する
+        self.dispatcher = ScanDispatcher(self._process_student_id)
         
-        # 音声ファイルを読み込み
-        try:
-            sound_path = get_sound_path("selected_sound.mp3")
-            self.sound = SoundLoader.load(sound_path) if sound_path else None
-        except Exception as e:
-            print(f"音声ファイルの読み込みに失敗しました: {e}")
-            self.sound = None
+        # 音声ファイルを読み込み（全画面で共有）
+        self.sound = ASSETS.sound("selected_sound.mp3")
         
         # 背景色設定（薄いグレー）
         from kivy.graphics import Color, Rectangle
@@ -302,12 +302,75 @@ class WaitScreen(Screen):
         btn.bind(on_press=self.on_submit)
         input_container.add_widget(btn)
         
+        # 起動時の準備状況の表示
+        self.warmup_label = Label(
+            text="",
+            font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
+            font_size="16sp",
+            size_hint_y=None,
+            height="30dp",
+            color=(0.5, 0.5, 0.5, 1)
+        )
+        input_container.add_widget(self.warmup_label)
+        
+        # 在室人数の表示
+        self.headcount_label = Label(
+            text="",
+            font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
+            font_size="20sp",
+            size_hint_y=None,
+            height="40dp",
+            color=(0.4, 0.4, 0.4, 1)
+        )
+        input_container.add_widget(self.headcount_label)
+        get_tracker().add_listener(
+            lambda count: Clock.schedule_once(lambda dt: self._update_headcount(count), 0)
+        )
+        
+        # スタッフ向け警告の件数表示（楽観的な入退室処理の書き込み失敗など）
+        self.alert_label = Label(
+            text="",
+            font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
+            font_size="18sp",
+            size_hint_y=None,
+            height="30dp",
+            color=(0.85, 0.2, 0.2, 1)
+        )
+        input_container.add_widget(self.alert_label)
+        get_reconciler().add_listener(
+            lambda count: Clock.schedule_once(lambda dt: self._update_alerts(count), 0)
+        )
+        
         layout.add_widget(input_container)
         root.add_widget(layout)
         self.add_widget(root)
     
+    def _update_headcount(self, count):
+        """在室人数の表示を更新"""
+        self.headcount_label.text = f"在室中: {count}人" if get_tracker().is_seeded else ""
+    
+    def update_warmup(self, warmup):
+        """起動時の準備状況の表示を更新（準備が完了したら消す）"""
+        self.warmup_label.text = "" if warmup.is_ready else warmup.summary()
+    
+    def _update_alerts(self, count):
+        """スタッフ向け警告の件数表示を更新"""
+        self.alert_label.text = f"スタッフ確認が必要な記録: {count}件（Alt+A）" if count else ""
+    
+    def show_staff_alerts(self):
+        """スタッフ向け警告を表示して既読にする"""
+        reconciler = get_reconciler()
+        alerts = reconciler.alerts()
+        if not alerts:
+            show_error_popup("スタッフ確認", "確認が必要な記録はありません")
+            return
+        message = "\n\n".join(f"{a['time'].strftime('%H:%M:%S')} {a['message']}" for a in alerts)
+        show_error_popup("スタッフ確認", message)
+        reconciler.clear_alerts()
+    
     def on_enter(self):
         """画面が表示されるタイミングでキーボード監視を開始"""
+        self._update_headcount(get_tracker().headcount())
         self._keyboard = Window.request_keyboard(self._keyboard_closed, self)
         if self._keyboard:
             self._keyboard.bind(on_key_down=self._on_keyboard_down)
@@ -331,6 +394,8 @@ class WaitScreen(Screen):
                 setattr(self.manager, "current", "print_screen")
             elif keycode[1] == 'r':
                 setattr(self.manager, "current", "report")
+            elif keycode[1] == 'a':
+                self.show_staff_alerts()
         return True
         
     def _update_rect(self, instance, value):
@@ -383,12 +448,11 @@ class WaitScreen(Screen):
             print("DEBUG: Student ID is empty, returning.")
             return
 
-        app = App.get_running_app()
-        app.student_id = sid # Store student_id for later use
-        self.manager.current = "loading" # Show loading screen
-
-        # Run the processing in a separate thread
-        threading.Thread(target=self._process_student_id, args=(sid,)).start()
+        # 重複スキャンでなければ処理を受け付ける
+        if self.dispatcher.submit(sid):
+            app = App.get_running_app()
+            app.student_id = sid # Store student_id for later use
+            self.manager.current = "loading" # Show loading screen
 
         self.input.text = ""
         # ヒントテキストと色を元に戻す
@@ -418,7 +482,23 @@ class WaitScreen(Screen):
                 Clock.schedule_once(lambda dt: setattr(self.manager, "current", "wait"), 0)
                 return
             
-            last_row, last_exit = get_last_record(sid)
+            tracker = get_tracker()
+            seeded = tracker.ensure_current()
+            if is_optimistic_enabled() and seeded:
+                self._process_optimistic(sid, name)
+                return
+            if seeded:
+                last_row, last_exit = tracker.open_row(sid), None
+                if last_row and not is_open_row(last_row, sid):
+                    # 手元の行番号がずれている・退室済み（GAS・別のキオスク・スタッフの編集など）：
+                    # この塾生の退室していない行をシートで探し直す
+                    print(f"WARNING: Row {last_row} is no longer the open visit of {sid}; looking it up again")
+                    last_row, last_exit = get_last_record(sid)
+                    if not last_row:
+                        tracker.check_out(sid)  # シート上は退室済みなので、今回は入室として扱う
+            else:
+                # 在室状況を読み込めない場合はシートから直接確認する
+                last_row, last_exit = get_last_record(sid)
             print(f"DEBUG: Last record for {sid}: row={last_row}, exit_time={last_exit}")
 
             # ── 退室処理 ──
@@ -426,6 +506,7 @@ class WaitScreen(Screen):
                 print(f"DEBUG: Attempting to write exit for {sid} at row {last_row}")
                 if write_exit(last_row):
                     print(f"DEBUG: Exit written successfully for {sid} at row {last_row}")
+                    tracker.check_out(sid)
                     app.student_name = name
                     Clock.schedule_once(lambda dt: setattr(self.manager, "current", "goodbye"), 0)
                 else:
@@ -438,7 +519,9 @@ class WaitScreen(Screen):
                 row_idx = append_entry(sid, name)
                 if row_idx is not None:
                     print(f"DEBUG: Entry appended successfully at row {row_idx}")
+                    tracker.check_in(sid, row_idx, name)
                     app.current_record_row = row_idx
+                    app.current_visit = None
                     app.student_name = name
                     Clock.schedule_once(lambda dt: setattr(self.manager, "current", "greeting"), 0)
                 else:
@@ -449,6 +532,22 @@ class WaitScreen(Screen):
             Clock.schedule_once(lambda dt: show_error_popup("エラー", f"処理中にエラーが発生しました: {e}"), 0)
 
 
+    def _process_optimistic(self, sid, name):
+        """在室状況だけで入退室を判定して画面を進め、シートへの書き込みは後で行う"""
+        app = App.get_running_app()
+        reconciler = get_reconciler()
+        app.student_name = name
+        if get_tracker().is_checked_in(sid):
+            print(f"DEBUG: Optimistic exit for {sid}")
+            reconciler.check_out(sid, name)
+            Clock.schedule_once(lambda dt: setattr(self.manager, "current", "goodbye"), 0)
+        else:
+            print(f"DEBUG: Optimistic entry for {sid}")
+            app.current_visit = reconciler.check_in(sid, name)
+            app.current_record_row = None
+            Clock.schedule_once(lambda dt: setattr(self.manager, "current", "greeting"), 0)
+
+
 class GreetingScreen(Screen):
     def on_enter(self):
         self.clear_widgets()
@@ -495,12 +594,7 @@ class QuestionScreen(Screen):
         self.next_screen = next_screen
         self.question_type = question_type
         self.answer_selected = False  # 重複回答防止フラグ
-        try:
-            sound_path = get_sound_path("selected_sound.mp3")
-            self.sound = SoundLoader.load(sound_path) if sound_path else None
-        except Exception as e:
-            print(f"音声ファイルの読み込みに失敗しました: {e}")
-            self.sound = None
+        self.sound = ASSETS.sound("selected_sound.mp3")
 
         # 背景を白色に設定
         from kivy.graphics import Color, Rectangle
@@ -570,7 +664,7 @@ class QuestionScreen(Screen):
         ]
 
         for filename, value in weather_options:
-            image_path = get_image_path("weather", filename)
+            image_path = ASSETS.image("weather", filename)
             if image_path:
                 btn = WeatherToggle(
                     background_normal=image_path,
@@ -614,7 +708,7 @@ class QuestionScreen(Screen):
         ]
 
         for filename, value in sleep_options:
-            image_path = get_image_path("sleep", filename)
+            image_path = ASSETS.image("sleep", filename)
             if image_path:
                 btn = WeatherToggle(
                     background_normal=image_path,
@@ -656,7 +750,7 @@ class QuestionScreen(Screen):
         ]
 
         for filename, value in purpose_images:
-            image_path = get_image_path("purpose", filename)
+            image_path = ASSETS.image("purpose", filename)
             if image_path:
                 btn = WeatherToggle(
                     background_normal=image_path,
@@ -736,6 +830,13 @@ class QuestionScreen(Screen):
         print(f"現在の記録行: {app.current_record_row}")
         print(f"次の画面: {self.next_screen}")
         
+        # 楽観的な入室処理中：入室行の追加に続けてバックグラウンドで書き込む
+        if getattr(app, "current_visit", None) is not None:
+            get_reconciler().write_answer(app.current_visit, col, value)
+            Clock.schedule_once(lambda dt: setattr(self.manager, "current", self.next_screen), 0.8)
+            print(f"=== on_answer デバッグ終了 ===")
+            return
+        
         try:
             print(f"write_response を呼び出し中...")
             result = write_response(app.current_record_row, col, value)
@@ -1200,7 +1301,6 @@ class SettingsScreen(Screen):
     def auto_find_ptouch_editor(self, instance):
         """プログラムファイル内でP-touch Editorを自動検索する"""
         import os
-        import threading
         
         def search_ptouch_editor():
             possible_paths = [
@@ -1230,7 +1330,7 @@ class SettingsScreen(Screen):
         show_error_popup("検索中", "P-touch Editorを検索中です...")
         
         # 別スレッドで検索実行
-        threading.Thread(target=search_ptouch_editor).start()
+        get_scheduler().submit("io", search_ptouch_editor)
     
     def _update_ptouch_path(self, path):
         """検索結果でパスを更新する"""
@@ -1244,12 +1344,14 @@ class SettingsScreen(Screen):
         self.ptouch_path_input.text = data.get('ptouch_editor_path', r'C:\Program Files (x86)\Brother\Ptedit54\ptedit54.exe')
 
     def on_save(self, *_):
-        data = {
+        # 画面にない設定項目（scan_duplicate_window など）は残す
+        data = load_settings()
+        data.update({
             'spreadsheet_id': self.spread_input.text.strip(),
             'drive_qr_folder_id': self.folder_input.text.strip(),  # 統一したフィールド名
             'qr_code_folder': self.qr_folder_input.text.strip(),
             'ptouch_editor_path': self.ptouch_path_input.text.strip(),
-        }
+        })
         save_settings(data)
         self.manager.current = "wait"
 
@@ -1288,6 +1390,39 @@ class LoadingScreen(Screen):
 
 
 # --- アプリ本体 ---
+def _screen_factory(module_name, class_name):
+    """
+    スタッフ用画面のモジュールを初めて表示するときに読み込んで画面を作成する関数を返す
+    （印刷・レポート画面は Drive API・openpyxl・reportlab などを読み込むため起動時には作らない）
+    """
+    def factory(name):
+        package = __package__ or "attendance_app"  # PyInstallerで実行される場合は絶対インポート
+        module = importlib.import_module(f"{package}.{module_name}")
+        return getattr(module, class_name)(name=name)
+    return factory
+
+
+class LazyScreenManager(ScreenManager):
+    """登録しておいた画面を、最初にその画面へ切り替えるときに作成するScreenManager"""
+
+    def __init__(self, **kwargs):
+        self._factories = {}
+        super().__init__(**kwargs)
+
+    def register_lazy(self, name, factory):
+        self._factories[name] = factory
+
+    def ensure_screen(self, name):
+        factory = self._factories.pop(name, None)
+        if factory and not self.has_screen(name):
+            print(f"DEBUG: Building screen '{name}' on first use")
+            self.add_widget(factory(name))
+
+    def on_current(self, instance, value):
+        self.ensure_screen(value)
+        super().on_current(instance, value)
+
+
 class AttendanceApp(App):
     def build(self):
         # スプレッドシートIDが設定されているか確認
@@ -1295,14 +1430,23 @@ class AttendanceApp(App):
         if not settings.get('spreadsheet_id'):
             show_error_popup("警告", "スプレッドシートIDが設定されていません")
 
-        sm = ScreenManager(transition=FadeTransition())
+        # アンケートのアイコンを先に読み込んでおく
+        ASSETS.preload()
+
+        sm = LazyScreenManager(transition=FadeTransition())
         self.screen_manager = sm
-        sm.add_widget(WaitScreen(name="wait"))
+        # 認証・名簿・今日の出席記録などを裏で先に読み込んでおく
+        self.warmup = Warmup()
+        wait_screen = WaitScreen(name="wait")
+        self.warmup.add_listener(
+            lambda warmup: Clock.schedule_once(lambda dt: wait_screen.update_warmup(warmup), 0)
+        )
+        sm.add_widget(wait_screen)
         sm.add_widget(SettingsScreen(name="settings"))
         sm.add_widget(LoadingScreen(name="loading"))
-        sm.add_widget(PrintScreen(name="print_screen")) # PrintScreenを追加
-        sm.add_widget(ReportScreen(name="report")) # ReportScreenを追加
-        sm.add_widget(ReportEditorScreen(name="report_editor")) # ReportEditorScreenを追加
+        sm.register_lazy("print_screen", _screen_factory("main_printer", "PrintScreen"))
+        sm.register_lazy("report", _screen_factory("report_screen", "ReportScreen"))
+        sm.register_lazy("report_editor", _screen_factory("report_editor_screen", "ReportEditorScreen"))
         sm.add_widget(GreetingScreen(name="greeting"))
 
         # 各質問画面
@@ -1336,6 +1480,10 @@ class AttendanceApp(App):
 
         sm.add_widget(WelcomeScreen(name="welcome"))
         sm.add_widget(GoodbyeScreen(name="goodbye"))
+
+        self.warmup.start()
+        # 前回の終了時に残っていた印刷ジョブを再開する
+        get_spooler().start()
         return sm
 
 
@@ -1347,6 +1495,9 @@ def main() -> None:
     CLI エントリポイント.
     `python -m attendance_app` から呼ばれる。
     """
+    # QRコードの事前生成でプロセスプールを使うため、exe化したときに子プロセスが
+    # アプリを起動し直さないようにする
+    multiprocessing.freeze_support()
     # 既存の GUI 起動処理を呼び出す
     AttendanceApp().run()
 
@@ -1,52 +1,43 @@
 from pathlib import Path
 import sys
-import threading
 import os # osをインポート
 import time # timeをインポート
+import threading
 
 from kivy.app import App
 from kivy.uix.screenmanager import Screen
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.gridlayout import GridLayout
+from kivy.uix.textinput import TextInput
+from kivy.uix.togglebutton import ToggleButton
 from kivy.clock import Clock
 from kivy.core.text import LabelBase
 from kivy.uix.image import Image # Imageをインポート
 
 # --- アプリ内モジュール ---
 from .drive_handler import list_qr_files_from_drive, download_file_from_drive, get_qr_download_path
-from .spreadsheet import get_student_list_for_printing, update_sample_csv, update_selected_student_csv # 新しい関数をインポート
+from .spreadsheet import get_student_list_for_printing, update_sample_csv
 from .print_dialog import PrintDialog
-from .printer_control import print_label
-from .print_history import add_record
-from .config import load_settings
+from .print_spooler import STATUS_LABELS, describe, get_spooler
+from .print_history import get_print_history
+from .config import find_font, load_settings
+from .task_scheduler import PRIORITY_LOW, CancellationToken, get_scheduler
+from .list_views import DataListView
+from .student_search import get_student_index
+from .qr_sync import sync_qr_folder
+from . import qr_handler
 
 
 # --- フォント登録関連 (main.pyからコピー) ---
 def register_font() -> bool:
     """
-    フォントを安全に登録する。
+    フォントを安全に登録する。（探す場所は config.FONT_SEARCH_PATHS）
     """
-    try:
-        from importlib import resources as res
-        from pathlib import Path
-        with res.path("src.attendance_app.assets.fonts", "UDDigiKyokashoN-R.ttc") as p:
-            LabelBase.register(name="UDDigiKyokashoN-R", fn_regular=str(p))
-            return True
-    except FileNotFoundError:
-        pass
-
-    # fallback for development or alternative paths
-    try:
-        from pathlib import Path
-        legacy_path = Path(__file__).resolve().parent.parent / "Font" / "UDDigiKyokashoN-R.ttc"
-        if legacy_path.exists():
-            LabelBase.register(name="UDDigiKyokashoN-R", fn_regular=str(legacy_path))
-            return True
-    except Exception:
-        pass
+    font_path = find_font()
+    if font_path:
+        LabelBase.register(name="UDDigiKyokashoN-R", fn_regular=str(font_path))
+        return True
 
     print(f"Warning: フォントが見つかりません")
     return False
@@ -80,11 +71,17 @@ class PrintScreen(Screen):
     def __init__(self, **kw):
         super().__init__(**kw)
         self.qr_file_list = []  # QRコードファイルリストを保持
+        self.printable_ids = set()  # 印刷可能な塾生番号（検索の絞り込み対象）
+        self.list_loading = False  # Driveの一覧を待っている途中のリストを表示中か
+        self.batch_selected = {}  # 一括印刷で選択中の塾生（塾生番号 -> 塾生）
+        self._visible_students = []  # 検索で絞り込んだ、表示中の塾生
         self.selected_qr_path = None # 選択されたQRのローカルパス
         self.is_list_loaded = False # リストが読み込まれているかのフラグ
         self.drive_files_cache = {} # Google Driveファイルリストのキャッシュ
         self.cache_timestamp = 0 # キャッシュのタイムスタンプ
         self.cache_expiry = 300 # キャッシュの有効期限（5分）
+        self._drive_files_lock = threading.Lock() # Driveの一覧の取得を1回にまとめる
+        self._list_lock = threading.Lock() # リストの読み込み結果（ワーカースレッドから書き込まれる）を守る
 
         # 背景色設定（メイン画面と同じ薄いグレー）
         from kivy.graphics import Color, Rectangle
@@ -126,16 +123,53 @@ class PrintScreen(Screen):
         )
         list_title.text_size = (None, None)
         list_card.add_widget(list_title)
+
+        # 塾生番号・氏名で絞り込む検索欄（入力するたびに絞り込む）
+        self.search_input = TextInput(
+            hint_text="塾生番号・氏名で検索",
+            multiline=False,
+            size_hint_x=0.6,
+            font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
+            font_size="18sp"
+        )
+        self.search_input.bind(text=lambda instance, value: self._apply_search())
+
+        # 複数選択（一括印刷）モードの切り替えと、表示中の塾生の全選択
+        self.batch_toggle = ToggleButton(
+            text="複数選択",
+            size_hint_x=0.2,
+            font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
+            font_size="16sp"
+        )
+        self.batch_toggle.bind(state=self._on_batch_mode_changed)
+        self.select_all_button = Button(
+            text="表示中を全選択",
+            size_hint_x=0.2,
+            font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
+            font_size="16sp",
+            disabled=True
+        )
+        self.select_all_button.bind(on_release=self._select_all_visible)
+
+        search_row = BoxLayout(orientation="horizontal", size_hint_y=None, height="44dp", spacing=8)
+        search_row.add_widget(self.search_input)
+        search_row.add_widget(self.batch_toggle)
+        search_row.add_widget(self.select_all_button)
+        list_card.add_widget(search_row)
         
         # スクロールビューエリア - 白背景で視認性向上
-        self.qr_list_layout = GridLayout(cols=1, spacing=8, size_hint_y=None)
-        self.qr_list_layout.bind(minimum_height=self.qr_list_layout.setter('height'))
-        scroll_view = ScrollView(
+        # 塾生が数百人いても表示中の行だけを作るRecycleViewで表示する
+        self.qr_list_view = DataListView(
+            viewclass="ListButtonRow",
+            row_height="55dp",
+            spacing=8,
+            on_action=lambda action, item: self._on_student_row(item["student"]),
             bar_width=8,
             bar_color=(0.7, 0.7, 0.7, 0.8),
             bar_inactive_color=(0.9, 0.9, 0.9, 0.5)
         )
-        
+        scroll_view = self.qr_list_view
+
         # スクロールビュー背景を白に
         from kivy.graphics import Color, Rectangle
         with scroll_view.canvas.before:
@@ -143,8 +177,7 @@ class PrintScreen(Screen):
             scroll_view.bg_rect = Rectangle(size=scroll_view.size, pos=scroll_view.pos)
         scroll_view.bind(size=lambda instance, value: setattr(scroll_view.bg_rect, 'size', value))
         scroll_view.bind(pos=lambda instance, value: setattr(scroll_view.bg_rect, 'pos', value))
-        
-        scroll_view.add_widget(self.qr_list_layout)
+
         list_card.add_widget(scroll_view)
         content_layout.add_widget(list_card)
 
@@ -177,9 +210,20 @@ class PrintScreen(Screen):
         self.preview_image = Image(source='', allow_stretch=True, keep_ratio=True)
         image_container.add_widget(self.preview_image)
         preview_card.add_widget(image_container)
+
+        # 選択した塾生の前回の印刷（印刷履歴から）
+        self.history_label = Label(
+            text="",
+            font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
+            font_size="14sp",
+            color=(0.3, 0.3, 0.3, 1),
+            size_hint_y=None,
+            height="24dp"
+        )
+        preview_card.add_widget(self.history_label)
         
         # 印刷ボタン - より目立つデザイン
-        print_button = Button(
+        self.print_button = print_button = Button(
             text="このQRコードを印刷",
             size_hint_y=None,
             height="80dp",
@@ -191,6 +235,31 @@ class PrintScreen(Screen):
         )
         print_button.bind(on_release=self.confirm_print)
         preview_card.add_widget(print_button)
+
+        # 印刷キュー（待機中・印刷中・最近のジョブ。失敗したジョブはタップで再試行、待機中はタップで取消）
+        self.queue_title = Label(
+            text="印刷キュー",
+            font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
+            font_size="16sp",
+            color=(0, 0, 0, 1),
+            size_hint_y=None,
+            height="28dp"
+        )
+        preview_card.add_widget(self.queue_title)
+        self.queue_view = DataListView(
+            viewclass="ListButtonRow",
+            row_height="36dp",
+            spacing=4,
+            on_action=lambda action, item: self._on_queue_row(item["job"])
+        )
+        preview_card.add_widget(self.queue_view)
+        self._reported_failures = set()
+        spooler = get_spooler()
+        self._reported_failures.update(job["id"] for job in spooler.jobs() if job["status"] == "failed")
+        spooler.add_listener(lambda: Clock.schedule_once(lambda dt: self._update_queue_view(), 0))
+        self._update_queue_view()
+        # 印刷が記録されたらリストの印刷回数と前回の印刷を更新する
+        get_print_history().add_listener(lambda: Clock.schedule_once(lambda dt: self._on_history_changed(), 0))
         
         content_layout.add_widget(preview_card)
 
@@ -209,6 +278,17 @@ class PrintScreen(Screen):
             background_normal=''
         )
         refresh_button.bind(on_release=self.load_qr_list_from_drive)
+
+        # QRコード一括同期ボタン（Driveのフォルダをローカルにまとめてダウンロード）
+        self.sync_button = Button(
+            text="QRコード同期",
+            font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
+            font_size="24sp",
+            background_color=(0.286, 0.796, 0.98, 1),  # 49cbfa色
+            color=(1, 1, 1, 1),  # 白文字
+            background_normal=''
+        )
+        self.sync_button.bind(on_release=self.start_qr_sync)
         
         # 戻るボタン
         back_button = Button(
@@ -222,6 +302,7 @@ class PrintScreen(Screen):
         back_button.bind(on_release=lambda *_: setattr(self.manager, "current", "wait"))
         
         button_layout.add_widget(refresh_button)
+        button_layout.add_widget(self.sync_button)
         button_layout.add_widget(back_button)
         main_layout.add_widget(button_layout)
 
@@ -238,185 +319,324 @@ class PrintScreen(Screen):
     def on_enter(self, *args):
         """画面に入るたびに初期状態にリセット"""
         super().on_enter(*args)
+        # 印刷履歴の読み込み（初回だけ）は裏で行い、終わったらリスナー経由でリストを描き直す
+        get_scheduler().submit("io", get_print_history().load,
+                               priority=PRIORITY_LOW, name="print_history_load")
         if not self.is_list_loaded:
             self._show_initial_message()
 
     def _get_cached_drive_files(self):
-        """キャッシュ機能付きでGoogle Driveファイルリストを取得"""
-        current_time = time.time()
-        
-        # キャッシュが有効期限内であれば使用
-        if (self.drive_files_cache and 
-            current_time - self.cache_timestamp < self.cache_expiry):
-            print(f"[キャッシュ] Google Driveファイルリストをキャッシュから取得")
+        """キャッシュ機能付きでGoogle Driveファイルリストを取得（同時に呼ばれても取得は1回だけ）"""
+        with self._drive_files_lock:
+            current_time = time.time()
+            
+            # キャッシュが有効期限内であれば使用
+            if (self.drive_files_cache and 
+                current_time - self.cache_timestamp < self.cache_expiry):
+                print(f"[キャッシュ] Google Driveファイルリストをキャッシュから取得")
+                return self.drive_files_cache
+            
+            # キャッシュが無効または期限切れの場合、新しく取得
+            print(f"[キャッシュ] Google Driveファイルリストを新規取得")
+            drive_files = list_qr_files_from_drive()
+            
+            # キャッシュを更新
+            self.drive_files_cache = {f['name']: f['id'] for f in drive_files}
+            self.cache_timestamp = current_time
+            
             return self.drive_files_cache
-        
-        # キャッシュが無効または期限切れの場合、新しく取得
-        print(f"[キャッシュ] Google Driveファイルリストを新規取得")
-        drive_files = list_qr_files_from_drive()
-        
-        # キャッシュを更新
-        self.drive_files_cache = {f['name']: f['id'] for f in drive_files}
-        self.cache_timestamp = current_time
-        
-        return self.drive_files_cache
+
+    def start_qr_sync(self, *args):
+        """DriveのQRコードをローカルフォルダに一括同期する"""
+        if self.sync_button.disabled:
+            return
+        self.sync_button.disabled = True
+        self.sync_button.text = "同期中..."
+        # sync_qr_folder はダウンロードを io プールに投入して完了を待つので、
+        # io プールのワーカーをふさがないよう sync プールで実行する
+        get_scheduler().submit("sync", self._run_qr_sync, name="qr_sync")
+
+    def _run_qr_sync(self):
+        def on_progress(done, total):
+            Clock.schedule_once(lambda dt: setattr(self.sync_button, "text", f"同期中 {done}/{total}"), 0)
+
+        try:
+            result = sync_qr_folder(progress=on_progress)
+            message = (f"ダウンロード: {result['downloaded']}件\n"
+                       f"変更なし: {result['skipped']}件\n"
+                       f"削除: {result['removed']}件")
+            if result["failed"]:
+                message += f"\n失敗: {len(result['failed'])}件（{', '.join(result['failed'][:5])}）"
+            title = "QRコードの同期が完了しました"
+        except Exception as e:
+            print(f"[QR同期] エラーが発生しました: {e}")
+            title, message = "エラー", f"QRコードの同期に失敗しました: {e}"
+
+        def finish(dt):
+            self.sync_button.disabled = False
+            self.sync_button.text = "QRコード同期"
+            show_error_popup(title, message)
+        Clock.schedule_once(finish, 0)
 
     def _show_initial_message(self):
         """初期状態でリスト更新を促すメッセージを表示"""
-        self.qr_list_layout.clear_widgets()
         self.preview_image.source = ''
         self.selected_qr_path = None
         
         # より目立つ初期メッセージ
-        initial_message = Label(
-            text="🔄 「リスト更新」をクリックしてください", 
+        self.qr_list_view.show_message(
+            "🔄 「リスト更新」をクリックしてください",
             font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
             font_size="18sp",
-            color=(0.5, 0.5, 0.5, 1),  # ミディアムグレー
-            halign="center",
-            valign="middle"
+            color=(0.5, 0.5, 0.5, 1)  # ミディアムグレー
         )
-        initial_message.text_size = (400, None)
-        self.qr_list_layout.add_widget(initial_message)
 
     def load_qr_list_from_drive(self, *args):
-        self.qr_list_layout.clear_widgets()
         self.preview_image.source = ''
         self.selected_qr_path = None
         # ローディングメッセージを表示（日本語フォント指定）
-        loading_label = Label(
-            text="⏳ リストを読み込み中...", 
+        self.qr_list_view.show_message(
+            "⏳ リストを読み込み中...",
             font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
             font_size="18sp",
-            color=(0.2, 0.4, 0.8, 1),  # 青系でアクティブな感じ
-            halign="center",
-            valign="middle"
+            color=(0.2, 0.4, 0.8, 1)  # 青系でアクティブな感じ
         )
-        loading_label.text_size = (400, None)
-        self.qr_list_layout.add_widget(loading_label)
-        threading.Thread(target=self._load_printable_list_thread).start()
-
-    def _load_printable_list_thread(self):
-        """スプレッドシートとDriveを連携して印刷可能なリストを作成する"""
+        # 前回の読み込みが残っていれば取り消す
+        if getattr(self, "_list_token", None):
+            self._list_token.cancel()
+        token = CancellationToken()
+        self._list_token = token
+
+        # 塾生名簿とDriveのファイル一覧を並行して取得し、届いた順にリストへ反映する
+        # QRコードをローカルで生成できる場合は名簿の全員が印刷可能なので、Driveの一覧は取得しない
+        print("--- 印刷可能リストの読み込み開始 ---")
+        self._list_started = time.monotonic()
+        results = {}  # 今回の読み込みの結果（part -> 値、_list_lock を持って読み書きする）
+        self._list_local_qr = qr_handler.is_available()
+        parts = [("roster", get_student_list_for_printing)]
+        if not self._list_local_qr:
+            parts.append(("drive", self._get_cached_drive_files))
+        scheduler = get_scheduler()
+        for part, fn in parts:
+            handle = scheduler.submit("io", fn, token=token, name=f"print_list_{part}")
+            handle.future.add_done_callback(
+                lambda future, part=part: self._on_list_part_loaded(token, results, part, future))
+
+    def _on_list_part_loaded(self, token, results, part, future):
+        """名簿またはDriveのファイル一覧の取得が終わったとき（ワーカースレッドから呼ばれる）"""
+        if token.cancelled:
+            return
         try:
-            print("--- デバッグ開始: 印刷可能リストの読み込み ---")
-            
-            # 0. sample_data.csvをスプレッドシートの最新データで更新
-            print("[DEBUG] sample_data.csvを更新中...")
-            csv_updated = update_sample_csv()
-            if csv_updated:
-                print("[DEBUG] sample_data.csvの更新が完了しました")
-            else:
-                print("[DEBUG] sample_data.csvの更新に失敗しました")
-            
-            # 1. スプレッドシートから塾生リストを取得
-            student_list = get_student_list_for_printing()
-            print(f"[DEBUG] スプレッドシートから取得した塾生数: {len(student_list)}")
-            if student_list:
-                print(f"[DEBUG] 取得した塾生リスト (先頭5件): {student_list[:5]}")
-
-            if not student_list:
-                Clock.schedule_once(lambda dt: self._update_qr_list_ui([]), 0)
-                print("--- デバッグ終了: 塾生リストが空のため処理終了 ---")
-                return
-
-            # 2. Google DriveからQRファイルリストを取得（キャッシュ使用）
-            drive_files_map = self._get_cached_drive_files()
-            print(f"[DEBUG] Google Driveから取得したファイル数: {len(drive_files_map)}")
-            if drive_files_map:
-                print(f"[DEBUG] 取得したファイルリスト (先頭5件): {list(drive_files_map.items())[:5]}")
-            
-            # 3. スプレッドシートの全塾生が印刷可能（QRコードはテキストベースで生成）
-            # 修正: Google DriveにQRコードファイルが存在する塾生のみをフィルタリング
-            printable_students = []
-            for student in student_list:
-                qr_filename = f"{student['id']}.png"
-                if qr_filename in drive_files_map:
-                    printable_students.append(student)
-                else:
-                    print(f"[DEBUG] QRコードファイルが見つかりません: {qr_filename}")
-
-            print(f"[DEBUG] 最終的に印刷可能な塾生数: {len(printable_students)}")
-            Clock.schedule_once(lambda dt: self._update_qr_list_ui(printable_students), 0)
-            # リスト読み込み完了フラグを設定
-            self.is_list_loaded = True
-            print("--- デバッグ終了: 正常終了 ---")
-
+            value = future.result()
         except Exception as e:
+            token.cancel()  # もう一方の結果は使わない
             error_message = f"リストの読み込みに失敗: {e}"
             print(f"[ERROR] {error_message}")
-            import traceback
-            traceback.print_exc()
             Clock.schedule_once(lambda dt: show_error_popup("エラー", error_message), 0)
             Clock.schedule_once(lambda dt: self._update_qr_list_ui([]), 0) # エラー時もUIをクリア
-            print("--- デバッグ終了: 例外発生 ---")
+            return
+
+        elapsed = time.monotonic() - self._list_started
+        print(f"[印刷リスト] {part} の取得が完了しました（{elapsed:.2f}秒）")
+        # 2つの取得が同時に終わっても、両方がそろったことに気づくのがちょうど一方だけになるよう
+        # 書き込みと読み出しをまとめてロックする
+        with self._list_lock:
+            results[part] = value
+            roster = results.get("roster")
+            drive_files_map = results.get("drive")
+
+        if part == "roster":
+            # 取得済みの名簿からCSVを書く（名簿を取り直さない）
+            if roster:
+                get_scheduler().submit("io", update_sample_csv, roster, name="update_sample_csv")
+            if self._list_local_qr:
+                # 名簿の全員分のQRコードを裏で生成しておき、選択時のプレビューを待たせない
+                get_scheduler().submit("cpu", qr_handler.pregenerate, [s['id'] for s in roster],
+                                       priority=PRIORITY_LOW, name="qr_pregenerate")
+                Clock.schedule_once(lambda dt: self._update_qr_list_ui(roster), 0)
+                self.is_list_loaded = True
+                return
+            if drive_files_map is None:
+                # Driveの一覧を待つ間、ローカルにQRコードがある塾生を先に表示する
+                local_dir = get_qr_download_path()
+                local_files = set(os.listdir(local_dir)) if os.path.isdir(local_dir) else set()
+                partial = [s for s in roster if f"{s['id']}.png" in local_files]
+                if partial:
+                    Clock.schedule_once(lambda dt: self._show_partial_list(token, results, partial), 0)
+                return
+
+        if roster is None:
+            return  # 名簿を待つ
+
+        # Google DriveにQRコードファイルが存在する塾生のみをフィルタリング
+        printable_students = [s for s in roster if f"{s['id']}.png" in drive_files_map]
+        print(f"[印刷リスト] 塾生数: {len(roster)} / Driveのファイル数: {len(drive_files_map)} / "
+              f"印刷可能: {len(printable_students)}")
+        Clock.schedule_once(lambda dt: self._update_qr_list_ui(printable_students), 0)
+        # リスト読み込み完了フラグを設定
+        self.is_list_loaded = True
+
+    def _show_partial_list(self, token, results, partial):
+        """Driveの一覧がまだ届いていなければ、途中までのリストを表示する"""
+        with self._list_lock:
+            drive_loaded = results.get("drive") is not None
+        if token.cancelled or drive_loaded:
+            return
+        self._update_qr_list_ui(partial, loading=True)
+
+    def _update_qr_list_ui(self, printable_students, loading=False):
+        """
+        印刷可能な塾生のリストを表示する
 
-    def _update_qr_list_ui(self, printable_students):
-        self.qr_list_layout.clear_widgets()
+        Args:
+            loading: Driveの一覧を待っている途中の部分的なリストならTrue
+        """
         self.qr_file_list = printable_students # プロパティに保持
+        self.list_loading = loading
 
         if not self.qr_file_list:
-            empty_message = Label(
-                text="⚠️ 印刷可能なQRコードが見つかりません\n\n確認事項：\n・ スプレッドシートに塾生が登録されているか\n・ Google DriveにQRファイル(塾生番号.png)があるか", 
-                font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto", 
+            self.qr_list_view.show_message(
+                "⚠️ 印刷可能なQRコードが見つかりません\n\n確認事項：\n・ スプレッドシートに塾生が登録されているか\n・ Google DriveにQRファイル(塾生番号.png)があるか",
+                font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
                 font_size="16sp",
-                halign="center",
-                valign="middle",
-                text_size=(400, None),
+                height="160dp",
                 color=(0.8, 0.4, 0.4, 1)  # 赤っぽい色で警告
             )
-            self.qr_list_layout.add_widget(empty_message)
             return
 
-        for student_data in self.qr_file_list:
-            display_text = f"👤 {student_data['id']} - {student_data['name']}"
-            btn = Button(
-                text=display_text,
-                size_hint_y=None,
-                height="55dp",
+        self.printable_ids = {student['id'] for student in self.qr_file_list}
+        self._apply_search()
+
+    def _apply_search(self):
+        """検索欄の文字で印刷可能な塾生を絞り込んで表示する"""
+        if not self.qr_file_list:
+            return
+        query = self.search_input.text
+        index = get_student_index()
+        if len(index):
+            students = index.search(query, among=self.printable_ids)
+        else:
+            students = self.qr_file_list if not query.strip() else []
+
+        if not students:
+            self.qr_list_view.show_message(
+                f"「{query}」に該当する塾生はいません",
                 font_name="UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto",
                 font_size="16sp",
-                background_color=(0.6, 0.6, 0.6, 1),  # グレー
-                color=(1, 1, 1, 1),  # 白文字
-                halign="left",
-                text_size=(None, None),
-                background_normal=''
+                color=(0.5, 0.5, 0.5, 1)
             )
-            btn.bind(on_release=lambda _, data=student_data: self.select_qr_code(data))
-            self.qr_list_layout.add_widget(btn)
+            return
+
+        self._visible_students = students
+        font_name = "UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto"
+        # 読み込みが終わるまでは印刷回数なしで表示する（UIスレッドで読み込みを待たない）
+        history = get_print_history()
+        print_counts = history.counts_by_student() if history.is_loaded else {}
+        rows = []
+        for student_data in students:
+            checked = student_data['id'] in self.batch_selected
+            count = print_counts.get(str(student_data['id']), 0)
+            rows.append({
+                "key": student_data['id'],
+                "student": student_data,
+                "text": f"{'✔' if checked else '👤'} {student_data['id']} - {student_data['name']}"
+                        + (f"（印刷済み {count}回）" if count else ""),
+                "font_name": font_name,
+                "font_size": "16sp",
+                # 一括印刷で選択中の塾生は青、それ以外はグレー
+                "background_color": (0.286, 0.796, 0.98, 1) if checked else (0.6, 0.6, 0.6, 1),
+                "color": (1, 1, 1, 1),  # 白文字
+                "halign": "left",
+                "background_normal": '',
+            })
+        if self.list_loading:
+            rows.append({
+                "key": "__loading__",
+                "viewclass": "ListMessageRow",
+                "text": "⏳ Google Driveを確認中...（ローカルにQRコードがある塾生を先に表示しています）",
+                "font_name": font_name,
+                "font_size": "14sp",
+                "color": (0.2, 0.4, 0.8, 1),
+                "height": "40dp",
+            })
+        self.qr_list_view.set_items(rows)
+
+    # --- 複数選択（一括印刷） ---
+    def _on_student_row(self, student_data):
+        """リストの塾生が押されたとき（複数選択モードなら選択を切り替える）"""
+        if self.batch_toggle.state != "down":
+            self.select_qr_code(student_data)
+            return
+        if student_data['id'] in self.batch_selected:
+            del self.batch_selected[student_data['id']]
+        else:
+            self.batch_selected[student_data['id']] = student_data
+        self._apply_search()  # 変わった行だけが描き直される
+        self._update_print_button()
+
+    def _on_batch_mode_changed(self, instance, state):
+        self.batch_selected.clear()
+        self.select_all_button.disabled = state != "down"
+        self._apply_search()
+        self._update_print_button()
+
+    def _select_all_visible(self, *args):
+        """検索で表示されている塾生をすべて選択する"""
+        for student_data in self._visible_students:
+            self.batch_selected[student_data['id']] = student_data
+        self._apply_search()
+        self._update_print_button()
+
+    def _update_print_button(self):
+        if self.batch_toggle.state == "down":
+            self.print_button.text = f"選択した{len(self.batch_selected)}人を印刷"
+        else:
+            self.print_button.text = "このQRコードを印刷"
 
     def select_qr_code(self, student_data):
         # 選択された生徒の情報を保持
         self.current_student_id = student_data['id'] # 塾生IDを保持
         self.current_student_name = student_data['name'] # 氏名を保持
         self.selected_qr_path = "selected" # 選択状態のフラグとして使用
-
-        # 即座にsample_data.csvを選択された塾生のデータで更新（ワンクリック印刷対応）
-        threading.Thread(target=self._update_csv_for_selected_student, 
-                        args=(student_data['id'], student_data['name'])).start()
+        self._update_history_label()
 
         # Google DriveからQRコード画像をダウンロードしてプレビュー表示（UIフィードバック用）
         expected_filename = f"{student_data['id']}.png"
-        threading.Thread(target=self._download_and_preview_for_feedback, 
-                        args=(student_data['id'], expected_filename)).start()
+        get_scheduler().submit("io", self._download_and_preview_for_feedback,
+                               student_data['id'], expected_filename)
 
         print(f"塾生を選択しました: {student_data['name']} (ID: {student_data['id']})")
 
-    def _update_csv_for_selected_student(self, student_id, student_name):
-        """選択された塾生のデータでCSVファイルを更新する"""
-        try:
-            print(f"[CSV更新] 選択塾生用にCSVファイルを更新中: {student_name} (ID: {student_id})")
-            success = update_selected_student_csv(student_id, student_name)
-            if success:
-                print(f"[CSV更新] CSVファイルの更新が完了しました。P-touch Editorのテンプレートが更新されています。")
-            else:
-                print(f"[CSV更新] CSVファイルの更新に失敗しました。")
-        except Exception as e:
-            print(f"[CSV更新] エラーが発生しました: {e}")
+    def _update_history_label(self):
+        """選択中の塾生の前回の印刷を表示する"""
+        if not self.selected_qr_path:
+            self.history_label.text = ""
+            return
+        history = get_print_history()
+        if not history.is_loaded:
+            self.history_label.text = "印刷履歴を読み込み中..."
+            return
+        last = history.last_printed(self.current_student_id)
+        if last is None:
+            self.history_label.text = "まだ印刷していません"
+            return
+        count = history.counts_by_student().get(str(self.current_student_id), 0)
+        printed_at = last['timestamp'][:16].replace('T', ' ')
+        self.history_label.text = f"前回の印刷: {printed_at}（計{count}回）"
+
+    def _on_history_changed(self):
+        self._apply_search()
+        self._update_history_label()
 
     def _download_and_preview_for_feedback(self, student_id, filename):
-        """UIフィードバック用にQRコード画像をダウンロードしてプレビュー表示（高速化版）"""
+        """UIフィードバック用にQRコード画像を用意してプレビュー表示（ローカル生成、なければDrive）"""
         try:
+            # ローカルで生成できればDriveには取りに行かない
+            local_path = qr_handler.render_qr(student_id)
+            if local_path:
+                Clock.schedule_once(lambda dt: self._update_preview_image(local_path), 0)
+                return
+
             # まず、ローカルファイルが既に存在するかチェック
             local_path = os.path.join(get_qr_download_path(), filename)
             
@@ -503,6 +723,10 @@ class PrintScreen(Screen):
             show_error_popup("リスト未更新", "リスト更新を押してください。")
             return
             
+        if self.batch_toggle.state == "down":
+            self._confirm_batch_print()
+            return
+
         if not self.selected_qr_path:
             show_error_popup("選択エラー", "印刷する塾生をリストから選択してください。")
             return
@@ -512,15 +736,76 @@ class PrintScreen(Screen):
         student_name = self.current_student_name
 
         def on_confirm():
-            threading.Thread(target=self._print_qr_thread, args=(student_id, student_name)).start()
+            # sample_data.csvの更新と印刷は印刷キューのワーカーが順に行う
+            get_spooler().submit([{"id": student_id, "name": student_name}])
 
         dialog = PrintDialog(f"{student_name} のQRコード", on_confirm, lambda: None)
         dialog.open()
 
-    def _print_qr_thread(self, student_id, student_name):
-        try:
-            print_label(student_id, student_name)
-            add_record(student_id, student_name, 'success')
-        except Exception as e:
-            add_record(student_id, student_name, 'failure', str(e))
-            Clock.schedule_once(lambda dt, error_msg=str(e): show_error_popup("エラー", f"印刷に失敗しました: {error_msg}"), 0)
\ No newline at end of file
+    def _confirm_batch_print(self):
+        """選択した塾生をまとめて印刷する"""
+        if not self.batch_selected:
+            show_error_popup("選択エラー", "印刷する塾生をリストから選択してください。")
+            return
+        # 名簿の順に印刷する
+        students = [s for s in self.qr_file_list if s['id'] in self.batch_selected]
+
+        def on_confirm():
+            get_spooler().submit(students)
+
+        dialog = PrintDialog(f"{len(students)}人分のQRコード", on_confirm, lambda: None)
+        dialog.open()
+
+    # --- 印刷キュー ---
+    def _update_queue_view(self):
+        """印刷キューの表示を更新し、新しく失敗したジョブがあれば知らせる"""
+        spooler = get_spooler()
+        jobs = spooler.jobs()
+        pending = spooler.pending_count()
+        self.queue_title.text = f"印刷キュー（残り{pending}件）" if pending else "印刷キュー"
+
+        font_name = "UDDigiKyokashoN-R" if FONT_AVAILABLE else "Roboto"
+        colors = {
+            "queued": (0.6, 0.6, 0.6, 1),
+            "printing": (0.286, 0.796, 0.98, 1),
+            "retrying": (0.95, 0.65, 0.2, 1),
+            "done": (0.45, 0.75, 0.45, 1),
+            "failed": (0.85, 0.40, 0.40, 1),
+            "cancelled": (0.75, 0.75, 0.75, 1),
+        }
+        rows = []
+        for job in jobs[:30]:
+            status = STATUS_LABELS.get(job["status"], job["status"])
+            if job["status"] in ("printing", "retrying") and job["attempts"] > 1:
+                status += f"（{job['attempts']}回目）"
+            hint = {"failed": " - タップで再試行", "queued": " - タップで取消"}.get(job["status"], "")
+            rows.append({
+                "key": job["id"],
+                "job": job,
+                "text": f"#{job['id']} {describe(job)}：{status}{hint}",
+                "font_name": font_name,
+                "font_size": "13sp",
+                "background_color": colors.get(job["status"], (0.6, 0.6, 0.6, 1)),
+                "background_normal": '',
+                "color": (1, 1, 1, 1),
+                "halign": "left",
+            })
+        if rows:
+            self.queue_view.set_items(rows)
+        else:
+            self.queue_view.show_message("印刷ジョブはありません", font_name=font_name,
+                                         font_size="13sp", height="36dp")
+
+        for job in jobs:
+            if job["status"] == "failed" and job["id"] not in self._reported_failures:
+                self._reported_failures.add(job["id"])
+                show_error_popup("エラー", f"印刷に失敗しました: {describe(job)}\n{job['error']}")
+            elif job["status"] != "failed":
+                self._reported_failures.discard(job["id"])
+
+    def _on_queue_row(self, job):
+        spooler = get_spooler()
+        if job["status"] == "failed":
+            spooler.retry(job["id"])
+        elif job["status"] == "queued":
+            spooler.cancel(job["id"])
\ No newline at end of file
@@ -1,32 +1,227 @@
+"""
+通知フォルダ（NOTIFICATION_DIR）の監視
+
+watchdog の監視スレッドではファイルを読まず、パスを上限付きのキューに入れるだけにする。
+処理は専用のワーカースレッドで行う。
+- 短い間に続けて届いた通知は BATCH_WINDOW 秒待ってまとめて処理する
+- 作成イベントで届いたファイルは、サイズと更新時刻が変わらなくなるまで待ってから読む
+  （別名で書いてから .json に改名されたファイルは書き込み済みなので待たない）
+- 処理したファイルは archive/YYYY-MM-DD/ に移し、監視フォルダには未処理のものだけを残す
+  （読めなかったファイルと、コールバックで例外が発生した通知は archive/failed/ に移す）
+- 監視を始める前から置かれていたファイルや、キューがあふれて取りこぼしたファイルは
+  フォルダを見直して拾う
+"""
+
 import json
+import queue
+import threading
+import time
+from datetime import date
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Optional
 
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
 from .config import NOTIFICATION_DIR
 
+QUEUE_SIZE = 1000
+BATCH_WINDOW = 0.5     # 最初の通知からまとめて待つ秒数
+MAX_BATCH = 100
+STABLE_INTERVAL = 0.2  # サイズが変わらないことを確かめる間隔（秒）
+STABLE_TIMEOUT = 10.0  # 書き込み中とみなして待つ最大の秒数
+ARCHIVE_DIR_NAME = "archive"
+FAILED_DIR_NAME = "failed"
+
 
 class NotificationHandler(FileSystemEventHandler):
-    def __init__(self, callback: Callable[[dict, Path], None]):
+    """watchdog のイベントからパスをキューに入れる（監視スレッドをふさがない）"""
+
+    def __init__(self, events: queue.Queue):
         super().__init__()
-        self.callback = callback
+        self.events = events
+        self.overflowed = threading.Event()
 
     def on_created(self, event):
         if not event.is_directory and event.src_path.endswith('.json'):
-            path = Path(event.src_path)
+            self.put(Path(event.src_path), complete=False)
+
+    def on_moved(self, event):
+        # 一時ファイルに書いてから .json に改名する書き方なら、改名の時点で書き込みは終わっている
+        if not event.is_directory and event.dest_path.endswith('.json'):
+            self.put(Path(event.dest_path), complete=True)
+
+    def put(self, path: Path, complete: bool) -> None:
+        try:
+            self.events.put_nowait((path, complete))
+        except queue.Full:
+            # 取りこぼしたファイルは、ワーカーがフォルダを見直して拾う
+            self.overflowed.set()
+
+
+class NotificationWorker(threading.Thread):
+    """キューの通知をまとめて読み、コールバックを呼んでからアーカイブに移す"""
+
+    def __init__(self, folder: Path, events: queue.Queue, handler: NotificationHandler,
+                 callback: Optional[Callable[[dict, Path], None]],
+                 batch_callback: Optional[Callable[[list[tuple[dict, Path]]], None]],
+                 observer: Observer):
+        super().__init__(name="notification_worker", daemon=True)
+        self.folder = folder
+        self.events = events
+        self.handler = handler
+        self.callback = callback
+        self.batch_callback = batch_callback
+        self.observer = observer
+
+    def run(self):
+        self._sweep()
+        pending: dict[Path, tuple[bool, float]] = {}  # パス -> (書き込み済みとわかっているか, 最初に届いた時刻)
+        while True:
+            if not pending:
+                try:
+                    path, complete = self.events.get(timeout=1.0)
+                except queue.Empty:
+                    if not self.observer.is_alive():
+                        return
+                    if self.handler.overflowed.is_set():
+                        self._sweep()
+                    continue
+                pending[path] = (complete, time.monotonic())
+
+            # 続けて届く通知を BATCH_WINDOW の間まとめる
+            deadline = time.monotonic() + BATCH_WINDOW
+            while len(pending) < MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    path, complete = self.events.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                known, first_seen = pending.get(path, (False, time.monotonic()))
+                pending[path] = (known or complete, first_seen)
+
+            ready, pending = self._wait_until_written(pending)  # まだ書き込み中のものは次のまとまりで処理する
+            self._process(ready)
+            if self.handler.overflowed.is_set():
+                self._sweep()
+
+    def _sweep(self) -> None:
+        """フォルダに残っている通知をキューに入れる（起動時と取りこぼしたとき）"""
+        self.handler.overflowed.clear()
+        try:
+            paths = sorted(self.folder.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        except OSError as e:
+            print(f"[通知監視] フォルダを確認できませんでした: {e}")
+            return
+        for path in paths:
+            self.handler.put(path, complete=False)
+
+    def _wait_until_written(self, batch: dict[Path, tuple[bool, float]]) -> tuple[list[Path], dict]:
+        """
+        書き込みが終わったファイルを選ぶ（サイズと更新時刻が STABLE_INTERVAL の間変わらないこと）
+
+        読めるファイルが1つでもあるか新しい通知が届いたら、残りを待たずに返す。
+        STABLE_TIMEOUT を過ぎても変わり続けるファイルは、読めるかどうか試すため読めるほうに入れる。
+
+        Returns:
+            (読めるパス, まだ書き込み中のもの {パス: (False, 最初に届いた時刻)})
+        """
+        def stat(path):
+            try:
+                st = path.stat()
+                return st.st_size, st.st_mtime_ns
+            except FileNotFoundError:
+                return None
+
+        ready = [path for path, (complete, _) in batch.items() if complete]
+        waiting = {path: (stat(path), first_seen) for path, (complete, first_seen) in batch.items() if not complete}
+        while waiting:
+            time.sleep(STABLE_INTERVAL)
+            now = time.monotonic()
+            for path, (before, first_seen) in list(waiting.items()):
+                after = stat(path)
+                if after is None:
+                    del waiting[path]  # 処理済みなどで消えた
+                elif (after == before and after[0] > 0) or now - first_seen >= STABLE_TIMEOUT:
+                    ready.append(path)
+                    del waiting[path]
+                else:
+                    waiting[path] = (after, first_seen)
+            if ready or not self.events.empty():
+                break
+        return ready, {path: (False, first_seen) for path, (_, first_seen) in waiting.items()}
+
+    def _process(self, paths: list[Path]) -> None:
+        items = []
+        for path in paths:
+            if not path.exists():
+                continue
             try:
-                data = json.loads(path.read_text(encoding='utf-8'))
-                self.callback(data, path)
+                items.append((json.loads(path.read_text(encoding='utf-8')), path))
             except Exception as e:
                 print(f'Failed to process notification {path}: {e}')
+                _archive(path, FAILED_DIR_NAME)
+        if not items:
+            return
+
+        failed: set[Path] = set()
+        if self.batch_callback is not None:
+            try:
+                self.batch_callback(items)
+            except Exception as e:
+                print(f'Failed to process {len(items)} notifications: {e}')
+                failed.update(path for _, path in items)
+        else:
+            for data, path in items:
+                try:
+                    self.callback(data, path)
+                except Exception as e:
+                    print(f'Failed to process notification {path}: {e}')
+                    failed.add(path)
+
+        # 処理できなかった通知は処理済みと区別できるよう failed/ に移す
+        day = date.today().isoformat()
+        for _, path in items:
+            _archive(path, FAILED_DIR_NAME if path in failed else day)
+
+
+def _archive(path: Path, subdir: str) -> Optional[Path]:
+    """処理した通知を archive/<subdir>/ に移す（同名のファイルがあれば番号を付ける）"""
+    dest_dir = path.parent / ARCHIVE_DIR_NAME / subdir
+    try:
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        dest = dest_dir / path.name
+        n = 1
+        while dest.exists():
+            dest = dest_dir / f"{path.stem}_{n}{path.suffix}"
+            n += 1
+        path.replace(dest)
+        return dest
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"[通知監視] アーカイブに移せませんでした: {path} - {e}")
+        return None
+
 
+def start_monitor(callback: Optional[Callable[[dict, Path], None]] = None,
+                  batch_callback: Optional[Callable[[list[tuple[dict, Path]]], None]] = None) -> Observer:
+    """
+    通知フォルダの監視を始める（observer.stop() でワーカーも止まる）
 
-def start_monitor(callback: Callable[[dict, Path], None]) -> Observer:
+    Args:
+        callback: 通知1件ごとに (内容, パス) で呼ばれる
+        batch_callback: 指定すると callback の代わりに、まとめた通知の [(内容, パス)] で1回呼ばれる
+    """
+    if callback is None and batch_callback is None:
+        raise ValueError("callback か batch_callback を指定してください")
     NOTIFICATION_DIR.mkdir(exist_ok=True)
-    event_handler = NotificationHandler(callback)
+    events: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+    event_handler = NotificationHandler(events)
     observer = Observer()
     observer.schedule(event_handler, str(NOTIFICATION_DIR), recursive=False)
     observer.start()
-    return observer
\ No newline at end of file
+    NotificationWorker(NOTIFICATION_DIR, events, event_handler, callback, batch_callback, observer).start()
+    return observer
@@ -0,0 +1,194 @@
+"""
+在室状況のトラッカー
+
+起動時に今日の出席記録から「入室済みで退室していない塾生」を読み込み、
+以降はキオスクでの入退室ごとにメモリ上で更新する。
+在室かどうか・在室者一覧・人数をシートを読まずに答えられるため、
+入退室の判定で毎回シート全体を読み直す必要がなくなる。
+
+日付が変わると在室状況は破棄され、新しい日の記録から読み込み直す。
+
+読み込み（seed）はシートを読んでいる間も入退室を受け付けるため、読み込みを始めた後に
+入退室した塾生と、シートへの書き込みがまだ終わっていない塾生（楽観的な入退室）は
+シートの内容で上書きせず、手元の状態を残す。
+"""
+
+import threading
+from datetime import date, datetime
+from typing import Callable, Optional
+
+from .attendance_store import NO_TIME
+from .spreadsheet import get_today_table
+
+
+class OccupancyTracker:
+    """在室中の塾生（塾生番号 -> 入室記録の行番号・氏名・入室時刻）を保持する"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._present: dict[str, dict] = {}
+        self._day: Optional[date] = None
+        self._seeded = False
+        self._mutations = 0                  # 入退室を反映した回数（読み込みとの前後関係の判定用）
+        self._changed: dict[str, int] = {}   # 塾生番号 -> 最後に入退室を反映したときの _mutations
+        self._unconfirmed: dict[str, int] = {}  # シートへの書き込みが終わっていない塾生 -> その反映の番号
+        self._listeners: list[Callable[[int], None]] = []
+
+    # --- 読み込み ---
+    def seed(self) -> bool:
+        """今日の出席記録から在室状況を読み込む（成功すればTrue）"""
+        with self._lock:
+            started_at = self._mutations
+        try:
+            table = get_today_table()
+        except Exception as e:
+            print(f"[在室] 今日の出席記録の読み込みに失敗しました: {e}")
+            return False
+
+        present = {}
+        for i in range(len(table)):  # 行番号順なので同じ塾生は後の行で上書きされる
+            record = table.record(i)
+            if table.exit[i] == NO_TIME:
+                present[record.student_id] = {
+                    "row": record.row,
+                    "name": record.student_name,
+                    "entry_time": record.entry_time,
+                }
+            else:
+                present.pop(record.student_id, None)
+
+        with self._lock:
+            # 読み込み中に入退室した塾生・書き込み中の塾生は手元の状態のほうが新しい
+            keep = {sid for sid, mutation in self._changed.items() if mutation > started_at}
+            keep.update(self._unconfirmed)
+            for sid in keep:
+                if sid in self._present:
+                    present[sid] = self._present[sid]
+                else:
+                    present.pop(sid, None)
+            self._present = present
+            self._day = date.today()
+            self._seeded = True
+        if keep:
+            print(f"[在室] 読み込み中・書き込み中の入退室{len(keep)}件は手元の状態を使います")
+        print(f"[在室] 在室状況を読み込みました: {len(present)}人")
+        self._notify()
+        return True
+
+    def ensure_current(self) -> bool:
+        """今日の在室状況が読み込まれていることを保証する（日付が変わっていれば読み込み直す）"""
+        with self._lock:
+            if self._seeded and self._day == date.today():
+                return True
+            if self._seeded:
+                print("[在室] 日付が変わったため在室状況をリセットします")
+                self._present = {}
+                self._changed.clear()
+                self._unconfirmed.clear()
+                self._seeded = False
+        return self.seed()
+
+    def invalidate(self) -> None:
+        """
+        シートの行番号がずれたとき（アーカイブで行を削除したときなど）に呼び、
+        次の ensure_current() でシートから読み込み直させる
+        """
+        with self._lock:
+            self._seeded = False
+
+    @property
+    def is_seeded(self) -> bool:
+        return self._seeded
+
+    # --- 参照 ---
+    def is_checked_in(self, student_id: str) -> bool:
+        with self._lock:
+            return str(student_id) in self._present
+
+    def open_row(self, student_id: str) -> Optional[int]:
+        """在室中の塾生の入室記録の行番号（在室していなければNone）"""
+        with self._lock:
+            visit = self._present.get(str(student_id))
+            return visit["row"] if visit else None
+
+    def who_is_in(self) -> list[dict]:
+        """在室中の塾生の一覧（入室順）"""
+        with self._lock:
+            visits = [{"id": sid, **visit} for sid, visit in self._present.items()]
+        # 行番号が未確定（書き込み中）の入室は最後に並べる
+        return sorted(visits, key=lambda v: (v["row"] is None, v["row"] or 0))
+
+    def headcount(self) -> int:
+        with self._lock:
+            return len(self._present)
+
+    # --- 更新 ---
+    def check_in(self, student_id: str, row: Optional[int], name: str = "") -> int:
+        """
+        入室を記録する（行番号がまだ確定していない場合は row=None）
+
+        row=None の入室はシートへの書き込み中として扱い、行番号を付けて呼び直すまで
+        seed() で上書きしない。反映の番号を返す。
+        """
+        sid = str(student_id)
+        with self._lock:
+            self._present[sid] = {"row": row, "name": name, "entry_time": datetime.now()}
+            mutation = self._mark(sid, pending=row is None)
+        self._notify()
+        return mutation
+
+    def check_out(self, student_id: str, pending: bool = False) -> int:
+        """
+        退室を記録する
+
+        pending=True ならシートへの書き込み中として扱い、confirm() を呼ぶまで seed() で上書きしない。
+        反映の番号を返す。
+        """
+        sid = str(student_id)
+        with self._lock:
+            self._present.pop(sid, None)
+            mutation = self._mark(sid, pending)
+        self._notify()
+        return mutation
+
+    def confirm(self, student_id: str, mutation: int) -> None:
+        """書き込み中として記録した入退室の書き込みが終わったことを伝える（成功・失敗を問わない）"""
+        with self._lock:
+            if self._unconfirmed.get(str(student_id)) == mutation:
+                del self._unconfirmed[str(student_id)]
+
+    def _mark(self, sid: str, pending: bool) -> int:
+        """入退室の反映を記録する（ロックを持った状態で呼ぶ）"""
+        self._mutations += 1
+        self._changed[sid] = self._mutations
+        if pending:
+            self._unconfirmed[sid] = self._mutations
+        else:
+            self._unconfirmed.pop(sid, None)
+        return self._mutations
+
+    # --- 通知 ---
+    def add_listener(self, callback: Callable[[int], None]) -> None:
+        """在室人数が変わったときに呼ばれるコールバックを登録する（呼び出しスレッドは任意）"""
+        self._listeners.append(callback)
+
+    def _notify(self) -> None:
+        count = self.headcount()
+        for callback in list(self._listeners):
+            try:
+                callback(count)
+            except Exception as e:
+                print(f"[在室] 通知の処理に失敗しました: {e}")
+
+
+_tracker: Optional[OccupancyTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker() -> OccupancyTracker:
+    """プロセス全体で共有する在室トラッカーを返す"""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = OccupancyTracker()
+        return _tracker
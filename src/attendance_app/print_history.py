@@ -1,28 +1,282 @@
+"""
+印刷履歴
+
+印刷結果を print_history/ フォルダの月ごとのJSON Lines ファイル（YYYY-MM.jsonl）に1行ずつ追記する。
+- 追記のたびに fsync するので、印刷直後に電源が落ちても記録は残る
+  （書き込み途中で落ちて壊れた最後の行は、読み込み時に読み飛ばす）
+- 月が変わると新しいファイルに書く。設定 print_history_keep_months を指定すると、
+  それより古い月のファイルを削除する（既定は 0 = すべて残す）
+- 初めて使うときに、読み込んだ記録から塾生番号ごと・日付ごとの索引をメモリ上に作り、
+  以降は追記に合わせて更新する（「前回の印刷」「今週の失敗」などを全件走査せずに返す）
+- 画面からは load() を裏で呼んでおき、is_loaded が True になるまでは検索を呼ばない
+  （読み込みが終わるとリスナーに通知する）
+
+以前の print_history.json（全件を1つのJSON配列で書き直していた形式）は、
+最初の読み込み時に legacy.jsonl に移し替え、元のファイルは print_history.json.migrated に改名する。
+"""
+
 import json
-from datetime import datetime
+import os
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
 from pathlib import Path
+from typing import Callable, Optional
 
-from .config import HISTORY_FILE
+from .config import HISTORY_FILE, PRINT_HISTORY_DIR, load_settings
 
+LEGACY_SEGMENT = "legacy.jsonl"
 
-def _load_history():
-    if HISTORY_FILE.exists():
-        try:
-            with HISTORY_FILE.open('r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            pass
-    return []
 
+def _segment_name(timestamp: str) -> str:
+    """記録を書くファイル名（タイムスタンプの年月）"""
+    return f"{timestamp[:7]}.jsonl"
 
-def add_record(student_id: str, student_name: str, result: str, error: str | None = None):
-    history = _load_history()
-    history.append({
-        'timestamp': datetime.now().isoformat(),
-        'studentId': student_id,
+
+def _entry(student_id: str, student_name: str, result: str, error: Optional[str], timestamp: str) -> dict:
+    return {
+        'timestamp': timestamp,
+        'studentId': str(student_id),
         'studentName': student_name,
         'result': result,
         'error': error or ''
-    })
-    with HISTORY_FILE.open('w', encoding='utf-8') as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+    }
+
+
+class PrintHistory:
+    """印刷履歴の保存と検索"""
+
+    def __init__(self, folder: Path = PRINT_HISTORY_DIR, legacy_file: Optional[Path] = HISTORY_FILE):
+        self._folder = Path(folder)
+        self._legacy_file = legacy_file
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._records: list[dict] = []                # 時刻順
+        self._by_student: dict[str, list[int]] = {}   # 塾生番号 -> _records の位置
+        self._by_date: dict[str, list[int]] = {}      # "YYYY-MM-DD" -> _records の位置
+        self._counts: dict[str, Counter] = {}         # 結果 -> 塾生番号ごとの件数
+        self._listeners: list[Callable[[], None]] = []
+
+    # --- 読み込み ---
+    @property
+    def is_loaded(self) -> bool:
+        """履歴の読み込みが終わっているか（False の間に検索すると読み込みを待つことになる）"""
+        return self._loaded
+
+    def load(self) -> None:
+        """履歴を読み込む（読み込み済みなら何もしない）。読み込んだらリスナーに通知する"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._ensure_loaded()
+        self._notify()
+
+    def _ensure_loaded(self) -> None:
+        """初回だけ履歴を読み込んで索引を作る（ロックを持った状態で呼ぶ）"""
+        if self._loaded:
+            return
+        try:
+            self._migrate_legacy()
+        except Exception as e:
+            # 以前の履歴ファイルは残っているので、次回の起動時にもう一度移行する
+            print(f"[印刷履歴] 以前の履歴の移行に失敗しました: {e}")
+
+        self._records, self._by_student, self._by_date, self._counts = [], {}, {}, {}
+        if self._folder.exists():
+            self._load_segments()
+        self._loaded = True
+
+    def _load_segments(self) -> None:
+        """月ごとのファイルを読み込んで索引を作る"""
+        records = []
+        broken = 0
+        for path in sorted(self._folder.glob("*.jsonl"), key=lambda p: (p.name != LEGACY_SEGMENT, p.name)):
+            try:
+                with path.open("r", encoding="utf-8") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        try:
+                            records.append(json.loads(line))
+                        except json.JSONDecodeError:
+                            broken += 1
+            except OSError as e:
+                print(f"[印刷履歴] 読み込みに失敗しました: {path} - {e}")
+        if broken:
+            print(f"[印刷履歴] 壊れた行を{broken}行読み飛ばしました")
+
+        records.sort(key=lambda r: r.get('timestamp', ''))
+        for record in records:
+            self._index(record)
+
+    def _migrate_legacy(self) -> None:
+        """以前の print_history.json を legacy.jsonl に移し替える"""
+        legacy = self._legacy_file
+        if legacy is None or not legacy.exists():
+            return
+        try:
+            with legacy.open("r", encoding="utf-8") as f:
+                history = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"[印刷履歴] 以前の履歴ファイルを読み込めないため移行しません: {legacy} - {e}")
+            return
+
+        # 移行の途中で落ちても、次回は同じ内容で作り直すだけになるよう一時ファイルから置き換える
+        self._folder.mkdir(parents=True, exist_ok=True)
+        path = self._folder / LEGACY_SEGMENT
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            for record in history if isinstance(history, list) else []:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path.replace(path)
+        legacy.replace(legacy.with_name(legacy.name + ".migrated"))
+        print(f"[印刷履歴] 以前の履歴 {len(history)}件を {path} に移行しました")
+
+    def _index(self, record: dict) -> None:
+        position = len(self._records)
+        self._records.append(record)
+        student_id = str(record.get('studentId', ''))
+        self._by_student.setdefault(student_id, []).append(position)
+        self._by_date.setdefault(record.get('timestamp', '')[:10], []).append(position)
+        self._counts.setdefault(record.get('result', ''), Counter())[student_id] += 1
+
+    # --- 追記 ---
+    def append(self, entries: list[dict]) -> None:
+        """記録を追記して fsync する"""
+        if not entries:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._folder.mkdir(parents=True, exist_ok=True)
+            segments: dict[str, list[dict]] = {}
+            for entry in entries:
+                segments.setdefault(_segment_name(entry['timestamp']), []).append(entry)
+            for name, segment in segments.items():
+                self._write_lines(self._folder / name, segment)
+            for entry in entries:
+                self._index(entry)
+            self._rotate()
+        self._notify()
+
+    @staticmethod
+    def _write_lines(path: Path, entries: list[dict]) -> None:
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        # 前回の書き込みが途中で止まって最後の行に改行がなければ、新しい行とつながらないよう改行を足す
+        if path.exists() and path.stat().st_size > 0:
+            with path.open("rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = "\n" + data
+        with path.open("a", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rotate(self) -> None:
+        """
+        保存期間（print_history_keep_months）より古い月のファイルを削除する
+
+        削除した月の記録はメモリ上の索引には残り、次回の起動時から読み込まれなくなる。
+        """
+        keep_months = int(load_settings().get('print_history_keep_months', 0))
+        if keep_months <= 0:
+            return
+        today = date.today()
+        month_index = today.year * 12 + today.month - 1 - (keep_months - 1)
+        oldest = f"{month_index // 12:04d}-{month_index % 12 + 1:02d}.jsonl"
+        for path in self._folder.glob("*.jsonl"):
+            if path.name != LEGACY_SEGMENT and path.name < oldest:
+                try:
+                    path.unlink()
+                    print(f"[印刷履歴] 保存期間を過ぎた履歴を削除しました: {path.name}")
+                except OSError as e:
+                    print(f"[印刷履歴] 古い履歴を削除できませんでした: {path.name} - {e}")
+
+    # --- 検索 ---
+    def last_printed(self, student_id: str, result: Optional[str] = 'success') -> Optional[dict]:
+        """塾生の最後の印刷記録（result=None なら結果を問わない）"""
+        with self._lock:
+            self._ensure_loaded()
+            for position in reversed(self._by_student.get(str(student_id), [])):
+                record = self._records[position]
+                if result is None or record.get('result') == result:
+                    return dict(record)
+        return None
+
+    def records_for_student(self, student_id: str) -> list[dict]:
+        """塾生の印刷記録（古い順）"""
+        with self._lock:
+            self._ensure_loaded()
+            return [dict(self._records[p]) for p in self._by_student.get(str(student_id), [])]
+
+    def records_between(self, start: date, end: date, result: Optional[str] = None) -> list[dict]:
+        """start から end までの日（両端を含む）の印刷記録（古い順）"""
+        with self._lock:
+            self._ensure_loaded()
+            records = []
+            day = start
+            while day <= end:
+                for position in self._by_date.get(day.isoformat(), []):
+                    record = self._records[position]
+                    if result is None or record.get('result') == result:
+                        records.append(dict(record))
+                day += timedelta(days=1)
+            return records
+
+    def failures_this_week(self, today: Optional[date] = None) -> list[dict]:
+        """今週（月曜日から今日まで）の失敗した印刷記録"""
+        today = today or date.today()
+        return self.records_between(today - timedelta(days=today.weekday()), today, result='failure')
+
+    def counts_by_student(self, result: str = 'success') -> dict[str, int]:
+        """塾生番号ごとの印刷回数（既定は成功した回数）"""
+        with self._lock:
+            self._ensure_loaded()
+            return dict(self._counts.get(result, {}))
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """記録が追加されたとき・読み込みが終わったときに呼ばれるコールバックを登録する（呼び出しスレッドは任意）"""
+        self._listeners.append(callback)
+
+    def _notify(self) -> None:
+        for callback in list(self._listeners):
+            try:
+                callback()
+            except Exception as e:
+                print(f"[印刷履歴] 通知の処理に失敗しました: {e}")
+
+
+_history: Optional[PrintHistory] = None
+_history_lock = threading.Lock()
+
+
+def get_print_history() -> PrintHistory:
+    """プロセス全体で共有する印刷履歴を返す"""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = PrintHistory()
+        return _history
+
+
+def add_record(student_id: str, student_name: str, result: str, error: str | None = None):
+    timestamp = datetime.now().isoformat()
+    get_print_history().append([_entry(student_id, student_name, result, error, timestamp)])
+
+
+def add_records(records: list[dict]):
+    """
+    複数の印刷結果をまとめて記録する（1回の追記）
+
+    Args:
+        records: {"id", "name", "result", "error"} のリスト
+    """
+    if not records:
+        return
+    timestamp = datetime.now().isoformat()
+    get_print_history().append([
+        _entry(record['id'], record['name'], record['result'], record.get('error'), timestamp)
+        for record in records
+    ])
@@ -0,0 +1,318 @@
+"""
+ラベル印刷のスプーラー
+
+印刷ジョブを1つのキューに積み、スケジューラの print プール（ワーカー1つ）で1件ずつ印刷する。
+sample_data.csv・一括印刷用CSVとプリンターに触るのはこのワーカーだけなので、
+続けて印刷ボタンが押されても P-touch Editor が同時に起動して取り合うことはない。
+
+- キューは print_queue.json に保存し、アプリを起動し直しても待ち中のジョブから再開する
+  （印刷中に終了したジョブは二重印刷を避けるため「失敗」とし、画面から再試行できる）
+- 一括印刷は P-touch Editor の1回の起動ごとに印刷できた塾生を保存し、
+  再試行では印刷できていない塾生だけを印刷する
+- 一時的な失敗（P-touch Editorの異常終了など）は間隔を空けて自動で再試行する
+- ジョブの状態が変わるたびに登録したコールバックに通知する（印刷画面のキュー表示用）
+"""
+
+import itertools
+import json
+import subprocess
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from .config import PRINT_QUEUE_FILE
+from .print_history import add_records
+from .printer_control import print_label, print_labels
+from .spreadsheet import update_selected_student_csv
+from .task_scheduler import get_scheduler
+
+QUEUED, PRINTING, RETRYING, DONE, FAILED, CANCELLED = (
+    "queued", "printing", "retrying", "done", "failed", "cancelled"
+)
+STATUS_LABELS = {
+    QUEUED: "待機中",
+    PRINTING: "印刷中",
+    RETRYING: "再試行待ち",
+    DONE: "完了",
+    FAILED: "失敗",
+    CANCELLED: "取消",
+}
+ACTIVE_STATUSES = (QUEUED, PRINTING, RETRYING)
+
+MAX_ATTEMPTS = 3
+RETRY_DELAYS = (2, 5)  # 2回目・3回目の前に待つ秒数
+KEEP_FINISHED = 50  # 保存しておく終了済みジョブの数
+
+
+class PrintSpooler:
+    """印刷ジョブのキュー"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._jobs: list[dict] = []
+        self._listeners: list[Callable[[], None]] = []
+        self._draining = False
+        self._load()
+        self._ids = itertools.count(max((job["id"] for job in self._jobs), default=0) + 1)
+
+    # --- 永続化 ---
+    def _load(self) -> None:
+        if not PRINT_QUEUE_FILE.exists():
+            return
+        try:
+            with PRINT_QUEUE_FILE.open("r", encoding="utf-8") as f:
+                jobs = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"[印刷キュー] キューの読み込みに失敗しました: {e}")
+            return
+        for job in jobs:
+            if job["status"] == PRINTING:
+                job["status"] = FAILED
+                job["error"] = "印刷中にアプリが終了したため中断しました（再試行できます）"
+            elif job["status"] == RETRYING:
+                job["status"] = QUEUED
+        self._jobs = jobs
+        pending = sum(1 for job in jobs if job["status"] == QUEUED)
+        if pending:
+            print(f"[印刷キュー] 前回の待機中ジョブを再開します: {pending}件")
+
+    def _save(self) -> None:
+        """キューをファイルに保存する（ロックを持った状態で呼ぶ）"""
+        finished = [job for job in self._jobs if job["status"] not in ACTIVE_STATUSES]
+        for job in finished[:-KEEP_FINISHED]:
+            self._jobs.remove(job)
+        try:
+            tmp_path = PRINT_QUEUE_FILE.with_suffix(".tmp")
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump(self._jobs, f, ensure_ascii=False, indent=1)
+            tmp_path.replace(PRINT_QUEUE_FILE)
+        except OSError as e:
+            print(f"[印刷キュー] キューの保存に失敗しました: {e}")
+
+    # --- 操作 ---
+    def start(self) -> None:
+        """保存されていた待機中のジョブの印刷を始める"""
+        self._schedule_drain()
+
+    def submit(self, students: list[dict]) -> int:
+        """印刷ジョブを追加してジョブ番号を返す（students は {"id", "name"} のリスト）"""
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            job = {
+                "id": next(self._ids),
+                "students": [{"id": str(s["id"]), "name": s["name"]} for s in students],
+                "status": QUEUED,
+                "attempts": 0,
+                "error": "",
+                "created_at": now,
+                "updated_at": now,
+            }
+            self._jobs.append(job)
+            self._save()
+        print(f"[印刷キュー] ジョブ{job['id']}を追加しました: {describe(job)}")
+        self._notify()
+        self._schedule_drain()
+        return job["id"]
+
+    def cancel(self, job_id: int) -> bool:
+        """待機中のジョブを取り消す（印刷中のものは取り消せない）"""
+        with self._lock:
+            job = self._find(job_id)
+            if job is None or job["status"] not in (QUEUED, RETRYING):
+                return False
+            self._set_status(job, CANCELLED)
+        self._notify()
+        return True
+
+    def retry(self, job_id: int) -> bool:
+        """失敗したジョブをもう一度キューに入れる"""
+        with self._lock:
+            job = self._find(job_id)
+            if job is None or job["status"] != FAILED:
+                return False
+            job["attempts"] = 0
+            job["error"] = ""
+            self._set_status(job, QUEUED)
+        self._notify()
+        self._schedule_drain()
+        return True
+
+    def jobs(self) -> list[dict]:
+        """ジョブの一覧（新しい順、コピー）"""
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs)]
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs if job["status"] in ACTIVE_STATUSES)
+
+    # --- ワーカー ---
+    def _schedule_drain(self) -> None:
+        with self._lock:
+            if self._draining or not any(job["status"] == QUEUED for job in self._jobs):
+                return
+            self._draining = True
+        get_scheduler().submit("print", self._drain, name="print_spooler")
+
+    def _drain(self) -> None:
+        """待機中のジョブがなくなるまで1件ずつ印刷する（print プールで実行）"""
+        finished = False
+        try:
+            while True:
+                with self._lock:
+                    job = next((j for j in self._jobs if j["status"] == QUEUED), None)
+                    if job is None:
+                        self._draining = False
+                        finished = True
+                        return
+                    self._set_status(job, PRINTING)
+                self._notify()
+                try:
+                    self._run(job)
+                except Exception as e:
+                    # 想定外のエラーでもジョブを「印刷中」のまま残さず、次のジョブに進む
+                    print(f"[印刷キュー] ジョブ{job['id']}の処理中にエラーが発生しました: {e}")
+                    with self._lock:
+                        if job["status"] in ACTIVE_STATUSES:
+                            job["error"] = str(e)
+                            self._set_status(job, FAILED)
+                    self._notify()
+        finally:
+            if not finished:
+                with self._lock:
+                    self._draining = False
+
+    def _run(self, job: dict) -> None:
+        """1つのジョブを印刷する（一時的な失敗は再試行する）"""
+        remaining = _unfinished(job)
+        while remaining:
+            with self._lock:
+                if job["status"] == CANCELLED:
+                    return
+                job["attempts"] += 1
+                attempt = job["attempts"]
+            try:
+                results = self._print(job, remaining)
+                error, transient = "", True
+            except Exception as e:
+                results, error, transient = [], str(e), _is_transient(e)
+
+            remaining = _unfinished(job)
+            if not remaining:
+                break
+            failed = [r for r in results if r["result"] != "success"] or [
+                {"id": s["id"], "name": s["name"], "result": "failure", "error": error} for s in remaining
+            ]
+
+            error = error or failed[0]["error"]
+            if not transient or attempt >= MAX_ATTEMPTS:
+                add_records(failed)
+                with self._lock:
+                    job["error"] = error
+                    self._set_status(job, FAILED)
+                print(f"[印刷キュー] ジョブ{job['id']}が失敗しました: {error}")
+                self._notify()
+                return
+
+            delay = RETRY_DELAYS[min(attempt - 1, len(RETRY_DELAYS) - 1)]
+            with self._lock:
+                job["error"] = error
+                self._set_status(job, RETRYING)
+            print(f"[印刷キュー] ジョブ{job['id']}を{delay}秒後に再試行します（{attempt}/{MAX_ATTEMPTS}回目で失敗）: {error}")
+            self._notify()
+            time.sleep(delay)
+            with self._lock:
+                if job["status"] == CANCELLED:
+                    return
+                self._set_status(job, PRINTING)
+            self._notify()
+
+        with self._lock:
+            job["error"] = ""
+            self._set_status(job, DONE)
+        print(f"[印刷キュー] ジョブ{job['id']}が完了しました: {describe(job)}")
+        self._notify()
+
+    def _print(self, job: dict, students: list[dict]) -> list[dict]:
+        """
+        印刷して塾生ごとの結果を返す（1人なら sample_data.csv、複数なら一括印刷）
+
+        印刷できた塾生は、P-touch Editor の1回の起動が終わるたびにジョブに記録して保存する。
+        """
+        if len(students) == 1:
+            student = students[0]
+            if not update_selected_student_csv(student["id"], student["name"]):
+                raise OSError("sample_data.csvを更新できませんでした")
+            print_label(student["id"], student["name"])
+            results = [{"id": student["id"], "name": student["name"], "result": "success", "error": ""}]
+            self._record_printed(job, results)
+            return results
+        return print_labels(students, on_chunk=lambda results: self._record_printed(job, results))
+
+    def _record_printed(self, job: dict, results: list[dict]) -> None:
+        """印刷できた塾生をジョブに記録して保存し、印刷履歴に追記する"""
+        succeeded = [r for r in results if r["result"] == "success"]
+        if not succeeded:
+            return
+        printed = {r["id"] for r in succeeded}
+        with self._lock:
+            for student in job["students"]:
+                if student["id"] in printed:
+                    student["done"] = True
+            self._save()
+        add_records(succeeded)
+
+    # --- 内部 ---
+    def _find(self, job_id: int) -> Optional[dict]:
+        return next((job for job in self._jobs if job["id"] == job_id), None)
+
+    def _set_status(self, job: dict, status: str) -> None:
+        """ジョブの状態を変えて保存する（ロックを持った状態で呼ぶ）"""
+        job["status"] = status
+        job["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        self._save()
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """ジョブの状態が変わったときに呼ばれるコールバックを登録する（呼び出しスレッドは任意）"""
+        self._listeners.append(callback)
+
+    def _notify(self) -> None:
+        for callback in list(self._listeners):
+            try:
+                callback()
+            except Exception as e:
+                print(f"[印刷キュー] 通知の処理に失敗しました: {e}")
+
+
+def _unfinished(job: dict) -> list[dict]:
+    """ジョブのうちまだ印刷できていない塾生"""
+    return [s for s in job["students"] if not s.get("done")]
+
+
+def _is_transient(error: Exception) -> bool:
+    """再試行すれば成功する見込みのある失敗か"""
+    if isinstance(error, FileNotFoundError):
+        return False  # テンプレートやP-touch Editorがない
+    return isinstance(error, (subprocess.CalledProcessError, OSError))
+
+
+def describe(job: dict) -> str:
+    """ジョブの内容を短く表す文字列"""
+    students = job["students"]
+    if len(students) == 1:
+        return f"{students[0]['name']}（{students[0]['id']}）"
+    return f"{students[0]['name']} ほか{len(students) - 1}人"
+
+
+_spooler: Optional[PrintSpooler] = None
+_spooler_lock = threading.Lock()
+
+
+def get_spooler() -> PrintSpooler:
+    """プロセス全体で共有する印刷スプーラーを返す"""
+    global _spooler
+    with _spooler_lock:
+        if _spooler is None:
+            _spooler = PrintSpooler()
+        return _spooler
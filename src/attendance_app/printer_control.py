@@ -4,6 +4,7 @@ import os
 import csv
 import tempfile
 import time
+from typing import Callable, Optional
 from .config import load_settings
 
 # P-touch Editorのデフォルトパス
@@ -18,9 +19,15 @@ def get_ptouch_editor_path():
 # このファイルの場所から assets/label_template.lbx を指す
 LABEL_TEMPLATE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'assets', 'qr_text_template.lbx'))
 
-def print_label(student_id: str, student_name: str) -> None:
-    """Brother P-touch EditorでQRコード（テキストベース）ラベルを印刷する（ワンクリック印刷対応）"""
-    
+# 一括印刷で1回のP-touch Editorの起動で印刷するラベルの枚数（設定 label_batch_size で変更可）
+DEFAULT_LABEL_BATCH_SIZE = 20
+
+# 一括印刷用のデータベースファイル（1件印刷用の sample_data.csv とは分ける）
+BATCH_CSV_FILE = os.path.join(os.path.dirname(__file__), 'assets', 'label_batch.csv')
+
+
+def _check_print_environment() -> str:
+    """テンプレートとP-touch Editorがあることを確認し、P-touch Editorのパスを返す"""
     if not Path(LABEL_TEMPLATE).exists():
         raise FileNotFoundError(f"ラベルテンプレートが見つかりません: {LABEL_TEMPLATE}")
 
@@ -32,6 +39,56 @@ def print_label(student_id: str, student_name: str) -> None:
         raise FileNotFoundError(f"P-touch Editorが見つかりません: {ptouch_editor}\n"
                               f"Brother P-touch Editorをインストールするか、\n"
                               f"設定画面で正しいパスを設定してください。")
+    return ptouch_editor
+
+
+def _run_ptouch_editor(ptouch_editor: str, csv_file: str, records: str) -> None:
+    """
+    P-touch Editorでデータベースの指定レコードを印刷する
+
+    Args:
+        records: /R に渡すレコード番号（"1" や "1-20"）
+    """
+    # P-touch Editorに渡すコマンドを作成
+    # /D: データベースファイル（CSV）を指定
+    # /R: レコード番号（範囲指定も可）を指定
+    # /P: 印刷実行
+    # /FIT: 自動フィット
+    # /S: 印刷設定ダイアログを表示しない
+    cmd = [
+        ptouch_editor,
+        str(LABEL_TEMPLATE),
+        f'/D:{csv_file}',
+        f'/R:{records}',
+        '/FIT',  # 自動フィット
+        '/S',  # 印刷設定ダイアログを表示しない
+        '/P',  # 印刷実行
+    ]
+    
+    print(f"実行コマンド: {' '.join(cmd)}") # デバッグ用にコマンドを出力
+    
+    try:
+        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        print(f"標準出力: {result.stdout}")
+    except subprocess.CalledProcessError as e:
+        print(f"P-touch Editorの実行に失敗しました。")
+        print(f"コマンド: {e.cmd}")
+        print(f"リターンコード: {e.returncode}")
+        print(f"標準出力: {e.stdout}")
+        print(f"標準エラー: {e.stderr}")
+        raise
+
+
+def print_label(student_id: str, student_name: str) -> None:
+    """Brother P-touch EditorでQRコード（テキストベース）ラベルを印刷する（ワンクリック印刷対応）"""
+    from . import label_raster
+
+    if label_raster.is_enabled():
+        # 設定 label_backend が "raster" ならP-touch Editorを使わずに直接印刷する
+        label_raster.print_labels_raster([(student_id, student_name)])
+        return
+
+    ptouch_editor = _check_print_environment()
 
     # sample_data.csvのパスを取得（塾生選択時に既に更新済み）
     csv_file = os.path.join(os.path.dirname(__file__), 'assets', 'sample_data.csv')
@@ -47,36 +104,91 @@ def print_label(student_id: str, student_name: str) -> None:
         print(f"テンプレートファイル: {LABEL_TEMPLATE}")
         print(f"P-touch Editorパス: {ptouch_editor}")
         
-        # P-touch Editorに渡すコマンドを作成
-        # /D: データベースファイル（CSV）を指定
-        # /R: レコード番号（1行目のデータ）を指定
-        # /P: 印刷実行
-        # /FIT: 自動フィット
-        # /S: 印刷設定ダイアログを表示しない
-        cmd = [
-            ptouch_editor,
-            str(LABEL_TEMPLATE),
-            f'/D:{csv_file}',  # 事前に更新されたCSVファイルを指定
-            '/R:1',  # 1行目のデータレコードを使用
-            '/FIT',  # 自動フィット
-            '/S',  # 印刷設定ダイアログを表示しない
-            '/P',  # 印刷実行
-        ]
-        
-        print(f"実行コマンド: {' '.join(cmd)}") # デバッグ用にコマンドを出力
-        
-        # P-touch Editorを実行
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        _run_ptouch_editor(ptouch_editor, csv_file, '1')  # 1行目のデータレコードを使用
         print("ワンクリック印刷が正常に完了しました。")
-        print(f"標準出力: {result.stdout}")
         
-    except subprocess.CalledProcessError as e:
-        print(f"P-touch Editorの実行に失敗しました。")
-        print(f"コマンド: {e.cmd}")
-        print(f"リターンコード: {e.returncode}")
-        print(f"標準出力: {e.stdout}")
-        print(f"標準エラー: {e.stderr}")
-        raise
     except FileNotFoundError as e:
         print(f"ファイルが見つかりません: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def print_labels(students: list[dict], chunk_size: Optional[int] = None,
+                 progress: Optional[Callable[[int, int], None]] = None,
+                 on_chunk: Optional[Callable[[list[dict]], None]] = None) -> list[dict]:
+    """
+    複数の塾生のラベルをまとめて印刷する
+
+    選択された塾生を1つのデータベースCSVに書き込み、chunk_size 件ずつレコード範囲を指定して
+    P-touch Editorを起動する（塾生ごとに起動し直さない）。
+
+    Args:
+        students: {"id", "name"} のリスト
+        chunk_size: 1回の起動で印刷する件数（省略時は設定 label_batch_size）
+        progress: 1回の起動が終わるたびに (印刷した件数, 全件数) で呼ばれる
+        on_chunk: 1回の起動が終わるたびにその回の塾生ごとの結果で呼ばれる
+            （途中で止まっても、どこまで印刷できたかを残せるように）
+
+    Returns:
+        塾生ごとの結果 {"id", "name", "result": "success" / "failure", "error"}
+    """
+    from . import label_raster
+    from .spreadsheet import write_label_csv
+
+    if not students:
+        return []
+    chunk_size = chunk_size or int(load_settings().get('label_batch_size', DEFAULT_LABEL_BATCH_SIZE))
+    chunk_size = max(1, chunk_size)
+    if label_raster.is_enabled():
+        return _print_labels_raster(students, chunk_size, progress, on_chunk)
+    ptouch_editor = _check_print_environment()
+
+    if not write_label_csv(BATCH_CSV_FILE, students):
+        raise RuntimeError(f"一括印刷用のCSVを書き込めませんでした: {BATCH_CSV_FILE}")
+
+    print(f"=== 一括印刷処理開始: {len(students)}件（{chunk_size}件ずつ） ===")
+    results = []
+    for start in range(0, len(students), chunk_size):
+        chunk = students[start:start + chunk_size]
+        first, last = start + 1, start + len(chunk)  # レコード番号は1から
+        try:
+            _run_ptouch_editor(ptouch_editor, BATCH_CSV_FILE, f'{first}-{last}' if last > first else f'{first}')
+            outcome, error = 'success', ''
+        except Exception as e:
+            outcome, error = 'failure', str(e)
+        chunk_results = [{"id": s['id'], "name": s['name'], "result": outcome, "error": error} for s in chunk]
+        results.extend(chunk_results)
+        if on_chunk:
+            on_chunk(chunk_results)
+        if progress:
+            progress(last, len(students))
+
+    failed = sum(1 for r in results if r['result'] != 'success')
+    print(f"=== 一括印刷処理終了: 成功 {len(results) - failed}件 / 失敗 {failed}件 ===")
+    return results
+
+
+def _print_labels_raster(students: list[dict], chunk_size: int,
+                         progress: Optional[Callable[[int, int], None]],
+                         on_chunk: Optional[Callable[[list[dict]], None]]) -> list[dict]:
+    """print_labels のラスター印刷版（chunk_size 件ずつ1つの印刷ジョブにする）"""
+    from .label_raster import print_labels_raster
+
+    print(f"=== 一括印刷処理開始（ラスター印刷）: {len(students)}件（{chunk_size}件ずつ） ===")
+    results = []
+    for start in range(0, len(students), chunk_size):
+        chunk = students[start:start + chunk_size]
+        try:
+            print_labels_raster([(s['id'], s['name']) for s in chunk])
+            outcome, error = 'success', ''
+        except Exception as e:
+            outcome, error = 'failure', str(e)
+        chunk_results = [{"id": s['id'], "name": s['name'], "result": outcome, "error": error} for s in chunk]
+        results.extend(chunk_results)
+        if on_chunk:
+            on_chunk(chunk_results)
+        if progress:
+            progress(start + len(chunk), len(students))
+
+    failed = sum(1 for r in results if r['result'] != 'success')
+    print(f"=== 一括印刷処理終了: 成功 {len(results) - failed}件 / 失敗 {failed}件 ===")
+    return results
@@ -1,5 +1,31 @@
-import requests
+"""
+QRコード画像の取得・生成
+
+塾生のQRコードは塾生番号だけを表すので、Google Driveから取り寄せなくてもローカルで生成できる。
+生成した画像は (塾生番号, サイズ, 誤り訂正レベル) ごとに cache/qr/ に保存して使い回す。
+同じ入力からは常に同じ画像が生成される。
+
+生成には qrcode パッケージ（Pillowを使用）が必要。入っていない場合は is_available() が
+False を返し、呼び出し側はGoogle Driveの画像を使う。
+"""
+
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+from typing import Iterable, Optional
+
+import requests
+
+from .config import CACHE_DIR
+
+QR_CACHE_DIR = CACHE_DIR / "qr"
+DEFAULT_SIZE = 400  # px
+DEFAULT_ERROR_CORRECTION = "M"
+BORDER = 4  # QRコードの規格で必要な余白（モジュール数）
+ERROR_CORRECTION_LEVELS = ("L", "M", "Q", "H")
 
 
 def download_qr(url: str, dest: Path) -> Path:
@@ -7,4 +33,116 @@ def download_qr(url: str, dest: Path) -> Path:
     resp = requests.get(url, timeout=10)
     resp.raise_for_status()
     dest.write_bytes(resp.content)
-    return dest
\ No newline at end of file
+    return dest
+
+
+@lru_cache()
+def is_available() -> bool:
+    """ローカルでQRコードを生成できるか（qrcode パッケージがあるか）"""
+    try:
+        import qrcode  # noqa: F401
+        from PIL import Image  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def cache_path(student_id: str, size: int = DEFAULT_SIZE,
+               error_correction: str = DEFAULT_ERROR_CORRECTION) -> Path:
+    """生成したQRコード画像の保存先"""
+    student_id = str(student_id)
+    # ファイル名に使えない文字を置き換え、置き換えで別の塾生番号と重ならないようハッシュを付ける
+    safe_id = re.sub(r"[^0-9A-Za-z_-]", "_", student_id)[:40]
+    digest = hashlib.sha1(student_id.encode("utf-8")).hexdigest()[:8]
+    return QR_CACHE_DIR / f"{safe_id}_{digest}_{size}_{error_correction}.png"
+
+
+def _make_qr(student_id: str, error_correction: str, border: int = BORDER):
+    import qrcode
+
+    if error_correction not in ERROR_CORRECTION_LEVELS:
+        raise ValueError(f"誤り訂正レベルが不正です: {error_correction}")
+    level = getattr(qrcode.constants, f"ERROR_CORRECT_{error_correction}")
+
+    qr = qrcode.QRCode(version=None, error_correction=level, box_size=1, border=border)
+    qr.add_data(str(student_id))
+    qr.make(fit=True)
+    return qr
+
+
+def qr_matrix(student_id: str, error_correction: str = DEFAULT_ERROR_CORRECTION,
+              border: int = BORDER) -> list[list[bool]]:
+    """QRコードのモジュール（True が黒）を行ごとに返す（余白を含む）"""
+    return _make_qr(student_id, error_correction, border).get_matrix()
+
+
+def _render(student_id: str, size: int, error_correction: str, path: Path) -> None:
+    """QRコード画像を生成して path に保存する（一時ファイルから置き換える）"""
+    from PIL import Image
+
+    qr = _make_qr(student_id, error_correction)
+    image = qr.make_image(fill_color="black", back_color="white").get_image().convert("1")
+    # 1モジュール1pxで作ってから拡大し、モジュールの境界をぼかさない
+    image = image.resize((size, size), Image.NEAREST)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    image.save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+
+
+def render_qr(student_id: str, size: int = DEFAULT_SIZE,
+              error_correction: str = DEFAULT_ERROR_CORRECTION) -> Optional[str]:
+    """
+    塾生番号のQRコード画像のパスを返す（キャッシュになければ生成する）
+
+    生成できない場合（qrcode 未導入など）は None を返す。
+    """
+    path = cache_path(student_id, size, error_correction)
+    if path.exists():
+        return str(path)
+    try:
+        _render(student_id, size, error_correction, path)
+        return str(path)
+    except ImportError:
+        return None
+    except Exception as e:
+        print(f"[QR生成] 塾生番号 {student_id} のQRコードを生成できませんでした: {e}")
+        return None
+
+
+def _render_in_worker(args: tuple) -> bool:
+    """プロセスプールで実行する生成処理"""
+    student_id, size, error_correction = args
+    return render_qr(student_id, size, error_correction) is not None
+
+
+def pregenerate(student_ids: Iterable[str], size: int = DEFAULT_SIZE,
+                error_correction: str = DEFAULT_ERROR_CORRECTION,
+                max_workers: Optional[int] = None) -> int:
+    """
+    名簿全体のQRコードをまとめて生成しておく（キャッシュ済みのものは飛ばす）
+
+    画像の生成はCPUを使うので、プロセスプールで並列に実行する。
+    生成した枚数を返す。
+    """
+    if not is_available():
+        print("[QR生成] qrcode パッケージがないため事前生成をスキップします")
+        return 0
+
+    jobs = [(str(sid), size, error_correction) for sid in dict.fromkeys(student_ids)
+            if not cache_path(sid, size, error_correction).exists()]
+    if not jobs:
+        return 0
+
+    print(f"[QR生成] {len(jobs)}件のQRコードを事前生成します")
+    try:
+        workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            created = sum(pool.map(_render_in_worker, jobs, chunksize=16))
+    except Exception as e:
+        # プロセスを起動できない環境では、このプロセスで順に生成する
+        print(f"[QR生成] プロセスプールを使えないため順に生成します: {e}")
+        created = sum(_render_in_worker(job) for job in jobs)
+    print(f"[QR生成] 事前生成が完了しました: {created}/{len(jobs)}件")
+    return created
@@ -0,0 +1,186 @@
+"""
+QRコード画像の一括同期
+
+Google DriveのQRコードフォルダを get_qr_download_path() のフォルダにまとめてダウンロードする。
+前回ダウンロードしたファイルの md5Checksum / modifiedTime をフォルダ内のマニフェスト
+（.qr_manifest.json）に記録しておき、変わっていないファイルはダウンロードしない。
+同期しておけば、印刷画面で塾生を選んだときのプレビューはディスクからすぐに表示できる。
+
+ダウンロードはスケジューラのioプールに低優先度で投入するので、同時に実行される数は
+プールの大きさまでに抑えられ、キオスクの入退室処理より後回しになる。
+sync_qr_folder 自体はダウンロードの完了を待つので、syncプールに投入して呼ぶ。ioプールのタスクから
+呼ばないこと（ダウンロードを待つ間ワーカーをふさぎ、ワーカーがすべてふさがると終わらなくなる）。
+
+Driveから消えたファイルは、同期でダウンロードしたものだけ削除する。マニフェストを作る前から
+フォルダにあり、中身のハッシュが一致したため記録しただけのファイル（"adopted"）は削除しない。
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+from typing import Callable, Optional
+
+from .drive_handler import download_file_from_drive, get_qr_download_path, list_qr_files_from_drive
+from .task_scheduler import PRIORITY_LOW, get_scheduler
+
+MANIFEST_NAME = ".qr_manifest.json"
+
+
+def _manifest_path(folder: str) -> str:
+    return os.path.join(folder, MANIFEST_NAME)
+
+
+def load_manifest(folder: str) -> dict[str, dict]:
+    """{ファイル名: {"id", "md5Checksum", "modifiedTime"[, "adopted"]}}（なければ空）"""
+    path = _manifest_path(folder)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"[QR同期] マニフェストの読み込みに失敗しました: {path} - {e}")
+        return {}
+
+
+def save_manifest(folder: str, manifest: dict[str, dict]) -> None:
+    path = _manifest_path(folder)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[QR同期] マニフェストの保存に失敗しました: {path} - {e}")
+
+
+def _file_md5(path: str) -> Optional[str]:
+    try:
+        digest = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+
+def _entry(drive_file: dict) -> dict:
+    return {key: drive_file.get(key) for key in ("id", "md5Checksum", "modifiedTime")}
+
+
+def is_up_to_date(folder: str, drive_file: dict, manifest: dict[str, dict]) -> bool:
+    """ローカルのファイルがDrive上のファイルと同じか"""
+    name = drive_file["name"]
+    path = os.path.join(folder, name)
+    if not os.path.exists(path):
+        return False
+
+    recorded = manifest.get(name)
+    if recorded:
+        if drive_file.get("md5Checksum"):
+            return recorded.get("md5Checksum") == drive_file["md5Checksum"]
+        return recorded.get("modifiedTime") == drive_file.get("modifiedTime")
+
+    # マニフェストを作る前からあるファイルは中身のハッシュで確認する（同期で作ったものではない印を付ける）
+    if drive_file.get("md5Checksum") and _file_md5(path) == drive_file["md5Checksum"]:
+        manifest[name] = {**_entry(drive_file), "adopted": True}
+        return True
+    return False
+
+
+def sync_qr_folder(progress: Optional[Callable[[int, int], None]] = None,
+                   full_listing: bool = False) -> dict:
+    """
+    DriveのQRコードフォルダをローカルフォルダに同期する（呼び出したスレッドで完了まで待つ）
+
+    ダウンロードをioプールで実行して待つので、syncプールのタスクとして呼ぶこと（ioプールのタスクからは呼ばない）。
+
+    Args:
+        progress: ダウンロードが1件終わるたびに (終わった件数, ダウンロードする件数) で呼ばれる
+        full_listing: True ならDriveのフォルダ一覧を保存済みのものを使わずに取得し直す
+
+    Returns:
+        {"total", "downloaded", "skipped", "failed": [ファイル名], "removed"}
+    """
+    folder = get_qr_download_path()
+    drive_files = list_qr_files_from_drive(full=full_listing)
+    manifest = load_manifest(folder)
+
+    pending = [f for f in drive_files if not is_up_to_date(folder, f, manifest)]
+    result = {
+        "total": len(drive_files),
+        "downloaded": 0,
+        "skipped": len(drive_files) - len(pending),
+        "failed": [],
+        "removed": 0,
+    }
+    print(f"[QR同期] Drive上のファイル: {len(drive_files)}件 / ダウンロード: {len(pending)}件")
+
+    lock = threading.Lock()
+    finished = 0
+
+    def on_done(drive_file, future):
+        nonlocal finished
+        try:
+            ok = future.result() is not None
+        except Exception:
+            ok = False
+        with lock:
+            finished += 1
+            if ok:
+                manifest[drive_file["name"]] = _entry(drive_file)
+                result["downloaded"] += 1
+            else:
+                result["failed"].append(drive_file["name"])
+            count = finished
+        if progress:
+            progress(count, len(pending))
+
+    scheduler = get_scheduler()
+    handles = []
+    for drive_file in pending:
+        handle = scheduler.submit("io", download_file_from_drive, drive_file["id"], drive_file["name"], folder,
+                                  priority=PRIORITY_LOW, name="qr_sync_download")
+        handle.future.add_done_callback(lambda future, f=drive_file: on_done(f, future))
+        handles.append(handle)
+    for handle in handles:
+        try:
+            handle.result()
+        except Exception:
+            pass  # on_done で失敗として数えている
+
+    # Driveから消えたファイルは、同期でダウンロードしたものだけ削除する
+    # （照合して記録しただけのファイルはマニフェストから外すだけにする）
+    if drive_files:
+        current = {f["name"] for f in drive_files}
+        for name in [name for name in manifest if name not in current]:
+            if manifest[name].get("adopted"):
+                del manifest[name]
+                continue
+            try:
+                os.remove(os.path.join(folder, name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[QR同期] 削除に失敗しました: {name} - {e}")
+                continue
+            del manifest[name]
+            result["removed"] += 1
+
+    save_manifest(folder, manifest)
+    print(f"[QR同期] 完了: ダウンロード {result['downloaded']}件 / スキップ {result['skipped']}件 / "
+          f"失敗 {len(result['failed'])}件 / 削除 {result['removed']}件")
+    return result
+
+
+if __name__ == "__main__":
+    # 使い方: python -m attendance_app.qr_sync [--full]
+    summary = sync_qr_folder(
+        progress=lambda done, total: print(f"  {done}/{total}", end="\r"),
+        full_listing="--full" in sys.argv[1:]
+    )
+    sys.exit(1 if summary["failed"] else 0)
@@ -1,5 +1,4 @@
 import json
-import threading
 from pathlib import Path
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
@@ -18,8 +17,8 @@ from kivy.core.text import LabelBase
 from kivy.clock import Clock
 
 from .report_system.template_loader import load_report_template, save_report_template, get_template_path
-from .report_system.report_generator import generate_sample_report_with_dummy_data
-from .report_system.preview_generator import generate_report_preview, create_layout_preview
+# report_generator / preview_generator（reportlab・PIL）は使用時に読み込む
+from .task_scheduler import get_scheduler, CancellationToken
 
 
 class ReportEditorScreen(Screen):
@@ -529,14 +528,23 @@ class ReportEditorScreen(Screen):
                 
     def update_preview(self):
         """プレビューを更新"""
+        # 古い設定でのプレビュー生成は不要になるため取り消す
+        if getattr(self, "_preview_token", None):
+            self._preview_token.cancel()
+        token = self._preview_token = CancellationToken()
+        
         def update_in_thread():
             try:
                 # 現在の設定を収集
                 self.collect_settings()
                 
                 # プレビュー生成
+                from .report_system.preview_generator import generate_report_preview, create_layout_preview
+
                 preview_path = generate_report_preview(self.template_data)
+                token.raise_if_cancelled()
                 layout_path = create_layout_preview(self.template_data)
+                token.raise_if_cancelled()
                 
                 # UIスレッドで画像を更新
                 Clock.schedule_once(lambda dt: self.update_preview_images(preview_path, layout_path))
@@ -544,7 +552,7 @@ class ReportEditorScreen(Screen):
             except Exception as e:
                 print(f"プレビュー更新エラー: {e}")
                 
-        threading.Thread(target=update_in_thread, daemon=True).start()
+        get_scheduler().submit("cpu", update_in_thread, token=token, name="template_preview")
         
     def update_preview_images(self, preview_path, layout_path):
         """プレビュー画像を更新"""
@@ -609,12 +617,14 @@ class ReportEditorScreen(Screen):
                 save_report_template(self.template_data)
                 
                 # プレビュー生成
+                from .report_system.report_generator import generate_sample_report_with_dummy_data
+
                 pdf_path = generate_sample_report_with_dummy_data()
                 Clock.schedule_once(lambda dt: self.on_preview_complete(pdf_path))
             except Exception as e:
                 Clock.schedule_once(lambda dt: self.on_preview_error(str(e)))
         
-        threading.Thread(target=generate_in_thread, daemon=True).start()
+        get_scheduler().submit("cpu", generate_in_thread, name="sample_report")
         
     def collect_settings(self):
         """UI設定を収集"""
@@ -1,5 +1,4 @@
 import os
-import threading
 import webbrowser
 from datetime import datetime
 from pathlib import Path
@@ -17,8 +16,11 @@ from kivy.graphics import Color, Rectangle
 from kivy.core.text import LabelBase
 
 from .config import load_settings, save_settings
-from .report_system.excel_report_generator import generate_excel_reports
-from .report_system.data_analyzer import get_students_with_attendance, get_all_students_list
+from .task_scheduler import get_scheduler
+from .list_views import DataListView
+from .student_search import get_student_index
+# レポート生成（openpyxl・reportlab など）と出席データの読み込みは、
+# 起動を速くするため実際に使う時点で読み込む
 from .report_system.utils import get_current_month_year, get_month_name_japanese, list_generated_reports
 
 
@@ -315,18 +317,14 @@ class ReportScreen(Screen):
         refresh_button.bind(on_press=self.refresh_reports_list)
         section.add_widget(refresh_button)
         
-        # スクロール可能なリスト
-        scroll = ScrollView()
-        
-        self.reports_list_layout = BoxLayout(
-            orientation="vertical",
-            size_hint_y=None,
-            spacing=5
+        # スクロール可能なリスト（表示中の行だけを作るRecycleView）
+        self.reports_list_view = DataListView(
+            viewclass="ReportRow",
+            row_height="40dp",
+            spacing=5,
+            on_action=self._on_report_action
         )
-        self.reports_list_layout.bind(minimum_height=self.reports_list_layout.setter('height'))
-        
-        scroll.add_widget(self.reports_list_layout)
-        section.add_widget(scroll)
+        section.add_widget(self.reports_list_view)
         
         # 初期リストを読み込み
         self.refresh_reports_list()
@@ -334,75 +332,41 @@ class ReportScreen(Screen):
         return section
         
     def refresh_reports_list(self, instance=None):
-        """レポートリストを更新"""
-        self.reports_list_layout.clear_widgets()
-        
+        """レポートリストを更新（変わった行だけを差し替える）"""
         reports = list_generated_reports()
         
         if not reports:
-            no_reports_label = Label(
-                text="生成されたレポートはありません",
+            self.reports_list_view.show_message(
+                "生成されたレポートはありません",
                 font_name=self.get_font_name(),
-                size_hint_y=None,
-                height="40dp",
-                color=(0.5, 0.5, 0.5, 1)
+                height="40dp"
             )
-            self.reports_list_layout.add_widget(no_reports_label)
-        else:
-            for report in reports:
-                report_layout = BoxLayout(
-                    orientation="horizontal",
-                    size_hint_y=None,
-                    height="40dp",
-                    spacing=10
-                )
-                
-                # ファイル名
-                name_label = Label(
-                    text=report['name'],
-                    font_name=self.get_font_name(),
-                    size_hint_x=0.6,
-                    text_size=(None, None),
-                    halign="left",
-                    color=(0.17, 0.24, 0.31, 1)  # ダークブルーグレー
-                )
-                report_layout.add_widget(name_label)
-                
-                # ファイルサイズ
-                size_label = Label(
-                    text=report['size_formatted'],
-                    font_name=self.get_font_name(),
-                    size_hint_x=0.15,
-                    color=(0.5, 0.5, 0.5, 1)
-                )
-                report_layout.add_widget(size_label)
-                
-                # 開くボタン
-                open_btn = Button(
-                    text="開く",
-                    font_name=self.get_font_name(),
-                    size_hint_x=0.125,
-                    background_color=(0.286, 0.796, 0.98, 1)
-                )
-                open_btn.bind(on_press=lambda x, path=report['full_path']: self.open_report(path))
-                report_layout.add_widget(open_btn)
-                
-                # 削除ボタン
-                delete_btn = Button(
-                    text="削除",
-                    font_name=self.get_font_name(),
-                    size_hint_x=0.125,
-                    background_color=(0.85, 0.40, 0.40, 1)  # 赤色
-                )
-                delete_btn.bind(on_press=lambda x, path=report['full_path'], name=report['name']: self.delete_report(path, name))
-                report_layout.add_widget(delete_btn)
-                
-                self.reports_list_layout.add_widget(report_layout)
-        
+            return
+
+        font_name = self.get_font_name()
+        self.reports_list_view.set_items([
+            {
+                "key": report['full_path'],
+                "name": report['name'],
+                "size_formatted": report['size_formatted'],
+                "full_path": report['full_path'],
+                "font_name": font_name,
+            }
+            for report in reports
+        ])
+
+    def _on_report_action(self, action, item):
+        """レポート一覧の行のボタンが押されたとき"""
+        if action == "open":
+            self.open_report(item['full_path'])
+        elif action == "delete":
+            self.delete_report(item['full_path'], item['name'])
         
     def show_student_selection(self, instance):
         """生徒選択ダイアログを表示"""
         try:
+            from .report_system.data_analyzer import get_students_with_attendance
+
             year = int(self.year_spinner.text)
             month = int(self.month_spinner.text)
             
@@ -415,22 +379,46 @@ class ReportScreen(Screen):
             # 生徒選択ポップアップを作成
             content = BoxLayout(orientation="vertical", spacing=10)
             
-            scroll = ScrollView()
-            students_layout = BoxLayout(orientation="vertical", size_hint_y=None, spacing=5)
-            students_layout.bind(minimum_height=students_layout.setter('height'))
-            
-            for student in students:
-                btn = Button(
-                    text=f"{student['name']} ({student['id']})",
-                    font_name=self.get_font_name(),
-                    size_hint_y=None,
-                    height="40dp"
-                )
-                btn.bind(on_press=lambda x, s=student: self.generate_individual_report(s))
-                students_layout.add_widget(btn)
-                
-            scroll.add_widget(students_layout)
-            content.add_widget(scroll)
+            students_view = DataListView(
+                viewclass="ListButtonRow",
+                row_height="40dp",
+                spacing=5,
+                on_action=lambda action, item: self.generate_individual_report(item['student'])
+            )
+            font_name = self.get_font_name()
+
+            # 出席のある塾生だけを対象に、入力した塾生番号・氏名で絞り込む
+            index = get_student_index()
+            index.update(students, partial=True)  # 名簿に未登録の塾生も検索できるようにする
+            student_ids = [str(student['id']) for student in students]
+
+            def show_matches(query):
+                matches = index.search(query, among=student_ids)
+                if not matches:
+                    students_view.show_message(f"「{query}」に該当する生徒はいません",
+                                               font_name=font_name, height="40dp")
+                    return
+                students_view.set_items([
+                    {
+                        "key": student['id'],
+                        "student": student,
+                        "text": f"{student['name']} ({student['id']})",
+                        "font_name": font_name,
+                    }
+                    for student in matches
+                ])
+
+            search_input = TextInput(
+                hint_text="塾生番号・氏名で検索",
+                multiline=False,
+                size_hint_y=None,
+                height="40dp",
+                font_name=font_name
+            )
+            search_input.bind(text=lambda instance, value: show_matches(value))
+            show_matches("")
+            content.add_widget(search_input)
+            content.add_widget(students_view)
             
             # 閉じるボタン
             close_btn = Button(
@@ -461,13 +449,15 @@ class ReportScreen(Screen):
         
         def generate_in_thread():
             try:
+                from .report_system.report_generator import generate_monthly_report
+
                 pdf_path = generate_monthly_report(student['id'], year, month)
                 Clock.schedule_once(lambda dt: self.on_generation_complete(pdf_path, f"{student['name']}のレポートが生成されました"))
             except Exception as e:
                 error_msg = str(e)
                 Clock.schedule_once(lambda dt: self.on_generation_error(error_msg))
         
-        threading.Thread(target=generate_in_thread, daemon=True).start()
+        get_scheduler().submit("cpu", generate_in_thread, name="individual_report")
         
     def generate_all_excel_reports(self, instance):
         """全生徒のExcelレポートを生成"""
@@ -482,6 +472,8 @@ class ReportScreen(Screen):
             self.show_popup("エラー", "有効な月を選択してください (1-12)。")
             return
 
+        from .report_system.data_analyzer import get_students_with_attendance
+
         # スプレッドシートにデータが存在するかチェック
         students_with_data = get_students_with_attendance(year, month)
         if not students_with_data:
@@ -496,6 +488,8 @@ class ReportScreen(Screen):
                 students_with_data = get_students_with_attendance(year, month)
                 Clock.schedule_once(lambda dt: self.update_progress("Excelレポートを生成中..."))
                 
+                from .report_system.excel_report_generator import generate_excel_reports
+
                 excel_path = generate_excel_reports(year, month)
                 
                 # 成功メッセージに対象者リストを含める
@@ -514,7 +508,7 @@ class ReportScreen(Screen):
                 error_msg = str(e)
                 Clock.schedule_once(lambda dt: self.on_generation_error(error_msg))
         
-        threading.Thread(target=generate_in_thread, daemon=True).start()
+        get_scheduler().submit("cpu", generate_in_thread, name="excel_reports")
         
     def open_reports_folder(self, instance):
         """レポートフォルダを開く"""
@@ -1,10 +1,18 @@
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
-import pandas as pd
 import gspread
 import time
-from ..spreadsheet import get_client, get_retrieval_sheet
+from ..spreadsheet import get_worksheet, get_retrieval_sheet, RETRIEVAL_SHEET_NAME, INPUT_SHEET_NAME
 from ..config import load_settings
+from ..sheet_cache import get_sheet_values, get_spreadsheet_metadata
+from ..attendance_archive import is_archived, read_archived_month
+from ..attendance_store import (
+    AttendanceTable, parse_entry_time, parse_exit_time, table_for_sheet_values
+)
+from ..attendance_rollups import (
+    EMPTY_HASH, get_rollup_store, month_hashes, month_key, new_summary, summary_to_report
+)
+from ..attendance_bitmap import MonthBitmap, day_mask, popcount
 
 
 def get_attendance_sheet() -> gspread.Worksheet:
@@ -13,13 +21,7 @@ def get_attendance_sheet() -> gspread.Worksheet:
     
     for attempt in range(max_retries):
         try:
-            settings = load_settings()
-            ssid = settings.get("spreadsheet_id")
-            if not ssid:
-                raise RuntimeError("spreadsheet_id is not configured")
-            client = get_client()
-            sh = client.open_by_key(ssid)
-            return sh.worksheet("生徒出席情報")
+            return get_worksheet(INPUT_SHEET_NAME)
         except Exception as e:
             if attempt == max_retries - 1:
                 # 最後の試行でも失敗した場合
@@ -33,8 +35,7 @@ def get_attendance_sheet() -> gspread.Worksheet:
 
 def get_student_name_mapping() -> Dict[str, str]:
     """塾生番号から名前へのマッピングを取得"""
-    sheet = get_retrieval_sheet()
-    records = sheet.get_all_values()
+    records = get_sheet_values(RETRIEVAL_SHEET_NAME, lambda: get_retrieval_sheet().get_all_values())
     mapping = {}
     for row in records[1:]:  # Skip header
         if len(row) >= 2 and row[0] and row[1]:
@@ -42,62 +43,6 @@ def get_student_name_mapping() -> Dict[str, str]:
     return mapping
 
 
-def parse_entry_time(time_str: str) -> Optional[datetime]:
-    """入室時間文字列をdatetimeオブジェクトに変換"""
-    if not time_str:
-        return None
-    
-    # 複数の形式をサポート
-    formats = [
-        "%Y/%m/%d %H:%M:%S",
-        "%Y-%m-%d %H:%M:%S",
-        "%m/%d/%Y %H:%M:%S"
-    ]
-    
-    for fmt in formats:
-        try:
-            return datetime.strptime(time_str, fmt)
-        except ValueError:
-            continue
-    
-    print(f"Warning: Could not parse entry time: {time_str}")
-    return None
-
-
-def parse_exit_time(time_str: str) -> Optional[datetime]:
-    """退室時間文字列をdatetimeオブジェクトに変換"""
-    if not time_str:
-        return None
-    
-    # 複数の形式をサポート
-    formats = [
-        # GMT形式
-        "%a %b %d %Y %H:%M:%S GMT+0900 (日本標準時)",
-        "%a %b %d %Y %H:%M:%S",
-        # 標準形式
-        "%Y/%m/%d %H:%M:%S",
-        "%Y-%m-%d %H:%M:%S",
-        "%m/%d/%Y %H:%M:%S"
-    ]
-    
-    for fmt in formats:
-        try:
-            return datetime.strptime(time_str, fmt)
-        except ValueError:
-            continue
-    
-    # GMT表記を削除して再試行
-    cleaned = time_str.replace(" GMT+0900 (日本標準時)", "")
-    for fmt in formats:
-        try:
-            return datetime.strptime(cleaned, fmt)
-        except ValueError:
-            continue
-    
-    print(f"Warning: Could not parse exit time: {time_str}")
-    return None
-
-
 def calculate_stay_time(entry_time: str, exit_time: str) -> int:
     """入退室時間から滞在時間を計算（分単位）"""
     entry_dt = parse_entry_time(entry_time)
@@ -110,17 +55,13 @@ def calculate_stay_time(entry_time: str, exit_time: str) -> int:
     return max(0, int(delta.total_seconds() / 60))
 
 
-def get_monthly_attendance_data(student_id: str, year: int, month: int) -> dict:
-    """
-    指定生徒の月次出席データを取得・分析（リトライ機能付き）
-    """
+def _fetch_attendance_values() -> List[List[str]]:
+    """出席情報シートの全値を取得（リトライ機能付き、未変更ならキャッシュを使用）"""
     max_retries = 3
     
     for attempt in range(max_retries):
         try:
-            sheet = get_attendance_sheet()
-            records = sheet.get_all_values()
-            break
+            return get_sheet_values(INPUT_SHEET_NAME, lambda: get_attendance_sheet().get_all_values())
         except Exception as e:
             if attempt == max_retries - 1:
                 raise RuntimeError(f"出席データの取得に失敗しました（{max_retries}回試行）: {e}")
@@ -128,103 +69,142 @@ def get_monthly_attendance_data(student_id: str, year: int, month: int) -> dict:
                 wait_time = 2 ** attempt
                 print(f"データ取得試行 {attempt + 1}/{max_retries} 失敗。{wait_time}秒後に再試行...")
                 time.sleep(wait_time)
+
+
+def get_attendance_records(year: int, month: int) -> List[List[str]]:
+    """
+    指定月の出席記録の行を取得（ヘッダー行を除く）
+    アーカイブ済みの月はローカルのアーカイブから、それ以外はシートから読み込む
+    """
+    if is_archived(year, month):
+        return read_archived_month(year, month)
+    return _fetch_attendance_values()[1:]
+
+
+def get_attendance_table(year: int, month: int) -> AttendanceTable:
+    """
+    指定月を含む出席記録をコンパクトなテーブルとして取得
+    アーカイブ済みの月はその月だけ、それ以外はシート全体のテーブルを返す
+    """
+    if is_archived(year, month):
+        return AttendanceTable.from_rows(read_archived_month(year, month), first_row=0)
+    return table_for_sheet_values(_fetch_attendance_values())
+
+
+# Driveの版情報を使い回す秒数（数か月分の集計を続けて参照するときに月ごとに問い合わせない）
+METADATA_TTL = 30
+# 最後の変更がこのアプリの書き込みでも、この秒数ごとにシートの内容と照合する
+# （アプリの書き込みの間にあったスタッフの編集を見逃さないため）
+VERIFY_INTERVAL = 60 * 60
+
+_metadata_memo: tuple[float, Optional[dict]] = (0.0, None)
+
+
+def _spreadsheet_metadata() -> Optional[dict]:
+    """スプレッドシートのDriveの版情報（METADATA_TTL 秒の間は前回の結果を返す）"""
+    global _metadata_memo
+    fetched_at, meta = _metadata_memo
+    if meta is None or time.monotonic() - fetched_at >= METADATA_TTL:
+        spreadsheet_id = load_settings().get("spreadsheet_id")
+        meta = get_spreadsheet_metadata(spreadsheet_id) if spreadsheet_id else None
+        _metadata_memo = (time.monotonic(), meta)
+    return meta
+
+
+def get_monthly_rollup(year: int, month: int) -> dict:
+    """
+    指定月の塾生ごとの集計を取得
+
+    キオスクの書き込みで差分更新している集計を、Driveの版から最新と判断できればシートを取得せずに使う。
+    判断できなければシートを取得して月のハッシュと照合し、一致しなければ出席記録から作り直す。
+    """
+    store = get_rollup_store()
+    if is_archived(year, month):
+        rollup = store.get_month(year, month, "archive")
+        if rollup is None:
+            print(f"[集計] {year}年{month}月の集計を作り直します")
+            rollup = store.rebuild_month(year, month, get_attendance_table(year, month), "archive")
+        return rollup
+
+    meta = _spreadsheet_metadata()
+    if meta:
+        rollup = store.get_current_month(year, month, meta["version"], meta["modified_by_me"],
+                                         VERIFY_INTERVAL)
+        if rollup is not None:
+            return rollup
+
+    values = _fetch_attendance_values()
+    source = _month_hashes(values).get(month_key(year, month), EMPTY_HASH)
+    rollup = store.get_month(year, month, source)
+    if rollup is None:
+        print(f"[集計] {year}年{month}月の集計を作り直します")
+        rollup = store.rebuild_month(year, month, table_for_sheet_values(values), source)
+    if meta:
+        store.mark_verified(year, month, meta["version"])
+    return rollup
+
+
+# 直前に月ごとのハッシュを求めたシートの値（sheet_cache は未変更なら同じリストを返す）
+_hash_memo: tuple[Optional[list], dict[str, str]] = (None, {})
+
+
+def _month_hashes(values: List[List[str]]) -> dict[str, str]:
+    """シートの値の月ごとのハッシュ（同じ値に対しては1回だけ計算する）"""
+    global _hash_memo
+    cached_values, hashes = _hash_memo
+    if cached_values is not values:
+        hashes = month_hashes(values)
+        _hash_memo = (values, hashes)
+    return hashes
+
+
+def get_monthly_attendance_data(student_id: str, year: int, month: int) -> dict:
+    """
+    指定生徒の月次出席データを取得・分析（リトライ機能付き）
+    """
+    rollup = get_monthly_rollup(year, month)
+    summary = rollup["students"].get(str(student_id)) or new_summary()
     
     # Get student name mapping
     name_mapping = get_student_name_mapping()
     student_name = name_mapping.get(student_id, "Unknown")
     
-    # Filter records for the specific student and month
-    daily_records = []
-    mood_count = {"快晴": 0, "晴れ": 0, "くもり": 0}
-    sleep_count = {"０％": 0, "２５％": 0, "５０％": 0, "７５％": 0, "１００％": 0}
-    purpose_count = {"学ぶ": 0, "来る": 0}
-    sleep_values = []
-    
-    for i, row in enumerate(records[1:], 1):  # Skip header, start from row 1
-        if len(row) < 3:  # Minimum columns needed
-            continue
-            
-        
-        # Check if this record is for our student
-        if len(row) > 1 and row[1] != student_id:  # Column B: 塾生番号
-            continue
-            
-        # Parse entry time and check if it's in our target month
-        entry_time = parse_entry_time(row[0])  # Column A: 入室時間
-        if not entry_time:
-            continue
-            
-        if entry_time.year != year or entry_time.month != month:
-            continue
-            
-        exit_time_str = row[6] if len(row) > 6 else ""  # Column G: 退出時間
-        if not exit_time_str:  # Skip records without exit time
-            continue
-            
-        stay_minutes = calculate_stay_time(row[0], exit_time_str)
-        
-        # Extract additional data
-        mood = row[3] if len(row) > 3 else ""  # Column D: 気分の天気
-        sleep_satisfaction = row[4] if len(row) > 4 else ""  # Column E: 睡眠満足度
-        purpose = row[5] if len(row) > 5 else ""  # Column F: 来塾の目的
-        
-        # Count mood
-        if mood in mood_count:
-            mood_count[mood] += 1
-            
-        # Count sleep satisfaction
-        if sleep_satisfaction:
-            sleep_percent = sleep_satisfaction.replace("%", "").replace("％", "")
-            try:
-                sleep_val = int(sleep_percent)
-                sleep_values.append(sleep_val)
-                if sleep_val == 0:
-                    sleep_count["０％"] += 1
-                elif sleep_val == 25:
-                    sleep_count["２５％"] += 1
-                elif sleep_val == 50:
-                    sleep_count["５０％"] += 1
-                elif sleep_val == 75:
-                    sleep_count["７５％"] += 1
-                elif sleep_val == 100:
-                    sleep_count["１００％"] += 1
-            except ValueError:
-                pass
-                
-        # Count purpose
-        if purpose in purpose_count:
-            purpose_count[purpose] += 1
-            
-        # Add to daily records
-        daily_records.append({
-            "date": entry_time.strftime("%Y-%m-%d"),
-            "entry_time": entry_time.strftime("%H:%M"),
-            "exit_time": parse_exit_time(exit_time_str).strftime("%H:%M") if parse_exit_time(exit_time_str) else "",
-            "stay_minutes": stay_minutes,
-            "mood": mood,
-            "sleep_satisfaction": sleep_satisfaction,
-            "purpose": purpose
-        })
-    
-    # Calculate averages
-    attendance_count = len(daily_records)
-    average_stay_minutes = sum(r["stay_minutes"] for r in daily_records) / attendance_count if attendance_count > 0 else 0
-    average_sleep_percentage = sum(sleep_values) / len(sleep_values) if sleep_values else 0
-    
+    days_mask = day_mask(summary["days"])
     return {
         "student_name": student_name,
-        "attendance_count": attendance_count,
-        "average_stay_minutes": round(average_stay_minutes, 1),
-        "daily_records": daily_records,
-        "mood_distribution": mood_count,
-        "sleep_stats": {
-            "average_percentage": round(average_sleep_percentage, 1),
-            "distribution": sleep_count
-        },
-        "purpose_distribution": purpose_count
+        **summary_to_report(summary),
+        "attendance_days_mask": days_mask,
+        "attendance_days": popcount(days_mask),
     }
 
 
+def get_month_bitmap(year: int, month: int) -> MonthBitmap:
+    """指定月の塾生×日の出席ビットマップを取得"""
+    return MonthBitmap.from_rollup(year, month, get_monthly_rollup(year, month))
+
+
+def get_attendance_trend(student_id: str, year: int, month: int, months: int = 6) -> List[dict]:
+    """
+    指定月までの数か月分の出席傾向を取得（古い月から順）
+
+    Returns:
+        List[dict]: [{"year", "month", "attendance_count", "average_stay_minutes"}, ...]
+    """
+    trend = []
+    for offset in range(months - 1, -1, -1):
+        total = year * 12 + (month - 1) - offset
+        y, m = divmod(total, 12)
+        summary = get_monthly_rollup(y, m + 1)["students"].get(str(student_id)) or new_summary()
+        report = summary_to_report(summary)
+        trend.append({
+            "year": y,
+            "month": m + 1,
+            "attendance_count": report["attendance_count"],
+            "average_stay_minutes": report["average_stay_minutes"],
+        })
+    return trend
+
+
 def get_all_students_list() -> List[dict]:
     """登録されている全生徒のリストを取得"""
     name_mapping = get_student_name_mapping()
@@ -233,40 +213,7 @@ def get_all_students_list() -> List[dict]:
 
 def get_students_with_attendance(year: int, month: int) -> List[dict]:
     """指定月に出席記録がある生徒のリストを取得（リトライ機能付き）"""
-    max_retries = 3
-    
-    for attempt in range(max_retries):
-        try:
-            sheet = get_attendance_sheet()
-            records = sheet.get_all_values()
-            break
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise RuntimeError(f"出席データの取得に失敗しました（{max_retries}回試行）: {e}")
-            else:
-                wait_time = 2 ** attempt
-                print(f"データ取得試行 {attempt + 1}/{max_retries} 失敗。{wait_time}秒後に再試行...")
-                time.sleep(wait_time)
-    
-    students_with_attendance = set()
-    
-    for row in records[1:]:  # Skip header
-        if len(row) < 7:
-            continue
-            
-        # Parse entry time and check if it's in our target month
-        entry_time = parse_entry_time(row[0])
-        if not entry_time or entry_time.year != year or entry_time.month != month:
-            continue
-            
-        # Check if exit time exists
-        exit_time_str = row[6] if len(row) > 6 else ""
-        if not exit_time_str:
-            continue
-            
-        student_id = row[1]  # Column B: 塾生番号
-        if student_id:
-            students_with_attendance.add(student_id)
+    students_with_attendance = get_month_bitmap(year, month).student_ids()
     
     # Get student names
     name_mapping = get_student_name_mapping()
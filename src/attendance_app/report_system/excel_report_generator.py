@@ -315,7 +315,8 @@ class ExcelReportGenerator:
         attendance_data = get_monthly_attendance_data(student_id, year, month)
         student_name = attendance_data["student_name"]
         daily_records = attendance_data["daily_records"]
-        attendance_count = attendance_data["attendance_count"]
+        # 同じ日に複数回来塾しても1日として数える
+        attendance_days = attendance_data.get("attendance_days", attendance_data["attendance_count"])
         
         # ワークシートを作成
         sheet_name = f"{student_name}_{month}月"
@@ -339,7 +340,7 @@ class ExcelReportGenerator:
         self.add_dropdown_validation(worksheet, len(daily_records))
         
         # サマリー追加（テンプレート形式に準拠）
-        next_row = self.add_summary(worksheet, attendance_count, next_row)
+        next_row = self.add_summary(worksheet, attendance_days, next_row)
         
         # コメント欄追加（テンプレート形式に準拠）
         self.add_comment_section(worksheet, next_row)
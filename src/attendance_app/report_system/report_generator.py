@@ -18,6 +18,7 @@ from .template_manager import render_bar_chart, render_colored_bar_chart, format
 from .template_loader import load_report_template
 import calendar
 from ..config import load_settings
+from ..attendance_bitmap import day_mask
 from PIL import Image as PILImage
 
 
@@ -103,21 +104,26 @@ def setup_fonts() -> None:
         print("デフォルトフォントを使用します")
 
 
-def create_calendar_view(daily_records: List[dict], year: int, month: int) -> Table:
-    """出席記録のカレンダー表示を作成"""
+def create_calendar_view(daily_records: List[dict], year: int, month: int,
+                         days_mask: Optional[int] = None) -> Table:
+    """
+    出席記録のカレンダー表示を作成
+
+    Args:
+        days_mask: 出席日のビットマスク（ビット0 = 1日）。省略時は daily_records から求める
+    """
     # 月の日数を取得
     _, days_in_month = calendar.monthrange(year, month)
     
-    # 出席日を辞書で管理
-    attendance_days = {}
-    for record in daily_records:
-        try:
-            date_obj = datetime.strptime(record['date'], '%Y-%m-%d')
-            day = date_obj.day
-            attendance_days[day] = "●"
-        except (ValueError, KeyError):
-            # 無効な日付データはスキップ
-            continue
+    if days_mask is None:
+        days = []
+        for record in daily_records:
+            try:
+                days.append(datetime.strptime(record['date'], '%Y-%m-%d').day)
+            except (ValueError, KeyError):
+                # 無効な日付データはスキップ
+                continue
+        days_mask = day_mask(days)
     
     # カレンダーテーブルのデータを作成
     calendar_data = []
@@ -128,7 +134,7 @@ def create_calendar_view(daily_records: List[dict], year: int, month: int) -> Ta
     
     for day in range(1, days_in_month + 1):
         day_str = str(day)
-        if day in attendance_days:
+        if days_mask >> (day - 1) & 1:
             day_str = f"{day} ●"
         current_week.append(day_str)
         
@@ -316,7 +322,8 @@ def create_pdf_content(data: dict) -> List:
             content.append(Paragraph(details_title, styles['heading']))
             if data['daily_records']:
                 # カレンダー風の表示を作成
-                calendar_view = create_calendar_view(data['daily_records'], data['year'], data['month'])
+                calendar_view = create_calendar_view(data['daily_records'], data['year'], data['month'],
+                                                     data.get('attendance_days_mask'))
                 content.append(calendar_view)
                 content.append(Spacer(1, 0.2*cm))
                 
@@ -0,0 +1,104 @@
+"""
+スキャン処理の振り分け
+
+QRコードのスキャンごとにスレッドを作る代わりに、塾生番号ごとの受付箱（メールボックス）に積み、
+共有スケジューラの io プール（上限付き）で処理する。
+- 同じ塾生のスキャンは到着順に1件ずつ処理する（入室の二重登録を防ぐ）
+- 別の塾生のスキャンは並行して処理する
+- 同じ塾生の短時間の重複スキャン（設定 scan_duplicate_window 秒以内）は破棄する
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from .config import load_settings
+from .task_scheduler import PRIORITY_HIGH, get_scheduler
+
+DEFAULT_DUPLICATE_WINDOW = 3.0  # 秒
+
+
+def get_duplicate_window() -> float:
+    """重複スキャンとみなす間隔（秒）を設定から取得"""
+    try:
+        return float(load_settings().get("scan_duplicate_window", DEFAULT_DUPLICATE_WINDOW))
+    except (TypeError, ValueError):
+        return DEFAULT_DUPLICATE_WINDOW
+
+
+class ScanDispatcher:
+    """塾生番号ごとに直列化し、塾生間では並行にスキャンを処理する"""
+
+    def __init__(self, handler: Callable[[str], None], duplicate_window: Optional[float] = None):
+        """
+        Args:
+            handler: 1件のスキャンを処理する関数（塾生番号を受け取る）
+            duplicate_window: 重複とみなす間隔（秒）。省略時は設定ファイルの値
+        """
+        self._handler = handler
+        self._duplicate_window = duplicate_window
+        self._lock = threading.Lock()
+        self._mailboxes: dict[str, deque] = {}
+        self._last_accepted: dict[str, float] = {}
+
+    def submit(self, student_id: str) -> bool:
+        """
+        スキャンを受け付ける
+
+        Returns:
+            bool: 受け付けた場合True、重複スキャンとして破棄した場合False
+        """
+        window = self._duplicate_window
+        if window is None:
+            window = get_duplicate_window()
+        now = time.monotonic()
+
+        with self._lock:
+            last = self._last_accepted.get(student_id)
+            if last is not None and now - last < window:
+                print(f"DEBUG: Duplicate scan ignored for {student_id} ({now - last:.1f}s)")
+                return False
+            self._last_accepted[student_id] = now
+            self._prune(now, window)
+
+            mailbox = self._mailboxes.get(student_id)
+            if mailbox is not None:
+                # 同じ塾生の処理中：終わった後に続けて処理する
+                mailbox.append(student_id)
+                return True
+            self._mailboxes[student_id] = deque([student_id])
+
+        # 入退室は画面の応答に直結するため、他のio処理より優先する
+        get_scheduler().submit("io", self._drain, student_id, priority=PRIORITY_HIGH, name="scan")
+        return True
+
+    def pending(self) -> int:
+        """処理待ち・処理中のスキャン数"""
+        with self._lock:
+            return sum(len(mailbox) for mailbox in self._mailboxes.values())
+
+    def _drain(self, student_id: str) -> None:
+        """1人分の受付箱を空になるまで順に処理する"""
+        while True:
+            with self._lock:
+                mailbox = self._mailboxes[student_id]
+                if not mailbox:
+                    del self._mailboxes[student_id]
+                    return
+                item = mailbox[0]
+            try:
+                self._handler(item)
+            except Exception as e:
+                print(f"ERROR: Scan processing failed for {item}: {e}")
+            finally:
+                with self._lock:
+                    mailbox.popleft()
+
+    def _prune(self, now: float, window: float) -> None:
+        """重複判定が不要になった古い受付時刻を削除する"""
+        if len(self._last_accepted) < 256:
+            return
+        for sid, accepted in list(self._last_accepted.items()):
+            if now - accepted >= window:
+                del self._last_accepted[sid]
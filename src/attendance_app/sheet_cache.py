@@ -0,0 +1,124 @@
+"""
+スプレッドシートの条件付き取得レイヤー
+
+Drive APIでスプレッドシートの version / modifiedTime だけを確認し、
+前回の取得時から変更がなければローカルにキャッシュした値を返す。
+変更があった場合や版情報が取得できない場合は通常どおりシート全体を取得する。
+"""
+
+import json
+import threading
+from typing import Callable, Optional
+
+from .config import CACHE_DIR, load_settings
+
+# {(spreadsheet_id, sheet_name): (version, values)}
+_memory_cache: dict[tuple[str, str], tuple[str, list[list[str]]]] = {}
+_lock = threading.Lock()
+
+
+def get_spreadsheet_metadata(spreadsheet_id: str) -> Optional[dict]:
+    """
+    スプレッドシートの版情報を取得する（Drive APIのメタデータ呼び出し1回）
+
+    Returns:
+        dict: {"version": 版を表す文字列, "modified_by_me": 最終更新者がこのサービスアカウントか}
+    """
+    from .drive_handler import get_drive_service
+
+    service = get_drive_service()
+    if not service:
+        return None
+
+    try:
+        meta = service.files().get(
+            fileId=spreadsheet_id,
+            fields="version, modifiedTime, lastModifyingUser(me)"
+        ).execute()
+        return {
+            "version": f"{meta.get('version', '')}:{meta.get('modifiedTime', '')}",
+            "modified_by_me": bool(meta.get("lastModifyingUser", {}).get("me")),
+        }
+    except Exception as e:
+        print(f"[キャッシュ] スプレッドシートの版情報の取得に失敗: {e}")
+        return None
+
+
+def get_spreadsheet_version(spreadsheet_id: str) -> Optional[str]:
+    """スプレッドシートの版を表す文字列を取得する"""
+    meta = get_spreadsheet_metadata(spreadsheet_id)
+    return meta["version"] if meta else None
+
+
+def _cache_file(spreadsheet_id: str, sheet_name: str):
+    return CACHE_DIR / f"sheet_{spreadsheet_id}_{sheet_name}.json"
+
+
+def _load_cached(spreadsheet_id: str, sheet_name: str) -> Optional[tuple[str, list[list[str]]]]:
+    """メモリ、なければディスクからキャッシュを読み込む"""
+    key = (spreadsheet_id, sheet_name)
+    with _lock:
+        if key in _memory_cache:
+            return _memory_cache[key]
+
+    path = _cache_file(spreadsheet_id, sheet_name)
+    if not path.exists():
+        return None
+    try:
+        with path.open('r', encoding='utf-8') as f:
+            data = json.load(f)
+        cached = (data["version"], data["values"])
+    except (json.JSONDecodeError, KeyError, OSError) as e:
+        print(f"[キャッシュ] キャッシュファイルの読み込みに失敗: {path} - {e}")
+        return None
+
+    with _lock:
+        _memory_cache[key] = cached
+    return cached
+
+
+def _store(spreadsheet_id: str, sheet_name: str, version: str, values: list[list[str]]) -> None:
+    """取得した値をメモリとディスクに保存する"""
+    with _lock:
+        _memory_cache[(spreadsheet_id, sheet_name)] = (version, values)
+
+    path = _cache_file(spreadsheet_id, sheet_name)
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with tmp_path.open('w', encoding='utf-8') as f:
+            json.dump({"version": version, "values": values}, f, ensure_ascii=False)
+        tmp_path.replace(path)
+    except OSError as e:
+        print(f"[キャッシュ] キャッシュファイルの保存に失敗: {path} - {e}")
+
+
+def get_sheet_values(sheet_name: str, fetch: Callable[[], list[list[str]]]) -> list[list[str]]:
+    """
+    シートの全値を返す。スプレッドシートが前回取得時から変更されていなければ
+    キャッシュを返し、変更されていれば fetch() で取得し直してキャッシュを更新する。
+
+    返される値はキャッシュと共有されるため、呼び出し側で変更しないこと。
+    """
+    spreadsheet_id = load_settings().get("spreadsheet_id")
+    if not spreadsheet_id:
+        return fetch()
+
+    version = get_spreadsheet_version(spreadsheet_id)
+    if version:
+        cached = _load_cached(spreadsheet_id, sheet_name)
+        if cached and cached[0] == version:
+            print(f"[キャッシュ] '{sheet_name}' は未変更のためキャッシュを使用")
+            return cached[1]
+
+    print(f"[キャッシュ] '{sheet_name}' を取得します")
+    values = fetch()
+    if version:
+        _store(spreadsheet_id, sheet_name, version, values)
+    return values
+
+
+def clear_cache() -> None:
+    """メモリ上のキャッシュを破棄する（ディスク上のファイルは残す）"""
+    with _lock:
+        _memory_cache.clear()
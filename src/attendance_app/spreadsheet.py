@@ -9,6 +9,10 @@ import os
 from google.oauth2.service_account import Credentials
 
 from .config import load_settings
+from .sheet_cache import get_sheet_values
+from .attendance_store import AttendanceTable
+from .attendance_rollups import get_rollup_store
+from .student_search import get_student_index
 
 RETRIEVAL_SHEET_NAME = "塾生番号＿名前＿QRコード"
 INPUT_SHEET_NAME = "生徒出席情報"
@@ -25,33 +29,50 @@ def get_client() -> gspread.Client:
         raise RuntimeError(f"Failed to initialize Google Sheets client: {e}")
 
 
-def get_retrieval_sheet() -> gspread.Worksheet:
+@lru_cache()
+def _open_spreadsheet(spreadsheet_id: str) -> gspread.Spreadsheet:
+    """スプレッドシートのハンドルを開く（スプレッドシートIDごとに1回だけ）"""
+    return get_client().open_by_key(spreadsheet_id)
+
+
+@lru_cache()
+def _open_worksheet(spreadsheet_id: str, sheet_name: str) -> gspread.Worksheet:
+    return _open_spreadsheet(spreadsheet_id).worksheet(sheet_name)
+
+
+def get_worksheet(sheet_name: str) -> gspread.Worksheet:
+    """設定中のスプレッドシートのワークシートを返す（ハンドルは再利用する）"""
     settings = load_settings()
     ssid = settings.get("spreadsheet_id")
     if not ssid:
         raise RuntimeError("spreadsheet_id is not configured")
-    client = get_client()
-    sh = client.open_by_key(ssid)
-    return sh.worksheet(RETRIEVAL_SHEET_NAME)
+    return _open_worksheet(ssid, sheet_name)
+
+
+def get_retrieval_sheet() -> gspread.Worksheet:
+    return get_worksheet(RETRIEVAL_SHEET_NAME)
 
 def get_input_sheet() -> gspread.Worksheet:
-    settings = load_settings()
-    ssid = settings.get("spreadsheet_id")
-    if not ssid:
-        raise RuntimeError("spreadsheet_id is not configured")
-    client = get_client()
-    sh = client.open_by_key(ssid)
-    return sh.worksheet(INPUT_SHEET_NAME)
+    return get_worksheet(INPUT_SHEET_NAME)
 
 
 @lru_cache()
 def get_all_students() -> dict[str, str]:
     """Retrieves all students from the retrieval sheet and caches the result."""
     print("Fetching and caching student list...")
-    sheet = get_retrieval_sheet()
-    records = sheet.get_all_values()
+    records = get_sheet_values(RETRIEVAL_SHEET_NAME, lambda: get_retrieval_sheet().get_all_values())
     # Skip header row and create a dictionary of {id: name}
-    return {row[0]: row[1] for row in records[1:] if len(row) >= 2}
+    students = {row[0]: row[1] for row in records[1:] if len(row) >= 2}
+    _update_student_index({"id": sid, "name": name} for sid, name in students.items())
+    return students
+
+
+def _update_student_index(students) -> None:
+    """塾生の検索インデックスに名簿の変更を反映する"""
+    try:
+        get_student_index().update(students)
+    except Exception as e:
+        print(f"WARNING: Failed to update student search index: {e}")
 
 def get_student_name(student_id: str) -> str:
     students = get_all_students()
@@ -60,6 +81,20 @@ def get_student_name(student_id: str) -> str:
 
 # import requests  # GAS連携無効化により不要
 
+def get_today_table() -> AttendanceTable:
+    """出席情報シートから今日の行だけを読み込んだテーブルを返す（常に最新の値を取得）"""
+    sheet = get_input_sheet()
+    records = sheet.get_all_values()
+    today = datetime.now().strftime("%Y/%m/%d")
+
+    table = AttendanceTable()
+    for i, row in enumerate(records[1:], 2):  # ヘッダー行をスキップ、行番号は2から
+        # A列（インデックス0）が入室時刻
+        if row and row[0].startswith(today):
+            table.append_row(row, i)
+    return table
+
+
 def get_last_record(student_id: str) -> Tuple[Optional[int], Optional[str]]:
     """
     Google Sheets APIを使用して、指定した学生IDの今日の最新記録を取得する。
@@ -68,37 +103,10 @@ def get_last_record(student_id: str) -> Tuple[Optional[int], Optional[str]]:
     print(f"DEBUG: get_last_record called for student_id={student_id}")
     
     try:
-        sheet = get_input_sheet()
-        records = sheet.get_all_values()
-        
-        from datetime import datetime
-        today = datetime.now().strftime("%Y/%m/%d")
-        
-        # 逆順で検索（最新の記録を優先）
-        for i in range(len(records) - 1, 0, -1):  # ヘッダー行をスキップ
-            row = records[i]
-            if len(row) < 2:  # 必要な列数が足りない場合はスキップ
-                continue
-                
-            # B列（インデックス1）が学生ID
-            row_student_id = str(row[1]) if len(row) > 1 else ""
-            
-            if row_student_id == str(student_id):
-                # A列（インデックス0）が入室時刻
-                entry_timestamp = row[0] if len(row) > 0 else ""
-                
-                # 今日の日付かチェック
-                if entry_timestamp.startswith(today):
-                    # G列（インデックス6）が退室時刻
-                    exit_time = row[6] if len(row) > 6 else ""
-                    
-                    if not exit_time:  # 退室時刻が空の場合
-                        print(f"DEBUG: Found entry without exit time at row {i + 1}")
-                        return i + 1, None  # 1から始まる行番号を返す
-                    else:
-                        print(f"DEBUG: Found entry with exit time: {exit_time}")
-                        # 退室時刻がある場合は次の記録を探す
-                        continue
+        row_number = get_today_table().find_open_visit(student_id)
+        if row_number:
+            print(f"DEBUG: Found entry without exit time at row {row_number}")
+            return row_number, None
         
         print(f"DEBUG: No entry without exit time found for student_id={student_id}")
         return None, None
@@ -108,15 +116,37 @@ def get_last_record(student_id: str) -> Tuple[Optional[int], Optional[str]]:
         return None, None
 
 
-def append_entry(student_id: str, student_name: str) -> Optional[int]:
+def _update_rollup(method: str, *args) -> None:
+    """月次集計に書き込みを反映する（失敗しても入退室処理は止めない）"""
+    try:
+        getattr(get_rollup_store(), method)(*args)
+    except Exception as e:
+        print(f"WARNING: Failed to update attendance rollup: {e}")
+
+
+def _appended_row(response: dict) -> Optional[int]:
+    """append_row の応答の updates.updatedRange（例: "'生徒出席情報'!A123:G123"）から行番号を求める"""
+    try:
+        updated_range = response["updates"]["updatedRange"]
+        first_cell = updated_range.rsplit("!", 1)[-1].split(":")[0]
+        return gspread.utils.a1_to_rowcol(first_cell)[0]
+    except (KeyError, TypeError, IndexError, gspread.exceptions.IncorrectCellLabel):
+        return None
+
+
+def append_entry(student_id: str, student_name: str, entered_at: Optional[datetime] = None) -> Optional[int]:
+    """入室行を追加して行番号を返す（entered_at を省略すると現在時刻）"""
     sheet = get_input_sheet()
-    entry_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-    sheet.append_row([entry_time, student_id, student_name, "", "", "", ""])
-    # 追加された行のインデックスを返す
-    # gspreadのappend_rowは追加された行の情報を直接返さないため、
-    # 全てのデータを再取得して最終行のインデックスを特定する
-    all_data = sheet.get_all_values()
-    return len(all_data)
+    entry_time = (entered_at or datetime.now()).strftime("%Y/%m/%d %H:%M:%S")
+    response = sheet.append_row([entry_time, student_id, student_name, "", "", "", ""])
+    # 追加された行はAPIの応答（updates.updatedRange）から求める。
+    # 追加後に全体を読み直して最終行とすると、別の塾生の追加と重なったときに同じ行番号になる
+    row = _appended_row(response)
+    if row is None:
+        print(f"ERROR: Could not determine the appended row from the response: {response}")
+        return None
+    _update_rollup("record_entry", row, student_id, student_name, entry_time)
+    return row
 
 
 def write_response(row: int, col: int, value: str) -> bool:
@@ -126,43 +156,68 @@ def write_response(row: int, col: int, value: str) -> bool:
         cell_range = gspread.utils.rowcol_to_a1(row, col)
         sheet.update(cell_range, [[value]], value_input_option='USER_ENTERED')
         print(f"DEBUG: Successfully wrote to sheet.")
+        _update_rollup("record_answer", row, col, value)
         return True
     except Exception as e:
         print(f"ERROR: Failed to write to sheet: {e}")
         raise # Re-raise the exception to be caught by main.py
 
 
-def write_exit(row: int) -> bool:
+def write_exit(row: int, exited_at: Optional[datetime] = None) -> bool:
+    """退室時刻を書き込む（exited_at を省略すると現在時刻）"""
     sheet = get_input_sheet()
-    exit_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    exit_time = (exited_at or datetime.now()).strftime("%Y/%m/%d %H:%M:%S")
     try:
         sheet.update_cell(row, 7, exit_time) # Column G is 7th column (1-based)
+        _update_rollup("record_exit", row, exit_time)
         return True
     except Exception as e:
         print(f"ERROR: Failed to write exit time: {e}")
         return False
 
+def get_row_values(row: int) -> list[str]:
+    """出席情報シートの指定行の値を取得する"""
+    return get_input_sheet().row_values(row)
+
+
+def is_open_row(row: int, student_id: str) -> bool:
+    """
+    指定行がその塾生の退室していない入室記録か（B列が塾生番号でG列が空）
+
+    手元で覚えている行番号に退室を書き込む前に確認する。GASや別のキオスク、
+    スタッフの編集で行がずれたり退室済みになったりしていることがある。
+    """
+    values = get_row_values(row)
+    return len(values) >= 2 and values[1] == str(student_id) and not (len(values) > 6 and values[6])
+
+
 def get_student_list_for_printing() -> list[dict]:
     """印刷用に、塾生名簿シートから全塾生のIDと名前のリストを取得する"""
     try:
-        sheet = get_retrieval_sheet()
-        records = sheet.get_all_values()
+        records = get_sheet_values(RETRIEVAL_SHEET_NAME, lambda: get_retrieval_sheet().get_all_values())
         student_list = []
         # ヘッダー行 (1行目) をスキップして処理
         for row in records[1:]:
             # 少なくともIDと名前の列が存在することを確認
             if len(row) >= 2 and row[0] and row[1]:
                 student_list.append({"id": row[0], "name": row[1]})
+        _update_student_index(student_list)
         return student_list
     except Exception as e:
         print(f"塾生名簿の取得中にエラーが発生しました: {e}")
         return []
 
-def update_sample_csv() -> bool:
-    """スプレッドシートからデータを取得してsample_data.csvを更新する"""
+def update_sample_csv(student_list: Optional[list[dict]] = None) -> bool:
+    """
+    sample_data.csvを塾生リストで更新する
+
+    Args:
+        student_list: 取得済みの塾生リスト（省略時はスプレッドシートから取得する）
+    """
     try:
-        # スプレッドシートから塾生リストを取得
-        student_list = get_student_list_for_printing()
+        # スプレッドシートから塾生リストを取得（取得済みならそれを使う）
+        if student_list is None:
+            student_list = get_student_list_for_printing()
         
         if not student_list:
             print("塾生リストが空のため、CSVファイルの更新をスキップします")
@@ -188,6 +243,32 @@ def update_sample_csv() -> bool:
         print(f"sample_data.csvの更新中にエラーが発生しました: {e}")
         return False
 
+LABEL_CSV_ENCODINGS = ['shift_jis', 'cp932', 'utf-8-sig', 'utf-8']
+
+
+def write_label_csv(csv_file_path: str, students: list[dict]) -> Optional[str]:
+    """
+    P-touch Editorのデータベース用CSVを書き込む（ヘッダーの次の行がレコード1）
+
+    P-touch Editorに最適なエンコーディングから順に試し、使ったエンコーディングを返す（失敗時はNone）。
+    """
+    tmp_path = f"{csv_file_path}.tmp"
+    for encoding in LABEL_CSV_ENCODINGS:
+        try:
+            with open(tmp_path, 'w', newline='', encoding=encoding) as csvfile:
+                writer = csv.writer(csvfile)
+                # ヘッダー行を書き込み
+                writer.writerow(['StudentID', 'StudentName'])
+                for student in students:
+                    writer.writerow([f"#{student['id']}", student['name']])
+            os.replace(tmp_path, csv_file_path)
+            return encoding
+        except UnicodeEncodeError:
+            print(f"エンコーディング {encoding} でエラー、次を試行...")
+            continue
+    return None
+
+
 def update_selected_student_csv(student_id: str, student_name: str) -> bool:
     """選択された塾生のデータでsample_data.csvを更新する（ワンクリック印刷用）"""
     try:
@@ -195,25 +276,12 @@ def update_selected_student_csv(student_id: str, student_name: str) -> bool:
         csv_file_path = os.path.join(os.path.dirname(__file__), 'assets', 'sample_data.csv')
         
         # 複数のエンコーディングを試行してP-touch Editorに最適な形式で保存
-        encodings_to_try = ['shift_jis', 'cp932', 'utf-8-sig', 'utf-8']
-        
-        for encoding in encodings_to_try:
-            try:
-                with open(csv_file_path, 'w', newline='', encoding=encoding) as csvfile:
-                    writer = csv.writer(csvfile)
-                    # ヘッダー行を書き込み
-                    writer.writerow(['StudentID', 'StudentName'])
-                    # 選択された塾生のデータ行を書き込み
-                    writer.writerow([f"#{student_id}", student_name]) # ここを修正
-                
-                print(f"選択された塾生でsample_data.csvを更新: {student_name} (ID: {student_id})")
-                print(f"使用エンコーディング: {encoding}")
-                print(f"ファイルパス: {csv_file_path}")
-                return True
-                
-            except UnicodeEncodeError:
-                print(f"エンコーディング {encoding} でエラー、次を試行...")
-                continue
+        encoding = write_label_csv(csv_file_path, [{"id": student_id, "name": student_name}])
+        if encoding:
+            print(f"選択された塾生でsample_data.csvを更新: {student_name} (ID: {student_id})")
+            print(f"使用エンコーディング: {encoding}")
+            print(f"ファイルパス: {csv_file_path}")
+            return True
         
         # 全てのエンコーディングで失敗した場合のフォールバック
         print(f"全エンコーディングで失敗、UTF-8でフォールバック")
@@ -221,4 +289,4 @@ def update_selected_student_csv(student_id: str, student_name: str) -> bool:
         
     except Exception as e:
         print(f"選択塾生用CSVの更新中にエラーが発生しました: {e}")
-        return False
\ No newline at end of file
+        return False
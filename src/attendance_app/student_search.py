@@ -0,0 +1,203 @@
+"""
+塾生の検索インデックス
+
+印刷画面やレポート画面で、入力した文字に合う塾生を名簿全体を走査せずに絞り込む。
+- 塾生番号: 前方一致（トライ木。各ノードにその下の塾生番号の集合を持つ）
+- 氏名: 部分一致（正規化した氏名の1文字・2文字のn-gramの転置インデックス）
+
+氏名はNFKC正規化・小文字化・カタカナをひらがなに変換・空白除去してから索引を作るので、
+全角/半角やカタカナ/ひらがなの違い、姓名の間の空白を気にせずに検索できる。
+
+名簿を読み込み直したときは update() で差分（追加・削除・氏名の変更）だけを反映する。
+"""
+
+import threading
+import unicodedata
+from typing import Iterable, Optional
+
+_KATAKANA_START = 0x30A1  # ァ
+_KATAKANA_END = 0x30F6    # ヶ
+_KANA_OFFSET = 0x60       # カタカナとひらがなのコードポイントの差
+
+
+def normalize(text: str) -> str:
+    """検索用に文字列を正規化する"""
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    chars = []
+    for ch in text:
+        if ch.isspace():
+            continue
+        code = ord(ch)
+        if _KATAKANA_START <= code <= _KATAKANA_END:
+            ch = chr(code - _KANA_OFFSET)
+        chars.append(ch)
+    return "".join(chars)
+
+
+def _ngrams(text: str) -> set[str]:
+    """1文字と2文字のn-gram"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: dict[str, "_TrieNode"] = {}
+        self.ids: set[str] = set()
+
+
+class StudentIndex:
+    """塾生番号と氏名の検索インデックス"""
+
+    def __init__(self, students: Optional[Iterable[dict]] = None):
+        self._lock = threading.Lock()
+        self._students: dict[str, dict] = {}     # 塾生番号 -> {"id", "name"}（名簿の順）
+        self._names: dict[str, str] = {}         # 塾生番号 -> 正規化した氏名
+        self._grams: dict[str, set[str]] = {}    # n-gram -> 塾生番号の集合
+        self._trie = _TrieNode()
+        self._order: dict[str, int] = {}         # 塾生番号 -> 名簿での位置
+        self._last: Optional[tuple[str, list[str]]] = None  # 直前の検索（入力途中の絞り込み用）
+        if students:
+            self.update(students)
+
+    def __len__(self) -> int:
+        return len(self._students)
+
+    # --- 更新 ---
+    def update(self, students: Iterable[dict], partial: bool = False) -> int:
+        """
+        名簿を反映する（差分だけを索引に反映し、変更のあった塾生の数を返す）
+
+        Args:
+            students: {"id", "name"} の並び
+            partial: True なら渡された塾生の追加・変更だけを行い、含まれない塾生を削除しない
+        """
+        incoming = {}
+        for student in students:
+            student_id = str(student.get("id", "")).strip()
+            if student_id:
+                incoming[student_id] = {"id": student_id, "name": str(student.get("name", ""))}
+
+        with self._lock:
+            removed = [] if partial else [sid for sid in self._students if sid not in incoming]
+            changed = [sid for sid, s in incoming.items() if self._students.get(sid) != s]
+            for sid in removed:
+                self._remove(sid)
+            for sid in changed:
+                if sid in self._students:
+                    self._remove(sid)
+                self._add(incoming[sid])
+            if not partial and list(self._students) != list(incoming):
+                # 名簿の並び順に合わせる
+                self._students = {sid: self._students[sid] for sid in incoming}
+            self._order = {sid: i for i, sid in enumerate(self._students)}
+            if removed or changed:
+                self._last = None
+        return len(removed) + len(changed)
+
+    def _add(self, student: dict) -> None:
+        sid = student["id"]
+        self._students[sid] = student
+        name = normalize(student["name"])
+        self._names[sid] = name
+        for gram in _ngrams(name):
+            self._grams.setdefault(gram, set()).add(sid)
+        node = self._trie
+        node.ids.add(sid)
+        for ch in normalize(sid):
+            node = node.children.setdefault(ch, _TrieNode())
+            node.ids.add(sid)
+
+    def _remove(self, sid: str) -> None:
+        self._students.pop(sid, None)
+        name = self._names.pop(sid, "")
+        for gram in _ngrams(name):
+            postings = self._grams.get(gram)
+            if postings is not None:
+                postings.discard(sid)
+                if not postings:
+                    del self._grams[gram]
+        node = self._trie
+        node.ids.discard(sid)
+        for ch in normalize(sid):
+            child = node.children.get(ch)
+            if child is None:
+                break
+            child.ids.discard(sid)
+            if not child.ids:
+                del node.children[ch]
+                break
+            node = child
+
+    # --- 検索 ---
+    def search(self, query: str, among: Optional[Iterable[str]] = None,
+               limit: Optional[int] = None) -> list[dict]:
+        """
+        塾生番号の前方一致または氏名の部分一致で検索する（名簿の順で返す）
+
+        Args:
+            query: 入力された文字列（空なら全員）
+            among: 対象を絞る塾生番号（印刷可能な塾生だけ、など）
+            limit: 返す最大件数
+        """
+        key = normalize(query)
+        with self._lock:
+            ids = self._match(key)
+            students = self._students
+            results = []
+            allowed = set(map(str, among)) if among is not None else None
+            for sid in ids:
+                if allowed is not None and sid not in allowed:
+                    continue
+                results.append(students[sid])
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def _match(self, key: str) -> list[str]:
+        """正規化済みの検索語に一致する塾生番号（名簿の順）"""
+        if not key:
+            return list(self._students)
+
+        # 直前の検索語を打ち足しただけなら、前回の結果を絞り込むだけでよい
+        if self._last is not None and key.startswith(self._last[0]):
+            candidates = self._last[1]
+        else:
+            candidates = None
+
+        node = self._trie
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                break
+        by_id = node.ids if node is not None else set()
+
+        grams = [key[i:i + 2] for i in range(len(key) - 1)] or [key]
+        postings = [self._grams.get(gram, set()) for gram in grams]
+        by_name = set.intersection(*sorted(postings, key=len)) if postings else set()
+
+        if candidates is None:
+            # n-gramで候補を絞ってから名簿の順に並べる（名簿全体は走査しない）
+            candidates = sorted(by_id | by_name, key=lambda sid: self._order.get(sid, 0))
+        matched = [
+            sid for sid in candidates
+            if sid in by_id or (sid in by_name and key in self._names.get(sid, ""))
+        ]
+        self._last = (key, matched)
+        return matched
+
+
+_index: Optional[StudentIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_student_index() -> StudentIndex:
+    """プロセス全体で共有する塾生の検索インデックスを返す"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = StudentIndex()
+        return _index
@@ -0,0 +1,240 @@
+"""
+アプリ全体で共有するタスクスケジューラ
+
+画面ごとに threading.Thread を直接作る代わりに、用途別の上限付きプールにタスクを投入する。
+- io    : スプレッドシート・Driveとの通信、ファイル操作
+- cpu   : レポート・プレビューの生成
+- print : P-touch Editorでの印刷（1件ずつ）
+- sync  : QRコードの一括同期の取りまとめ（ioプールの完了を待つので io とは分ける、1件ずつ）
+
+各プールは優先度付きキューを持ち、数値の小さいタスクから実行する。
+キャンセル用トークンで実行前のタスクを取り消したり、実行中のタスクに中断を伝えたりできる。
+キューの長さ・待ち時間・実行時間は metrics() で確認できる。
+"""
+
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+# 優先度（小さいほど先に実行）
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10
+
+# プール名 -> 最大ワーカー数
+DEFAULT_POOLS = {
+    "io": 6,
+    "cpu": 2,
+    "print": 1,
+    "sync": 1,
+}
+
+
+class TaskCancelled(Exception):
+    """キャンセルされたタスクで発生する例外"""
+
+
+class CancellationToken:
+    """タスクの取り消しを伝えるためのトークン"""
+
+    __slots__ = ("_event",)
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        """長い処理の途中で呼び、キャンセルされていれば中断する"""
+        if self._event.is_set():
+            raise TaskCancelled()
+
+
+class TaskHandle:
+    """投入したタスクの結果とキャンセル手段"""
+
+    __slots__ = ("name", "pool", "token", "future", "submitted_at")
+
+    def __init__(self, name: str, pool: str, token: CancellationToken):
+        self.name = name
+        self.pool = pool
+        self.token = token
+        self.future: Future = Future()
+        self.submitted_at = time.monotonic()
+
+    def cancel(self) -> None:
+        self.token.cancel()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self, timeout: Optional[float] = None):
+        return self.future.result(timeout)
+
+
+class WorkerPool:
+    """優先度付きキューと上限付きワーカースレッドからなるプール"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._workers: list[threading.Thread] = []
+        self._idle = 0
+        self._pending = 0  # 投入済みでまだワーカーが取り出していないタスクの数
+        self._running = 0
+        self._shutdown = False
+        self._stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "cancelled": 0,
+            "wait_total": 0.0, "wait_max": 0.0, "run_total": 0.0, "run_max": 0.0,
+        }
+
+    def submit(self, handle: TaskHandle, fn: Callable, args: tuple, kwargs: dict, priority: int) -> None:
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError(f"プール '{self.name}' は停止しています")
+            self._stats["submitted"] += 1
+            self._queue.put((priority, next(self._sequence), handle, fn, args, kwargs))
+            self._pending += 1
+            # 待機中のワーカーで足りない分だけ増やす（続けて投入されたタスクも並行して実行する）
+            if self._pending > self._idle and len(self._workers) < self.max_workers:
+                worker = threading.Thread(
+                    target=self._work, name=f"{self.name}-{len(self._workers) + 1}", daemon=True
+                )
+                self._workers.append(worker)
+                worker.start()
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                self._idle += 1
+            item = self._queue.get()
+            _, _, handle, fn, args, kwargs = item
+            with self._lock:
+                self._idle -= 1
+                if handle is not None:
+                    self._pending -= 1
+            if handle is None:  # 停止指示
+                return
+            self._run(handle, fn, args, kwargs)
+
+    def _run(self, handle: TaskHandle, fn: Callable, args: tuple, kwargs: dict) -> None:
+        started = time.monotonic()
+        wait = started - handle.submitted_at
+
+        if handle.token.cancelled or not handle.future.set_running_or_notify_cancel():
+            with self._lock:
+                self._stats["cancelled"] += 1
+            if not handle.future.done():
+                handle.future.set_exception(TaskCancelled())
+            return
+
+        with self._lock:
+            self._running += 1
+            self._stats["wait_total"] += wait
+            self._stats["wait_max"] = max(self._stats["wait_max"], wait)
+
+        outcome = "completed"
+        try:
+            handle.future.set_result(fn(*args, **kwargs))
+        except TaskCancelled as e:
+            outcome = "cancelled"
+            handle.future.set_exception(e)
+        except Exception as e:
+            outcome = "failed"
+            print(f"[スケジューラ] タスク '{handle.name}'（{self.name}）でエラー: {e}")
+            handle.future.set_exception(e)
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._running -= 1
+                self._stats[outcome] += 1
+                self._stats["run_total"] += elapsed
+                self._stats["run_max"] = max(self._stats["run_max"], elapsed)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            started = stats["submitted"] - self._queue.qsize() - stats["cancelled"]
+            finished = stats["completed"] + stats["failed"]
+            return {
+                "workers": len(self._workers),
+                "max_workers": self.max_workers,
+                "running": self._running,
+                "queue_depth": self._queue.qsize(),
+                "submitted": stats["submitted"],
+                "completed": stats["completed"],
+                "failed": stats["failed"],
+                "cancelled": stats["cancelled"],
+                "avg_wait_ms": round(stats["wait_total"] / started * 1000, 1) if started > 0 else 0.0,
+                "max_wait_ms": round(stats["wait_max"] * 1000, 1),
+                "avg_run_ms": round(stats["run_total"] / finished * 1000, 1) if finished > 0 else 0.0,
+                "max_run_ms": round(stats["run_max"] * 1000, 1),
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._shutdown = True
+            workers = list(self._workers)
+        for _ in workers:
+            # 待機中のタスクより後に取り出されるよう最低の優先度で停止指示を積む
+            self._queue.put((float("inf"), next(self._sequence), None, None, None, None))
+
+
+class TaskScheduler:
+    """名前付きプールの集合"""
+
+    def __init__(self, pools: Optional[dict[str, int]] = None):
+        self._pools = {
+            name: WorkerPool(name, size) for name, size in (pools or DEFAULT_POOLS).items()
+        }
+
+    def submit(self, pool: str, fn: Callable, *args, priority: int = PRIORITY_NORMAL,
+               token: Optional[CancellationToken] = None, name: Optional[str] = None,
+               **kwargs) -> TaskHandle:
+        """
+        タスクを投入する
+
+        Args:
+            pool: プール名（io / cpu / print）
+            fn: 実行する関数
+            priority: 優先度（小さいほど先に実行）
+            token: キャンセル用トークン（省略時は新規作成してハンドルに持たせる）
+            name: ログ・メトリクス用のタスク名
+        """
+        if pool not in self._pools:
+            raise KeyError(f"未知のプールです: {pool}")
+        handle = TaskHandle(name or getattr(fn, "__name__", "task"), pool, token or CancellationToken())
+        self._pools[pool].submit(handle, fn, args, kwargs, priority)
+        return handle
+
+    def metrics(self) -> dict[str, dict]:
+        """プールごとのキューの長さ・待ち時間・実行時間"""
+        return {name: pool.metrics() for name, pool in self._pools.items()}
+
+    def shutdown(self) -> None:
+        for pool in self._pools.values():
+            pool.shutdown()
+
+
+_scheduler: Optional[TaskScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> TaskScheduler:
+    """プロセス全体で共有するスケジューラを返す"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = TaskScheduler()
+        return _scheduler
@@ -0,0 +1,158 @@
+"""
+起動時のウォームアップ
+
+アプリの起動直後にバックグラウンドで以下を並行して行い、最初のスキャンを2回目以降と同じ速さにする。
+- Google Sheetsの認証とスプレッドシート・ワークシートのハンドル取得
+- 塾生名簿の読み込み（get_all_students のキャッシュ）
+- 今日の出席記録の読み込み（在室トラッカー）
+- Google Drive APIへの接続
+
+各段階の状態は待機画面に表示される。
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+from .config import load_settings
+from .drive_handler import get_drive_service
+from .occupancy import get_tracker
+from .spreadsheet import get_all_students, get_input_sheet, get_retrieval_sheet
+from .task_scheduler import PRIORITY_HIGH, get_scheduler
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+def _open_sheets() -> None:
+    get_retrieval_sheet()
+    get_input_sheet()
+
+
+def _seed_tracker() -> None:
+    # スキャンはこの段階の完了を待たずに受け付ける。先に読み込まれていれば読み直さず、
+    # 読み込み中に処理された入退室は seed() が手元の状態を優先して残す
+    if not get_tracker().ensure_current():
+        raise RuntimeError("今日の出席記録を読み込めませんでした")
+
+
+def _connect_drive() -> None:
+    if get_drive_service() is None:
+        raise RuntimeError("Google Driveに接続できませんでした")
+
+
+# 段階名 -> (表示名, 処理, 先に終わっている必要がある段階)
+STAGES = {
+    "sheets": ("スプレッドシート接続", _open_sheets, ()),
+    "roster": ("塾生名簿", get_all_students, ("sheets",)),
+    "today": ("今日の出席記録", _seed_tracker, ("sheets",)),
+    "drive": ("Google Drive接続", _connect_drive, ()),
+}
+
+
+class Warmup:
+    """ウォームアップの各段階を依存関係に従って並行実行し、進み具合を保持する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.states: dict[str, str] = {name: PENDING for name in STAGES}
+        self.errors: dict[str, str] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._finished = threading.Event()
+        self._listeners: list[Callable[["Warmup"], None]] = []
+
+    def start(self) -> "Warmup":
+        self.started_at = time.monotonic()
+        if not load_settings().get("spreadsheet_id"):
+            # スプレッドシートが未設定なら何もしない
+            for name in STAGES:
+                self.states[name] = FAILED
+                self.errors[name] = "spreadsheet_id is not configured"
+            self._finish()
+            return self
+        self._schedule_ready()
+        return self
+
+    def _schedule_ready(self) -> None:
+        """依存する段階が終わった段階を投入する"""
+        with self._lock:
+            ready = [
+                name for name, (_, _, deps) in STAGES.items()
+                if self.states[name] == PENDING and all(self.states[d] == DONE for d in deps)
+            ]
+            blocked = [
+                name for name, (_, _, deps) in STAGES.items()
+                if self.states[name] == PENDING and any(self.states[d] == FAILED for d in deps)
+            ]
+            for name in ready:
+                self.states[name] = RUNNING
+            for name in blocked:
+                self.states[name] = FAILED
+                self.errors[name] = "前の段階が失敗したため実行できませんでした"
+            finished = all(state in (DONE, FAILED) for state in self.states.values())
+
+        for name in ready:
+            get_scheduler().submit("io", self._run, name, priority=PRIORITY_HIGH, name=f"warmup_{name}")
+        if finished:
+            self._finish()
+
+    def _run(self, name: str) -> None:
+        label, fn, _ = STAGES[name]
+        started = time.monotonic()
+        try:
+            fn()
+            state = DONE
+            print(f"[ウォームアップ] {label}: 完了（{time.monotonic() - started:.2f}秒）")
+        except Exception as e:
+            state = FAILED
+            self.errors[name] = str(e)
+            print(f"[ウォームアップ] {label}: 失敗 - {e}")
+        with self._lock:
+            self.states[name] = state
+        self._notify()
+        self._schedule_ready()
+
+    def _finish(self) -> None:
+        with self._lock:
+            if self._finished.is_set():
+                return
+            self.finished_at = time.monotonic()
+            self._finished.set()
+        print(f"[ウォームアップ] 終了（{self.finished_at - self.started_at:.2f}秒）")
+        self._notify()
+
+    # --- 参照 ---
+    @property
+    def is_finished(self) -> bool:
+        return self._finished.is_set()
+
+    @property
+    def is_ready(self) -> bool:
+        """すべての段階が成功したか"""
+        return all(state == DONE for state in self.states.values())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def summary(self) -> str:
+        """待機画面に表示する状態の文言"""
+        with self._lock:
+            states = dict(self.states)
+        if not self.is_finished:
+            done = sum(1 for state in states.values() if state in (DONE, FAILED))
+            return f"準備中...（{done}/{len(states)}）"
+        failed = [STAGES[name][0] for name, state in states.items() if state == FAILED]
+        if failed:
+            return f"一部の準備に失敗しました: {', '.join(failed)}"
+        return "準備完了"
+
+    def add_listener(self, callback: Callable[["Warmup"], None]) -> None:
+        """状態が変わったときに呼ばれるコールバックを登録する（呼び出しスレッドは任意）"""
+        self._listeners.append(callback)
+
+    def _notify(self) -> None:
+        for callback in list(self._listeners):
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"[ウォームアップ] 通知の処理に失敗しました: {e}")
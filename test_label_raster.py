@@ -0,0 +1,60 @@
+import shutil
+import sys
+from pathlib import Path
+
+# src をPythonのパスに追加
+sys.path.insert(0, str(Path(__file__).resolve().parent / "src"))
+
+from attendance_app.label_raster import (
+    GOLDEN_DIR, GOLDEN_FONT, GOLDEN_SAMPLES, _golden_name, build_job, check_golden, packbits
+)
+
+
+def _unpackbits(data: bytes) -> bytes:
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        n = data[i]
+        if n < 128:
+            out += data[i + 1:i + 2 + n]
+            i += n + 2
+        else:
+            out += data[i + 1:i + 2] * (257 - n)
+            i += 2
+    return bytes(out)
+
+
+def test_golden_fixtures_are_committed():
+    """見本のフォントとすべての見本のファイルがリポジトリにある"""
+    assert (GOLDEN_DIR / GOLDEN_FONT).exists()
+    missing = [_golden_name(student_id, tape_mm) for student_id, _, tape_mm in GOLDEN_SAMPLES
+               if not (GOLDEN_DIR / _golden_name(student_id, tape_mm)).exists()]
+    assert not missing, f"見本のファイルがありません: {missing}"
+
+
+def test_build_job_matches_golden():
+    """見本のラベルのコマンド列が保存済みのファイルとバイト単位で一致する"""
+    for student_id, name, tape_mm in GOLDEN_SAMPLES:
+        path = GOLDEN_DIR / _golden_name(student_id, tape_mm)
+        data = build_job([(student_id, name)], tape_mm, font_path=GOLDEN_DIR / GOLDEN_FONT)
+        assert data == path.read_bytes(), f"{path.name} と一致しません"
+
+
+def test_check_golden_fails_without_fixtures(tmp_path):
+    """見本のファイルがなければ作らずに失敗として数える"""
+    shutil.copy(GOLDEN_DIR / GOLDEN_FONT, tmp_path / GOLDEN_FONT)
+    assert check_golden(tmp_path) == len(GOLDEN_SAMPLES)
+    assert not list(tmp_path.glob("*.bin"))
+
+
+def test_packbits_round_trip():
+    """PackBits で圧縮したラスター行を展開すると元に戻る"""
+    for line in (bytes(16), b"\xff" * 16, bytes(range(16)), b"\x00\x00\x01\x02\x02\x02" + bytes(10)):
+        assert _unpackbits(packbits(line)) == line
+
+
+if __name__ == "__main__":
+    test_golden_fixtures_are_committed()
+    test_build_job_matches_golden()
+    test_packbits_round_trip()
+    print("OK")
@@ -0,0 +1,73 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+# src をPythonのパスに追加
+sys.path.insert(0, str(Path(__file__).resolve().parent / "src"))
+
+from attendance_app.task_scheduler import TaskScheduler
+
+TASK_SECONDS = 0.5
+
+
+def _run_sleepers(scheduler: TaskScheduler, count: int) -> float:
+    """count 個の TASK_SECONDS 秒のタスクを続けて投入し、すべて終わるまでの秒数を返す"""
+    started = time.monotonic()
+    handles = [scheduler.submit("io", time.sleep, TASK_SECONDS) for _ in range(count)]
+    for handle in handles:
+        handle.result(timeout=10)
+    return time.monotonic() - started
+
+
+def test_tasks_run_concurrently():
+    """上限までのタスクは並行して実行される"""
+    scheduler = TaskScheduler({"io": 4})
+    try:
+        elapsed = _run_sleepers(scheduler, 4)
+        assert elapsed < TASK_SECONDS * 2, f"4件が並行に実行されていません（{elapsed:.2f}秒）"
+    finally:
+        scheduler.shutdown()
+
+
+def test_idle_worker_does_not_serialize_burst():
+    """待機中のワーカーが1つあっても、続けて投入したタスクは新しいワーカーで並行に実行される"""
+    scheduler = TaskScheduler({"io": 4})
+    try:
+        scheduler.submit("io", lambda: None).result(timeout=10)  # ワーカーを1つ作って待機させる
+        time.sleep(0.05)
+        elapsed = _run_sleepers(scheduler, 4)
+        assert elapsed < TASK_SECONDS * 2, f"続けて投入したタスクが順に実行されました（{elapsed:.2f}秒）"
+        assert scheduler.metrics()["io"]["workers"] == 4
+    finally:
+        scheduler.shutdown()
+
+
+def test_max_workers_is_respected():
+    """同時に実行されるタスクはプールの上限を超えない"""
+    scheduler = TaskScheduler({"io": 2})
+    lock = threading.Lock()
+    running = peak = 0
+
+    def task():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.1)
+        with lock:
+            running -= 1
+
+    try:
+        for handle in [scheduler.submit("io", task) for _ in range(6)]:
+            handle.result(timeout=10)
+        assert peak == 2
+    finally:
+        scheduler.shutdown()
+
+
+if __name__ == "__main__":
+    test_tasks_run_concurrently()
+    test_idle_worker_does_not_serialize_burst()
+    test_max_workers_is_respected()
+    print("OK")